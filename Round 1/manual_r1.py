@@ -0,0 +1,97 @@
+"""
+Optimal bids of the manual reserve-price round, for any number of bids.
+
+Every fish has a reserve price x drawn from a discrete distribution and is
+sold to the first of our bids b_1 < b_2 < ... < b_m above it, then resold at
+VALUE. The expected profit is
+
+    sum_k (VALUE - b_k) * (F(b_k) - F(b_{k-1})),   F(b) = P(x < b), F(b_0) = 0
+
+F is a prefix sum of the distribution, and the best bids come from the DP
+
+    best[k][j] = max_{i < j} best[k - 1][i] + (VALUE - b_j) * (F(b_j) - F(b_i))
+
+in O(m * n^2) vectorized over the n candidate bids, instead of recomputing F
+inside the loop over bid pairs as manual_r1.cpp does.
+
+Usage: python manual_r1.py [--bids 2] [--distribution file.csv]
+where the csv has one "reserve price,probability" row per price.
+"""
+import argparse
+import csv
+
+import numpy as np
+
+VALUE = 1000
+
+# Reserve price density of the round: a * x + b for x in [900, 1000)
+A = 0.0002
+B = -0.18
+LOW = 900
+HIGH = 1000
+
+
+def linear_distribution(a: float = A, b: float = B, low: int = LOW, high: int = HIGH):
+    """
+    Returns (prices, probabilities) of the linear density of the round.
+    """
+    prices = np.arange(low, high)
+    return prices, a * prices + b
+
+
+def read_distribution(path: str):
+    with open(path) as file:
+        rows = [row for row in csv.reader(file) if row]
+    prices = np.array([float(row[0]) for row in rows])
+    probabilities = np.array([float(row[1]) for row in rows])
+    order = np.argsort(prices)
+    return prices[order], probabilities[order]
+
+
+def optimal_bids(prices, probabilities, bids: int = 2, value: float = VALUE):
+    """
+    Returns (expected profit, [bids]) of the best strictly increasing bids.
+    Candidate bids are every price of the distribution and the price just above the last.
+    """
+    prices = np.asarray(prices, dtype=float)
+    candidates = np.append(prices, prices[-1] + 1)
+    # F[j] = P(x < candidates[j])
+    cdf = np.concatenate([[0.0], np.cumsum(probabilities)])
+    margin = value - candidates
+    n = len(candidates)
+
+    best = margin * cdf
+    choice = [np.full(n, -1)]
+    earlier = np.tri(n, k=-1, dtype=bool)
+    for _ in range(1, bids):
+        # total[j, i] = best[i] + margin[j] * (cdf[j] - cdf[i]) for i < j
+        total = best[None, :] + margin[:, None] * (cdf[:, None] - cdf[None, :])
+        total = np.where(earlier, total, -np.inf)
+        previous = total.argmax(axis=1)
+        best = total[np.arange(n), previous]
+        choice.append(previous)
+
+    last = int(np.argmax(best))
+    profit = float(best[last])
+    path = [last]
+    for previous in reversed(choice[1:]):
+        path.append(int(previous[path[-1]]))
+    return profit, [float(candidates[j]) for j in reversed(path)]
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Best bids of the reserve-price round")
+    parser.add_argument("--bids", type=int, default=2, help="number of bids")
+    parser.add_argument("--value", type=float, default=VALUE, help="resale price")
+    parser.add_argument("--distribution", help="csv of reserve price, probability")
+    args = parser.parse_args()
+
+    prices, probabilities = read_distribution(args.distribution) if args.distribution else linear_distribution()
+    print(f"Total probability {np.sum(probabilities):.4f}")
+    for bids in range(1, args.bids + 1):
+        profit, chosen = optimal_bids(prices, probabilities, bids, args.value)
+        print(f"{bids} bids: {profit:.4f} {' '.join(f'{bid:g}' for bid in chosen)}")
+
+
+if __name__ == "__main__":
+    main()
@@ -1,4 +1,4 @@
-from statistics import linear_regression
+from collections import deque
 from typing import Dict, List
 from datamodel import OrderDepth, TradingState, Order
 
@@ -20,6 +20,114 @@ DEFAULT_PRICES = {
 }
 
 
+REGRESSION_WINDOW = 100
+
+
+class RollingRegression:
+    """
+    Ordinary least squares of price on timestamp over the last `window`
+    points, updated in O(1) by keeping the sums of x, y, xy, x^2 and y^2.
+    x and y are taken relative to an origin at the centre of the window,
+    so that the sums stay small and sxx does not cancel out. The origin
+    is moved, and the sums recomputed from the points, once every `window`
+    evictions, which keeps it within the current window at an amortized
+    O(1) cost. A timestamp going back (a new day) starts over.
+    """
+
+    def __init__(self, window: int) -> None:
+        self.window = window
+        self.reset()
+
+    def reset(self):
+        self.points = deque()
+        self.origin = None
+        self.evicted = 0
+        self.sum_x = 0.0
+        self.sum_y = 0.0
+        self.sum_xy = 0.0
+        self.sum_xx = 0.0
+        self.sum_yy = 0.0
+
+    def rebase(self):
+        """
+        Moves the origin to the mean of the points and recomputes the sums.
+        """
+        n = len(self.points)
+        self.origin = (sum(t for t, _ in self.points) / n, sum(p for _, p in self.points) / n)
+        self.evicted = 0
+        self.sum_x = self.sum_y = self.sum_xy = self.sum_xx = self.sum_yy = 0.0
+        for timestamp, price in self.points:
+            x = timestamp - self.origin[0]
+            y = price - self.origin[1]
+            self.sum_x += x
+            self.sum_y += y
+            self.sum_xy += x * y
+            self.sum_xx += x * x
+            self.sum_yy += y * y
+
+    def update(self, timestamp, price):
+        if self.points and timestamp < self.points[-1][0]:
+            self.reset()
+        if self.origin is None:
+            self.origin = (timestamp, price)
+        x = timestamp - self.origin[0]
+        y = price - self.origin[1]
+
+        self.points.append((timestamp, price))
+        self.sum_x += x
+        self.sum_y += y
+        self.sum_xy += x * y
+        self.sum_xx += x * x
+        self.sum_yy += y * y
+
+        if len(self.points) > self.window:
+            timestamp, price = self.points.popleft()
+            x = timestamp - self.origin[0]
+            y = price - self.origin[1]
+            self.sum_x -= x
+            self.sum_y -= y
+            self.sum_xy -= x * y
+            self.sum_xx -= x * x
+            self.sum_yy -= y * y
+            self.evicted += 1
+            if self.evicted >= self.window:
+                self.rebase()
+
+    def ready(self):
+        return len(self.points) >= 3
+
+    def fit(self):
+        """
+        Returns slope, intercept (in the shifted coordinates), residual std,
+        mean of x and the x sum of squares.
+        """
+        n = len(self.points)
+        mean_x = self.sum_x / n
+        mean_y = self.sum_y / n
+        sxx = self.sum_xx - n * mean_x * mean_x
+        sxy = self.sum_xy - n * mean_x * mean_y
+        syy = self.sum_yy - n * mean_y * mean_y
+
+        slope = sxy / sxx if sxx > 0 else 0.0
+        intercept = mean_y - slope * mean_x
+        sse = max(syy - slope * sxy, 0.0)
+        residual_std = math.sqrt(sse / (n - 2))
+        return slope, intercept, residual_std, mean_x, sxx
+
+    def predict(self, timestamp, z: float = 1.96):
+        """
+        Returns the fitted price at timestamp and the bounds of its prediction interval.
+        """
+        slope, intercept, residual_std, mean_x, sxx = self.fit()
+        x = timestamp - self.origin[0]
+        price = self.origin[1] + intercept + slope * x
+
+        n = len(self.points)
+        leverage = (x - mean_x) ** 2 / sxx if sxx > 0 else 0.0
+        half_width = z * residual_std * math.sqrt(1 + 1 / n + leverage)
+        return price, price - half_width, price + half_width
+
+
 class Trader:
 
     def __init__(self) -> None:
@@ -53,6 +161,8 @@ class Trader:
             STARFRUIT: 0,
         }
 
+        self.regression = RollingRegression(REGRESSION_WINDOW)
+
     # utils
 
     def get_position(self, product, state: TradingState):
@@ -173,9 +283,12 @@ class Trader:
         bid_volume = self.position_limit[STARFRUIT] - position_starfruit
         ask_volume = - self.position_limit[STARFRUIT] - position_starfruit
 
-        intercept = 5012
-        coeff = 5.016e-05
-        lin_reg_price = coeff * state.timestamp + intercept
+        if self.regression.ready():
+            lin_reg_price, lower, upper = self.regression.predict(
+                state.timestamp)
+            print(f"Regression interval: [{lower}, {upper}]")
+        else:
+            lin_reg_price = self.ema_prices[STARFRUIT]
 
         orders = []
         order_depth: OrderDepth = state.order_depths[STARFRUIT]
@@ -215,6 +328,8 @@ class Trader:
         self.round += 1
         pnl = self.update_pnl(state)
         self.update_ema_prices(state)
+        self.regression.update(
+            state.timestamp, self.get_mid_price(STARFRUIT, state))
 
         print(f"Log round {self.round}, timestamp {state.timestamp}")
 
@@ -0,0 +1,99 @@
+"""
+Best currency-arbitrage cycles of the manual round, without enumerating them.
+
+A trade from currency i to j multiplies the holding by rate[i][j], so the value
+of a path is a product of rates, i.e. a sum of log rates. best[h][v] keeps the
+k largest log values of paths of h trades from the start currency ending at
+v, with back pointers, and is built from best[h - 1] in O(n^2 * k) per hop.
+The top k cycles are the k best of best[h][start] over every h <= hops, so the
+whole search is O(hops * n^2 * k) instead of the n^hops of manual_r2.cpp.
+
+Trading a currency for itself is skipped by default: it has rate 1 and only
+produces copies of shorter paths.
+
+Usage: python manual_r2.py [--hops 5] [--top 10] [--amount 2000000] [--rates rates.csv]
+where rates.csv has the labels on its first row followed by the rate matrix.
+"""
+import argparse
+import csv
+from typing import List
+
+import numpy as np
+
+LABELS = ["Pizza", "Wasabi", "Snowball", "Shells"]
+RATES = [
+    [1, 0.48, 1.52, 0.71],
+    [2.05, 1, 3.26, 1.56],
+    [0.64, 0.3, 1, 0.46],
+    [1.41, 0.61, 2.08, 1],
+]
+START = "Shells"
+AMOUNT = 2_000_000
+HOPS = 5
+
+
+def best_cycles(rates, labels: List[str], start: str = START, hops: int = HOPS, top: int = 10,
+                allow_self: bool = False) -> List[tuple]:
+    """
+    Returns up to `top` (multiplier, path) of cycles from start back to start in
+    at most `hops` trades, best first and shortest first among equal ones.
+    """
+    with np.errstate(divide="ignore"):
+        log_rates = np.log(np.asarray(rates, dtype=float))
+    if not allow_self:
+        np.fill_diagonal(log_rates, -np.inf)
+    n = len(labels)
+    source = labels.index(start)
+
+    value = np.full((hops + 1, n, top), -np.inf)
+    prev_node = np.zeros((hops + 1, n, top), dtype=int)
+    prev_rank = np.zeros((hops + 1, n, top), dtype=int)
+    value[0, source, 0] = 0.0
+
+    for h in range(1, hops + 1):
+        # candidates[u, r, v]: rank r path to u extended with the trade u -> v
+        candidates = value[h - 1][:, :, None] + log_rates[:, None, :]
+        flat = candidates.reshape(n * top, n)
+        order = np.argsort(-flat, axis=0, kind="stable")[:top]
+        value[h] = np.take_along_axis(flat, order, axis=0).T
+        prev_node[h] = (order // top).T
+        prev_rank[h] = (order % top).T
+
+    # The k best cycles among every hop count, shorter first on ties
+    ends = [(value[h, source, r], h, r) for h in range(1, hops + 1) for r in range(top)
+            if np.isfinite(value[h, source, r])]
+    ends.sort(key=lambda end: (-round(end[0], 12), end[1]))
+
+    cycles = []
+    for log_value, h, r in ends[:top]:
+        path = [source]
+        node = source
+        for step in range(h, 0, -1):
+            node, r = prev_node[step, node, r], prev_rank[step, node, r]
+            path.append(node)
+        cycles.append((float(np.exp(log_value)), [labels[i] for i in reversed(path)]))
+    return cycles
+
+
+def read_rates(path: str):
+    with open(path) as file:
+        rows = [row for row in csv.reader(file) if row]
+    return [[float(x) for x in row] for row in rows[1:]], rows[0]
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Best arbitrage cycles of the manual round")
+    parser.add_argument("--hops", type=int, default=HOPS, help="maximum number of trades")
+    parser.add_argument("--top", type=int, default=10, help="number of cycles reported")
+    parser.add_argument("--amount", type=float, default=AMOUNT, help="starting amount")
+    parser.add_argument("--start", default=START, help="currency to start and end in")
+    parser.add_argument("--rates", help="csv file with labels then the rate matrix")
+    args = parser.parse_args()
+
+    rates, labels = read_rates(args.rates) if args.rates else (RATES, LABELS)
+    for multiplier, path in best_cycles(rates, labels, args.start, args.hops, args.top):
+        print(f"{' '.join(path)} {args.amount * multiplier:.5f} {(multiplier - 1) * 100:.5f}%")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,194 @@
+"""
+Expected payoff of every choice of up to three expeditions in the manual round.
+
+A block pays UNIT * mult / (hunt + percent), where percent is the share of
+players picking it. The second expedition costs 25000 and the third 75000
+more. Payoffs of all 2625 subsets of 1 to 3 blocks are computed in one
+vectorized pass as a (scenarios, subsets) array, so the crowd model can be
+anything returning percentages of shape (..., 25):
+
+    rank_normal_crowd   the curve of manual_r3.cpp: blocks ranked by
+                        mult / hunt get a floored normal density over ranks
+    noisy_crowd         the same curve with a random centre, width and total,
+                        for the Monte Carlo over crowd behaviour
+    equilibrium_crowd   the percentages reached by a population of players
+                        repeatedly moving towards the best subsets (logit
+                        response, or best response with a 1 / t step)
+
+Usage: python manual_r3.py [--scenarios 10000] [--seed 0] [--temperature 2000]
+"""
+import argparse
+import itertools
+import time
+
+import numpy as np
+
+UNIT = 7500
+
+# Extra fee of the 1st, 2nd and 3rd expedition
+FEES = [0, 25_000, 75_000]
+
+# (multiplier, hunters, position on the map)
+BLOCKS = [
+    (24, 2, "G26"), (70, 4, "G27"), (41, 3, "G28"), (21, 2, "G29"), (60, 4, "G30"),
+    (47, 3, "H26"), (82, 5, "H27"), (87, 5, "H28"), (80, 5, "H29"), (35, 3, "H30"),
+    (73, 4, "I26"), (89, 5, "I27"), (100, 8, "I28"), (90, 7, "I29"), (17, 2, "I30"),
+    (77, 5, "J26"), (83, 5, "J27"), (85, 5, "J28"), (79, 5, "J29"), (55, 4, "J30"),
+    (12, 2, "K26"), (27, 3, "K27"), (52, 4, "K28"), (15, 2, "K29"), (30, 3, "K30"),
+]
+MULT = np.array([block[0] for block in BLOCKS], dtype=float)
+HUNT = np.array([block[1] for block in BLOCKS], dtype=float)
+POS = [block[2] for block in BLOCKS]
+
+# Crowd curve of manual_r3.cpp
+MU = 24.0
+SIGMA = 6.0
+SCALE = 200.0
+
+
+def rank_normal_crowd(mult=MULT, hunt=HUNT, mu=MU, sigma=SIGMA, scale=SCALE) -> np.ndarray:
+    """
+    Returns the floored percentages when the block of rank r (by mult / hunt,
+    ascending) gets scale * N(r; mu, sigma). mu, sigma and scale may be arrays
+    of shape (n,) to get n crowds at once.
+    """
+    rank = np.empty(len(mult))
+    rank[np.argsort(mult / hunt, kind="stable")] = np.arange(len(mult))
+    mu, sigma, scale = (np.asarray(x, dtype=float)[..., None] for x in (mu, sigma, scale))
+    density = scale / (np.sqrt(2 * np.pi) * sigma) * np.exp(-(rank - mu) ** 2 / (2 * sigma ** 2))
+    return np.floor(density)
+
+
+def noisy_crowd(n: int, rng: np.random.Generator, mu_sd=3.0, sigma_range=(3.0, 10.0), scale_range=(100.0, 300.0)) -> np.ndarray:
+    """
+    Returns n crowds of shape (n, 25) around the rank_normal_crowd curve.
+    """
+    mu = rng.normal(MU, mu_sd, n)
+    sigma = rng.uniform(*sigma_range, n)
+    scale = rng.uniform(*scale_range, n)
+    return rank_normal_crowd(MULT, HUNT, mu, sigma, scale)
+
+
+def subsets(n: int = len(BLOCKS), max_size: int = 3):
+    """
+    Returns (index, size): index of shape (subsets, max_size) padded with n,
+    the position of a zero payoff column.
+    """
+    rows = []
+    for size in range(1, max_size + 1):
+        for combination in itertools.combinations(range(n), size):
+            rows.append(list(combination) + [n] * (max_size - size))
+    index = np.array(rows)
+    return index, (index < n).sum(axis=1)
+
+
+def payoffs(percent: np.ndarray, index: np.ndarray, size: np.ndarray, mult=MULT, hunt=HUNT) -> np.ndarray:
+    """
+    Returns net payoffs of shape (..., subsets) for percentages of shape (..., 25).
+    """
+    value = UNIT * mult / (hunt + percent)
+    value = np.concatenate([value, np.zeros(value.shape[:-1] + (1,))], axis=-1)
+    fees = np.cumsum(FEES)[size - 1]
+    return value[..., index].sum(axis=-1) - fees
+
+
+def membership(index: np.ndarray, n: int = len(BLOCKS)) -> np.ndarray:
+    """
+    Returns the (subsets, blocks) 0/1 matrix of the blocks in every subset.
+    """
+    matrix = np.zeros((len(index), n + 1))
+    np.put_along_axis(matrix, index, 1.0, axis=1)
+    return matrix[:, :n]
+
+
+def crowd_percent(shares: np.ndarray, matrix: np.ndarray, size: np.ndarray) -> np.ndarray:
+    """
+    Returns the percentage of all expeditions sent to each block when shares
+    of the players pick each subset, so that the percentages sum to 100.
+    """
+    return 100.0 * (shares @ matrix) / (shares @ size)
+
+
+def equilibrium_crowd(index: np.ndarray, size: np.ndarray, temperature: float = 2000.0, step: float = 0.1,
+                      iterations: int = 5000, tol: float = 1e-9):
+    """
+    Returns (percent, shares, iterations run) where percent is the share of
+    all expeditions sent to each block and shares the share of players
+    picking each subset. Every iteration moves the population a step
+    towards the logit response softmax(payoff / temperature) of the current
+    crowd; temperature 0 is best response with a decaying 1 / (t + 2) step
+    (fictitious play).
+    """
+    matrix = membership(index)
+    shares = np.full(len(index), 1.0 / len(index))
+    for t in range(iterations):
+        percent = crowd_percent(shares, matrix, size)
+        value = payoffs(percent, index, size)
+        if temperature > 0:
+            target = np.exp((value - value.max()) / temperature)
+            target /= target.sum()
+            rate = step
+        else:
+            target = np.zeros(len(index))
+            target[np.argmax(value)] = 1.0
+            rate = 1.0 / (t + 2)
+        update = (1 - rate) * shares + rate * target
+        change = np.abs(update - shares).max()
+        shares = update
+        if change < tol:
+            break
+    return crowd_percent(shares, matrix, size), shares, t + 1
+
+
+def describe(index_row) -> str:
+    return " ".join(f"({int(MULT[i])}, {int(HUNT[i])}, {POS[i]})" for i in index_row if i < len(BLOCKS))
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Expedition choice of the manual round")
+    parser.add_argument("--scenarios", type=int, default=10_000, help="Monte Carlo crowds")
+    parser.add_argument("--seed", type=int, default=0)
+    parser.add_argument("--top", type=int, default=10)
+    parser.add_argument("--temperature", type=float, default=2000.0, help="logit temperature, 0 for best response")
+    parser.add_argument("--iterations", type=int, default=5000, help="crowd dynamics iterations")
+    args = parser.parse_args()
+
+    index, size = subsets()
+
+    crowd = rank_normal_crowd()
+    value = payoffs(crowd, index, size)
+    best = np.argsort(-value, kind="stable")[:args.top]
+    print(f"Fixed crowd (sum of percentages {crowd.sum():.0f}):")
+    for i in best:
+        print(f"{value[i]:12.4f} {describe(index[i])}")
+
+    rng = np.random.default_rng(args.seed)
+    start = time.perf_counter()
+    values = payoffs(noisy_crowd(args.scenarios, rng), index, size)
+    elapsed = time.perf_counter() - start
+    mean = values.mean(axis=0)
+    p05 = np.percentile(values, 5, axis=0)
+    best_share = np.bincount(values.argmax(axis=1), minlength=len(index)) / args.scenarios
+
+    print(f"Monte Carlo over {args.scenarios} crowds ({args.scenarios / elapsed:.0f} scenarios/s):")
+    print(f"{'mean':>12} {'p05':>12} {'P(best)':>8}")
+    for i in np.argsort(-mean, kind="stable")[:args.top]:
+        print(f"{mean[i]:12.4f} {p05[i]:12.4f} {best_share[i]:8.3f} {describe(index[i])}")
+
+    start = time.perf_counter()
+    percent, shares, iterations = equilibrium_crowd(index, size, args.temperature, iterations=args.iterations)
+    elapsed = time.perf_counter() - start
+    value = payoffs(percent, index, size)
+    print(f"Crowd dynamics, temperature {args.temperature:g}: {iterations} iterations in {elapsed:.2f}s")
+    print("Percent of expeditions per block:")
+    for i in np.argsort(-percent, kind="stable"):
+        print(f"{percent[i]:8.2f} ({int(MULT[i])}, {int(HUNT[i])}, {POS[i]})")
+    print(f"{'share':>8} {'payoff':>12}")
+    for i in np.argsort(-shares, kind="stable")[:args.top]:
+        print(f"{shares[i]:8.4f} {value[i]:12.4f} {describe(index[i])}")
+    best = int(np.argmax(value))
+    print(f"Best response to the equilibrium crowd: {value[best]:.4f} {describe(index[best])}")
+
+
+if __name__ == "__main__":
+    main()
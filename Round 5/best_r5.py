@@ -1,9 +1,10 @@
 #
 from typing import Dict, List
-from datamodel import OrderDepth, TradingState, Order, UserId
+from datamodel import OrderDepth, TradingState, Order, UserId, ConversionObservation
 import numpy as np
-import pandas as pd
 import math
+import time
+from array import array
 
 # storing string as const to avoid typos
 SUBMISSION = "SUBMISSION"
@@ -62,6 +63,320 @@ COEF = {
     STRAWBERRIES: 6
 }
 
+# Dense ids of the products, indexing every per-product state vector
+PRODUCT_ID = {product: i for i, product in enumerate(PRODUCTS)}
+LIMIT_VECTOR = np.array([POSITION_LIMIT[product] for product in PRODUCTS])
+DEFAULT_PRICE_VECTOR = np.array([DEFAULT_PRICES[product] for product in PRODUCTS], dtype=float)
+
+
+SUNLIGHT_PER_HOUR = 2500
+HOURS_PER_TIMESTAMP = 12 / 1_000_000
+# Ideal humidity range for orchid production, in percent
+HUMIDITY_BAND = (60, 80)
+
+
+class OrchidFeatures:
+    """
+    Streaming sunlight/humidity/tariff features of ORCHIDS, O(1) per update.
+    Batch version and documentation in tools/orchid_features.py.
+    """
+
+    def __init__(self) -> None:
+        self.reset()
+
+    def reset(self):
+        self.first_timestamp = None
+        self.last_timestamp = None
+        self.last_fees = None
+        self.sunlight_sum = 0.0
+
+        self.elapsed_hours = 0.0
+        self.sunlight_hours = 0.0
+        self.sunlight_deficit = 0.0
+        self.humidity_excess = 0.0
+        self.hours_outside_band = 0.0
+        self.transport_fees_delta = 0.0
+        self.export_tariff_delta = 0.0
+        self.import_tariff_delta = 0.0
+
+    def update(self, timestamp, conversion: ConversionObservation):
+        if self.last_timestamp is not None and timestamp < self.last_timestamp:
+            self.reset()
+        if self.first_timestamp is None:
+            self.first_timestamp = timestamp
+            self.last_timestamp = timestamp
+
+        dt_hours = (timestamp - self.last_timestamp) * HOURS_PER_TIMESTAMP
+        self.last_timestamp = timestamp
+        self.elapsed_hours = (timestamp - self.first_timestamp) * HOURS_PER_TIMESTAMP
+
+        self.sunlight_sum += conversion.sunlight * dt_hours
+        self.sunlight_hours = self.sunlight_sum / SUNLIGHT_PER_HOUR
+        self.sunlight_deficit = self.elapsed_hours - self.sunlight_hours
+
+        low, high = HUMIDITY_BAND
+        self.humidity_excess = conversion.humidity - min(max(conversion.humidity, low), high)
+        if self.humidity_excess != 0:
+            self.hours_outside_band += dt_hours
+
+        fees = (conversion.transportFees, conversion.exportTariff, conversion.importTariff)
+        if self.last_fees is not None:
+            self.transport_fees_delta = fees[0] - self.last_fees[0]
+            self.export_tariff_delta = fees[1] - self.last_fees[1]
+            self.import_tariff_delta = fees[2] - self.last_fees[2]
+        self.last_fees = fees
+
+
+# Per unit forward edge (1000 timestamps) of traders with |t| >= 5,
+# from tools/counterparty.py
+INFORMED_TRADERS = {
+    AMETHYSTS: {"Vinnie": 3.2, "Valentina": 3.1, "Vladimir": 1.9, "Adam": -1.7, "Rhianna": -1.8, "Remy": -2.4, "Ruby": -3.2, "Amelia": -3.6},
+    STARFRUIT: {"Valentina": 2.6, "Vladimir": 1.9, "Remy": -2.4, "Ruby": -2.8, "Amelia": -3.1},
+    STRAWBERRIES: {"Vinnie": 0.4, "Remy": -0.5},
+}
+
+
+class InformedTraderSignal:
+    """
+    Follow the informed traders: every new market trade adds weight * quantity
+    (positive when the trader buys) to the signal of its symbol, which decays
+    every tick. A positive signal means informed flow is buying.
+    """
+
+    def __init__(self, weights, decay: float = 0.9) -> None:
+        self.weights = weights
+        self.decay = decay
+        self.signal = {symbol: 0.0 for symbol in weights}
+
+    def update(self, state: TradingState):
+        for symbol in self.signal:
+            flow = 0.0
+            weights = self.weights[symbol]
+            for trade in state.market_trades.get(symbol, []):
+                if trade.timestamp != state.timestamp - 100:
+                    # Trade was already analyzed
+                    continue
+                flow += weights.get(trade.buyer, 0) * trade.quantity
+                flow -= weights.get(trade.seller, 0) * trade.quantity
+            self.signal[symbol] = self.decay * self.signal[symbol] + flow
+
+    def get(self, symbol) -> float:
+        return self.signal.get(symbol, 0.0)
+
+
+# Avellaneda-Stoikov parameters: sigma is the volatility per tick, gamma the
+# risk aversion, k the decay of fill intensity with distance and horizon the
+# number of ticks inventory is expected to be held. Offsets never go below
+# min_offset so we never quote through the fair price.
+MM_PARAMS = {
+    # half spread ~1.5 so flat quotes are 10000 +- 2, skew 0.1 per unit
+    AMETHYSTS: {"sigma": 1.0, "gamma": 0.1, "k": 0.64, "horizon": 1, "min_offset": 1},
+    # half spread ~1.5, skew 0.125 per unit
+    STARFRUIT: {"sigma": 0.5, "gamma": 0.5, "k": 0.475, "horizon": 1, "min_offset": 1},
+}
+
+
+class QuoteTable:
+    """
+    Inventory skewed quotes of one product, precomputed for every position
+    so that quoting is a table lookup.
+
+        reservation = fair - position * gamma * sigma^2 * horizon
+        half_spread = gamma * sigma^2 * horizon / 2 + ln(1 + gamma / k) / gamma
+    """
+
+    def __init__(self, product, limit, sigma, gamma, k, horizon, min_offset) -> None:
+        self.product = product
+        self.limit = limit
+
+        half_spread = gamma * sigma**2 * horizon / 2 + math.log(1 + gamma / k) / gamma
+        skew = gamma * sigma**2 * horizon
+
+        self.bid_offsets = []
+        self.ask_offsets = []
+        self.bid_volumes = []
+        self.ask_volumes = []
+        for position in range(-limit, limit + 1):
+            self.bid_offsets.append(max(min_offset, half_spread + position * skew))
+            self.ask_offsets.append(max(min_offset, half_spread - position * skew))
+            self.bid_volumes.append(limit - position)
+            self.ask_volumes.append(- limit - position)
+
+    def quote(self, fair_price, position) -> List[Order]:
+        i = min(max(position, -self.limit), self.limit) + self.limit
+        return [
+            Order(self.product, math.floor(
+                fair_price - self.bid_offsets[i]), self.bid_volumes[i]),
+            Order(self.product, math.ceil(
+                fair_price + self.ask_offsets[i]), self.ask_volumes[i]),
+        ]
+
+
+# Longest rolling window used by the strategies
+SPREAD_HISTORY = 100
+
+
+class RollingSeries:
+    """
+    Last values of a series in a fixed size ring buffer, with the rolling mean
+    and sample std of pandas (NaN until the window is full) for any window up
+    to its capacity.
+    """
+
+    def __init__(self, capacity: int) -> None:
+        self.capacity = capacity
+        self.values = array("d", bytes(8 * capacity))
+        self.count = 0
+
+    def append(self, value: float) -> None:
+        self.values[self.count % self.capacity] = value
+        self.count += 1
+
+    def last(self, window: int) -> array:
+        end = self.count % self.capacity
+        if window <= end:
+            return self.values[end - window:end]
+        return self.values[end - window:] + self.values[:end]
+
+    def mean(self, window: int) -> float:
+        if self.count < window:
+            return np.nan
+        return np.float64(math.fsum(self.last(window)) / window)
+
+    def std(self, window: int) -> float:
+        if self.count < window:
+            return np.nan
+        values = self.last(window)
+        mean = math.fsum(values) / window
+        return np.float64(math.sqrt(math.fsum((x - mean) ** 2 for x in values) / (window - 1)))
+
+
+# The platform drops a tick whose run() takes longer than TICK_TIME_LIMIT seconds.
+# Once TIME_BUDGET_FRACTION of it is spent, the remaining strategies are degraded.
+TICK_TIME_LIMIT = 0.9
+TIME_BUDGET_FRACTION = 0.5
+
+
+def crosses(order: Order, order_depth: OrderDepth) -> bool:
+    """
+    Returns True if the order would trade against the book right away.
+    """
+    if order.quantity > 0:
+        return len(order_depth.sell_orders) != 0 and order.price >= min(order_depth.sell_orders)
+    return len(order_depth.buy_orders) != 0 and order.price <= max(order_depth.buy_orders)
+
+
+class Watchdog:
+    """
+    Time budget of one run() call. Strategies run in priority order; once the
+    budget is spent the remaining ones are skipped and their products get the
+    passive orders of the last tick, if the position did not change since
+    then. Cached orders that would cross the current book were priced off an
+    old book and signal, so they are dropped, and replayed orders are never
+    cached again.
+    """
+
+    def __init__(self, limit: float = TICK_TIME_LIMIT, fraction: float = TIME_BUDGET_FRACTION) -> None:
+        self.budget = limit * fraction
+        self.started = 0.0
+        self.degraded = False
+        self.degraded_ticks = 0
+        self.skipped: Dict[str, int] = {}
+        # product -> (position, orders) of the last tick the strategy ran
+        self.cache: Dict[str, tuple] = {}
+        # products given cached orders this tick
+        self.replayed = set()
+
+    def start(self):
+        self.started = time.perf_counter()
+        self.degraded = False
+        self.replayed = set()
+
+    def elapsed(self) -> float:
+        return time.perf_counter() - self.started
+
+    def over_budget(self) -> bool:
+        return self.elapsed() > self.budget
+
+    def degrade(self, name: str, products: List[str], state: TradingState, result: Dict[str, List[Order]]):
+        """
+        Fills result with the cached passive orders of a skipped strategy.
+        """
+        if not self.degraded:
+            self.degraded = True
+            self.degraded_ticks += 1
+        self.skipped[name] = self.skipped.get(name, 0) + 1
+        for product in products:
+            cached = self.cache.get(product)
+            if cached is None or cached[0] != state.position.get(product, 0) or product not in state.order_depths:
+                continue
+            order_depth = state.order_depths[product]
+            result[product] = [order for order in cached[1] if not crosses(order, order_depth)]
+            self.replayed.add(product)
+
+    def remember(self, state: TradingState, result: Dict[str, List[Order]]):
+        for product, orders in result.items():
+            if product not in self.replayed:
+                self.cache[product] = (state.position.get(product, 0), orders)
+
+
+def strategy(name: str, products: List[str], priority: int):
+    """
+    Registers a Trader method as a strategy owning products. Strategies run
+    by ascending priority and return {product: orders}.
+    """
+    def register(method):
+        method.strategy = (name, products, priority)
+        return method
+    return register
+
+
+class Strategy:
+    """
+    A registered strategy with its timing, error and conflict counters.
+    """
+
+    def __init__(self, name: str, products: List[str], priority: int, method) -> None:
+        self.name = name
+        self.products = products
+        self.priority = priority
+        self.method = method
+        self.runs = 0
+        self.errors = 0
+        self.conflicts = 0
+        self.total_time = 0.0
+        self.max_time = 0.0
+
+    def record(self, elapsed: float):
+        self.runs += 1
+        self.total_time += elapsed
+        self.max_time = max(self.max_time, elapsed)
+
+    def __str__(self) -> str:
+        mean = self.total_time / self.runs * 1e3 if self.runs else 0.0
+        return f"{self.name} {mean:.2f}/{self.max_time * 1e3:.2f}ms errors {self.errors} conflicts {self.conflicts}"
+
+
+def registered_strategies(trader) -> List[Strategy]:
+    """
+    Returns the strategies of a Trader instance by priority. Raises
+    ValueError if a product is owned by two of them.
+    """
+    strategies = []
+    for attribute in dir(type(trader)):
+        spec = getattr(getattr(type(trader), attribute), "strategy", None)
+        if spec is not None:
+            strategies.append(Strategy(*spec, getattr(trader, attribute)))
+    strategies.sort(key=lambda s: s.priority)
+
+    owner: Dict[str, str] = {}
+    for s in strategies:
+        for product in s.products:
+            if product in owner:
+                raise ValueError(f"{product} is owned by both the {owner[product]} and {s.name} strategies")
+            owner[product] = s.name
+    return strategies
+
 
 class Trader:
 
@@ -75,63 +390,84 @@ class Trader:
         self.cash = 0
         # positions can be obtained from state.position
 
-        # self.past_prices keeps the list of all past prices
-        self.past_prices = dict()
-        for product in PRODUCTS:
-            self.past_prices[product] = []
-
-        # self.ema_prices keeps an exponential moving average of prices
-        self.ema_prices = dict()
-        for product in PRODUCTS:
-            self.ema_prices[product] = None
+        # Per-product state, indexed by PRODUCT_ID
+        n = len(PRODUCTS)
+        # mid price of the current book, NaN if a side is empty
+        self.book_mids = np.full(n, np.nan)
+        # book mid, else the EMA, else the default price
+        self.mid_prices = DEFAULT_PRICE_VECTOR.copy()
+        # exponential moving average of the mid prices, NaN until the first tick
+        self.ema_prices = np.full(n, np.nan)
+        self.positions = np.zeros(n, dtype=np.int64)
+        self.limits = LIMIT_VECTOR
+        # volume that can still be bought / sold (negative) within the limits
+        self.bid_capacity = self.limits.copy()
+        self.ask_capacity = -self.limits
 
         self.ema_param = 0.06625
 
-        self.prices: Dict[str, pd.Series] = {
-            "GIFT_SPREAD": pd.Series(),
-            "COCONUT_SPREAD": pd.Series(),
+        self.prices: Dict[str, RollingSeries] = {
+            "GIFT_SPREAD": RollingSeries(SPREAD_HISTORY),
+            "COCONUT_SPREAD": RollingSeries(SPREAD_HISTORY),
         }
 
-    # utils
+        self.orchid_features = OrchidFeatures()
+        self.informed_signal = InformedTraderSignal(INFORMED_TRADERS)
 
-    def get_position(self, product, state: TradingState):
-        return state.position.get(product, 0)
-
-    def get_mid_price(self, product, state: TradingState):
-
-        default_price = self.ema_prices[product]
-        if default_price is None:
-            default_price = DEFAULT_PRICES[product]
+        self.quote_tables = {
+            product: QuoteTable(product, POSITION_LIMIT[product], **params)
+            for product, params in MM_PARAMS.items()
+        }
 
-        if product not in state.order_depths:
-            return default_price
+        self.watchdog = Watchdog()
+        self.strategies = registered_strategies(self)
 
-        market_bids = state.order_depths[product].buy_orders
-        if len(market_bids) == 0:
-            # There are no bid orders in the market (midprice undefined)
-            return default_price
+    # utils
 
-        market_asks = state.order_depths[product].sell_orders
-        if len(market_asks) == 0:
-            # There are no bid orders in the market (mid_price undefined)
-            return default_price
+    def get_position(self, product, state: TradingState):
+        return int(self.positions[PRODUCT_ID[product]])
 
-        best_bid = max(market_bids)
-        best_ask = min(market_asks)
-        return (best_bid + best_ask)/2
+    def get_mid_price(self, product, state: TradingState):
+        return self.mid_prices[PRODUCT_ID[product]]
 
     def get_value_on_product(self, product, state: TradingState):
         """
         Returns the amount of MONEY currently held on the product.
         """
-        return self.get_position(product, state) * self.get_mid_price(product, state)
+        i = PRODUCT_ID[product]
+        return self.positions[i] * self.mid_prices[i]
+
+    def update_book(self, state: TradingState):
+        """
+        Reads the mid price and position of every product into the state vectors.
+        """
+        self.book_mids.fill(np.nan)
+        for product, order_depth in state.order_depths.items():
+            i = PRODUCT_ID.get(product)
+            # The mid price is undefined when a side of the book is empty
+            if i is not None and order_depth.buy_orders and order_depth.sell_orders:
+                self.book_mids[i] = (max(order_depth.buy_orders) + min(order_depth.sell_orders))/2
+
+        self.positions.fill(0)
+        for product, position in state.position.items():
+            i = PRODUCT_ID.get(product)
+            if i is not None:
+                self.positions[i] = position
+        self.bid_capacity = self.limits - self.positions
+        self.ask_capacity = -self.limits - self.positions
+
+        self.update_mid_prices()
+
+    def update_mid_prices(self):
+        default_prices = np.where(np.isnan(self.ema_prices), DEFAULT_PRICE_VECTOR, self.ema_prices)
+        self.mid_prices[:] = np.where(np.isnan(self.book_mids), default_prices, self.book_mids)
 
     def update_pnl(self, state: TradingState):
         """
         Updates the pnl.
         """
         def update_cash():
-            conversion = state.observations.conversionObservations[ORCHIDS]
+            conversion = state.observations.conversionObservations.get(ORCHIDS)
             # Update cash
             for product in state.own_trades:
                 for trade in state.own_trades[product]:
@@ -140,7 +476,7 @@ class Trader:
                         continue
 
                     extra_cost = 0
-                    if product == ORCHIDS:
+                    if product == ORCHIDS and conversion is not None:
                         extra_cost = conversion.transportFees + conversion.importTariff
                     if trade.buyer == SUBMISSION:
                         self.cash -= trade.quantity * \
@@ -149,32 +485,20 @@ class Trader:
                         self.cash += trade.quantity * \
                             (trade.price - extra_cost)
 
-        def get_value_on_positions():
-            value = 0
-            for product in state.position:
-                value += self.get_value_on_product(product, state)
-            return value
-
         # Update cash
         update_cash()
-        return self.cash + get_value_on_positions()
+        return self.cash + float(self.positions @ self.mid_prices)
 
     def update_ema_prices(self, state: TradingState):
         """
         Update the exponential moving average of the prices of each product.
         """
 
-        for product in PRODUCTS:
-            mid_price = self.get_mid_price(product, state)
-            if mid_price is None:
-                continue
-
-            # Update ema price
-            if self.ema_prices[product] is None:
-                self.ema_prices[product] = mid_price
-            else:
-                self.ema_prices[product] = self.ema_param * mid_price + \
-                    (1-self.ema_param) * self.ema_prices[product]
+        self.ema_prices[:] = np.where(
+            np.isnan(self.ema_prices),
+            self.mid_prices,
+            self.ema_param * self.mid_prices + (1-self.ema_param) * self.ema_prices)
+        self.update_mid_prices()
 
     def update_spread(self, state: TradingState):
         price_choco = self.get_mid_price(CHOCOLATE, state)
@@ -183,81 +507,38 @@ class Trader:
         price_gift = self.get_mid_price(GIFT_BASKET, state)
 
         spread = price_gift - (price_choco*4 + price_straw*6 + price_roses)
-        self.prices["GIFT_SPREAD"] = pd.concat([
-            self.prices["GIFT_SPREAD"],
-            pd.Series({state.timestamp: spread})
-        ])
+        self.prices["GIFT_SPREAD"].append(spread)
 
         coco_spread = self.get_mid_price(
             COCONUT, state) - 2*self.get_mid_price(COCONUT_COUPON, state)
-        self.prices["COCONUT_SPREAD"] = pd.concat([
-            self.prices["COCONUT_SPREAD"],
-            pd.Series({state.timestamp: coco_spread})
-        ])
+        self.prices["COCONUT_SPREAD"].append(coco_spread)
     # Algorithm logic
 
+    @strategy("amethysts", [AMETHYSTS], priority=10)
     def amethysts_strategy(self, state: TradingState):
         """
         Returns a list of orders with trades of amethysts.
 
-        Comment: Mudar depois. Separar estrategia por produto assume que
-        cada produto eh tradado independentemente
+        Market making around the fixed fair price, skewed by inventory.
         """
 
         position_amethysts = self.get_position(AMETHYSTS, state)
 
-        bid_volume = POSITION_LIMIT[AMETHYSTS] - position_amethysts
-        ask_volume = - POSITION_LIMIT[AMETHYSTS] - position_amethysts
-
-        orders = []
-        orders.append(
-            Order(AMETHYSTS, DEFAULT_PRICES[AMETHYSTS] - 2, bid_volume))
-        orders.append(
-            Order(AMETHYSTS, DEFAULT_PRICES[AMETHYSTS] + 2, ask_volume))
-
-        return orders
+        return {AMETHYSTS: self.quote_tables[AMETHYSTS].quote(DEFAULT_PRICES[AMETHYSTS], position_amethysts)}
 
+    @strategy("starfruit", [STARFRUIT], priority=20)
     def starfruit_strategy(self, state: TradingState):
         """
         Returns a list of orders with trades of starfruit.
 
-        Comment: Mudar depois. Separar estrategia por produto assume que
-        cada produto eh tradado independentemente
+        Market making around the EMA price, skewed by inventory.
         """
 
         position_starfruit = self.get_position(STARFRUIT, state)
 
-        bid_volume = POSITION_LIMIT[STARFRUIT] - position_starfruit
-        ask_volume = - POSITION_LIMIT[STARFRUIT] - position_starfruit
-
-        orders = []
-        # orders.append(Order(STARFRUIT, math.floor(self.ema_prices[STARFRUIT] - 1), bid_volume))
-        # orders.append(Order(STARFRUIT, math.ceil(self.ema_prices[STARFRUIT] + 2), ask_volume))
-        if position_starfruit == 0:
-            # Not long nor short
-            orders.append(Order(STARFRUIT, math.floor(
-                self.ema_prices[STARFRUIT] - 1.5), bid_volume))
-            orders.append(Order(STARFRUIT, math.ceil(
-                self.ema_prices[STARFRUIT] + 1.5), ask_volume))
-
-        if position_starfruit > 0:
-            # Long position
-            bid_bonus = math.ceil(position_starfruit / 6.67) + 1
-            orders.append(Order(STARFRUIT, math.floor(
-                self.ema_prices[STARFRUIT] - bid_bonus), bid_volume))
-            orders.append(Order(STARFRUIT, math.ceil(
-                self.ema_prices[STARFRUIT] + 1), ask_volume))
-
-        if position_starfruit < 0:
-            # Short position
-            ask_bonus = math.ceil(position_starfruit / -6.67) + 1
-            orders.append(Order(STARFRUIT, math.floor(
-                self.ema_prices[STARFRUIT] - 1), bid_volume))
-            orders.append(Order(STARFRUIT, math.ceil(
-                self.ema_prices[STARFRUIT] + ask_bonus), ask_volume))
-
-        return orders
+        return {STARFRUIT: self.quote_tables[STARFRUIT].quote(self.ema_prices[PRODUCT_ID[STARFRUIT]], position_starfruit)}
 
+    @strategy("orchids", [ORCHIDS], priority=30)
     def orchids_strategy(self, state: TradingState):
         """
         Returns a list of orders with trades of orchids.
@@ -266,17 +547,20 @@ class Trader:
                 Buy: price increase by Import Tariff + shipping cost
         """
 
+        if ORCHIDS not in state.order_depths or ORCHIDS not in state.observations.conversionObservations:
+            return {}
+
         position_orchids = self.get_position(ORCHIDS, state)
 
-        bid_volume = POSITION_LIMIT[ORCHIDS] - position_orchids
-        ask_volume = - POSITION_LIMIT[ORCHIDS] - position_orchids
+        bid_volume = int(self.bid_capacity[PRODUCT_ID[ORCHIDS]])
+        ask_volume = int(self.ask_capacity[PRODUCT_ID[ORCHIDS]])
 
         order_depth: OrderDepth = state.order_depths[ORCHIDS]
         orders: List[Order] = []
         converse = state.observations.conversionObservations[ORCHIDS]
 
-        acceptable_bid_price = self.ema_prices[ORCHIDS]
-        acceptable_ask_price = self.ema_prices[ORCHIDS]
+        acceptable_bid_price = self.ema_prices[PRODUCT_ID[ORCHIDS]]
+        acceptable_ask_price = self.ema_prices[PRODUCT_ID[ORCHIDS]]
 
         if converse.bidPrice != None:
             if int(converse.bidPrice) > acceptable_ask_price:
@@ -302,8 +586,9 @@ class Trader:
             if int(best_bid) > acceptable_ask_price:
                 print("SELL", str(best_bid_amount) + "x", best_bid)
                 orders.append(Order(ORCHIDS, best_bid, -best_bid_amount))
-        return orders
+        return {ORCHIDS: orders}
 
+    @strategy("gift", [GIFT_BASKET, CHOCOLATE, ROSES, STRAWBERRIES], priority=40)
     def gift_strategy(self, state: TradingState):
         """
         Returns a list of orders with trades of gift baskets, chocolates, roses and strawberries.
@@ -321,19 +606,19 @@ class Trader:
         position_gift = self.get_position(GIFT_BASKET, state)
 
         WINDOW = 88
-        avg_spread = self.prices["GIFT_SPREAD"].rolling(WINDOW).mean().iloc[-1]
-        std_spread = self.prices["GIFT_SPREAD"].rolling(WINDOW).std().iloc[-1]
-        spread_5 = self.prices["GIFT_SPREAD"].rolling(8).mean().iloc[-1]
+        avg_spread = self.prices["GIFT_SPREAD"].mean(WINDOW)
+        std_spread = self.prices["GIFT_SPREAD"].std(WINDOW)
+        spread_5 = self.prices["GIFT_SPREAD"].mean(8)
 
         orders: Dict[str, list] = {
             GIFT_BASKET: [],
-            STRAWBERRIES: [],
             CHOCOLATE: [],
-            ROSES: []
+            ROSES: [],
+            STRAWBERRIES: []
         }
 
-        if np.isnan(avg_spread):
-            return orders[GIFT_BASKET], orders[CHOCOLATE], orders[ROSES], orders[STRAWBERRIES]
+        if np.isnan(avg_spread) or any(product not in state.order_depths for product in orders):
+            return orders
 
         z_score = (spread_5 - avg_spread)/std_spread
         print(f"Average spread: {avg_spread}, Spread5: {
@@ -382,8 +667,9 @@ class Trader:
             # sell gift
             sell(GIFT_BASKET)
 
-        return orders[GIFT_BASKET], orders[CHOCOLATE], orders[ROSES], orders[STRAWBERRIES]
+        return orders
 
+    @strategy("coconut", [COCONUT, COCONUT_COUPON], priority=50)
     def coconut_strategy(self, state: TradingState):
         """
         Returns a list of orders with trades of coconut.
@@ -407,14 +693,12 @@ class Trader:
         }
 
         WINDOW = 40
-        avg_spread = self.prices["COCONUT_SPREAD"].rolling(
-            WINDOW).mean().iloc[-1]
-        std_spread = self.prices["COCONUT_SPREAD"].rolling(
-            WINDOW).std().iloc[-1]
-        spread = self.prices["COCONUT_SPREAD"].rolling(4).mean().iloc[-1]
+        avg_spread = self.prices["COCONUT_SPREAD"].mean(WINDOW)
+        std_spread = self.prices["COCONUT_SPREAD"].std(WINDOW)
+        spread = self.prices["COCONUT_SPREAD"].mean(4)
 
-        if np.isnan(avg_spread):
-            return orders[COCONUT], orders[COCONUT_COUPON]
+        if np.isnan(avg_spread) or any(product not in state.order_depths for product in orders):
+            return orders
 
         z_score = (spread - avg_spread)/std_spread
         print(f"Average spread: {avg_spread}, Spread: {
@@ -466,17 +750,47 @@ class Trader:
             # coconut_orders.append(Order(COCONUT, coco_price, ask_volume))
             sell(COCONUT)
 
-        return orders[COCONUT], orders[COCONUT_COUPON]
+        return orders
+
+    def dispatch(self, strategy: Strategy, state: TradingState, result: Dict[str, List[Order]]):
+        """
+        Runs one strategy and adds its orders to result. Orders for a product
+        the strategy does not own, or that already has orders, are dropped.
+        Strategies return no orders for products without a book, so that
+        errors only count real faults.
+        """
+        start = time.perf_counter()
+        try:
+            orders = strategy.method(state)
+        except Exception as e:
+            strategy.errors += 1
+            print(f"Error in {strategy.name} strategy")
+            print(e)
+            orders = {}
+        strategy.record(time.perf_counter() - start)
+
+        for product, product_orders in orders.items():
+            if product not in strategy.products or product in result:
+                strategy.conflicts += 1
+                print(f"Conflict: {strategy.name} strategy orders for {product} dropped")
+                continue
+            result[product] = product_orders
 
     def run(self, state: TradingState):
         """
         Only method required. It takes all buy and sell orders for all symbols as an input,
         and outputs a list of orders to be sent
         """
+        self.watchdog.start()
         self.round += 1
+        self.update_book(state)
         pnl = self.update_pnl(state)
         self.update_ema_prices(state)
         self.update_spread(state)
+        conversion = state.observations.conversionObservations.get(ORCHIDS)
+        if conversion is not None:
+            self.orchid_features.update(state.timestamp, conversion)
+        self.informed_signal.update(state)
 
         print(f"Log round {self.round}")
 
@@ -489,58 +803,26 @@ class Trader:
         print(f"\tCash {self.cash}")
         for product in PRODUCTS:
             print(f"\tProduct {product}, Position {self.get_position(product, state)}, Midprice {self.get_mid_price(
-                product, state)}, Value {self.get_value_on_product(product, state)}, EMA {self.ema_prices[product]}")
+                product, state)}, Value {self.get_value_on_product(product, state)}, EMA {self.ema_prices[PRODUCT_ID[product]]}")
             print(f"\tPnL {pnl}")
+        print(f"\tOrchids sunlight deficit {self.orchid_features.sunlight_deficit}, Hours outside humidity band {
+              self.orchid_features.hours_outside_band}, Import tariff delta {self.orchid_features.import_tariff_delta}")
+        print(f"\tInformed flow {self.informed_signal.signal}")
+        print(f"\tDegraded ticks {self.watchdog.degraded_ticks}, Skipped {self.watchdog.skipped}")
+        print(f"\tStrategies {'; '.join(str(strategy) for strategy in self.strategies)}")
 
-            # Initialize the method output dict as an empty dict
+        # Initialize the method output dict as an empty dict
         result = {}
 
-        # AMETHYSTS STRATEGY
-        try:
-            result[AMETHYSTS] = self.amethysts_strategy(state)
-        except Exception as e:
-            print("Error in amethysts strategy")
-            print(e)
-
-        # STARFRUIT STRATEGY
-        try:
-            result[STARFRUIT] = self.starfruit_strategy(state)
-        except Exception as e:
-            print("Error in starfruit strategy")
-            print(e)
-
-        print("+---------------------------------+")
-
-        # ORCHIDS STRATEGY
-        try:
-            result[ORCHIDS] = self.orchids_strategy(state)
-        except Exception as e:
-            print("Error in orchids strategy")
-            print(e)
-
-        print("+---------------------------------+")
-
-        # GIFT_BASKET STRATEGY
-        try:
-            result[GIFT_BASKET], result[CHOCOLATE], result[ROSES], result[STRAWBERRIES] = self.gift_strategy(
-                state)
-        except Exception as e:
-            print("Error in gift strategy")
-            print(e)
-
-        print("+---------------------------------+")
-
-        # COCONUT STRATEGY
-        try:
-            result[COCONUT], result[COCONUT_COUPON] = self.coconut_strategy(
-                state)
-        except Exception as e:
-            print("Error in coconut strategy")
-            print(e)
-
-        print("+---------------------------------+")
+        for strategy in self.strategies:
+            if self.watchdog.over_budget():
+                self.watchdog.degrade(strategy.name, strategy.products, state, result)
+            else:
+                self.dispatch(strategy, state, result)
+            print("+---------------------------------+")
 
         # String value holding Trader state data required. It will be delivered as TradingState.traderData on next execution.
         traderData = "SAMPLE"
         conversions = 1
+        self.watchdog.remember(state, result)
         return result, conversions, traderData
@@ -2,8 +2,8 @@
 from typing import Dict, List
 from datamodel import OrderDepth, TradingState, Order, UserId
 import numpy as np
-import pandas as pd
 import math
+from array import array
 
 # storing string as const to avoid typos
 SUBMISSION = "SUBMISSION"
@@ -63,6 +63,45 @@ COEF = {
 }
 
 
+# Longest rolling window used by the strategies
+SPREAD_HISTORY = 100
+
+
+class RollingSeries:
+    """
+    Last values of a series in a fixed size ring buffer, with the rolling mean
+    and sample std of pandas (NaN until the window is full) for any window up
+    to its capacity.
+    """
+
+    def __init__(self, capacity: int) -> None:
+        self.capacity = capacity
+        self.values = array("d", bytes(8 * capacity))
+        self.count = 0
+
+    def append(self, value: float) -> None:
+        self.values[self.count % self.capacity] = value
+        self.count += 1
+
+    def last(self, window: int) -> array:
+        end = self.count % self.capacity
+        if window <= end:
+            return self.values[end - window:end]
+        return self.values[end - window:] + self.values[:end]
+
+    def mean(self, window: int) -> float:
+        if self.count < window:
+            return np.nan
+        return np.float64(math.fsum(self.last(window)) / window)
+
+    def std(self, window: int) -> float:
+        if self.count < window:
+            return np.nan
+        values = self.last(window)
+        mean = math.fsum(values) / window
+        return np.float64(math.sqrt(math.fsum((x - mean) ** 2 for x in values) / (window - 1)))
+
+
 class Trader:
 
     def __init__(self) -> None:
@@ -87,9 +126,9 @@ class Trader:
 
         self.ema_param = 0.06625
 
-        self.prices: Dict[str, pd.Series] = {
-            "GIFT_SPREAD": pd.Series(),
-            "COCONUT_SPREAD": pd.Series(),
+        self.prices: Dict[str, RollingSeries] = {
+            "GIFT_SPREAD": RollingSeries(SPREAD_HISTORY),
+            "COCONUT_SPREAD": RollingSeries(SPREAD_HISTORY),
         }
 
     # utils
@@ -183,17 +222,11 @@ class Trader:
         price_gift = self.get_mid_price(GIFT_BASKET, state)
 
         spread = price_gift - (price_choco*4 + price_straw*6 + price_roses)
-        self.prices["GIFT_SPREAD"] = pd.concat([
-            self.prices["GIFT_SPREAD"],
-            pd.Series({state.timestamp: spread})
-        ])
+        self.prices["GIFT_SPREAD"].append(spread)
 
         coco_spread = self.get_mid_price(
             COCONUT, state) - 2*self.get_mid_price(COCONUT_COUPON, state)
-        self.prices["COCONUT_SPREAD"] = pd.concat([
-            self.prices["COCONUT_SPREAD"],
-            pd.Series({state.timestamp: coco_spread})
-        ])
+        self.prices["COCONUT_SPREAD"].append(coco_spread)
     # Algorithm logic
 
     def amethysts_strategy(self, state: TradingState):
@@ -321,9 +354,9 @@ class Trader:
         position_gift = self.get_position(GIFT_BASKET, state)
 
         WINDOW = 88
-        avg_spread = self.prices["GIFT_SPREAD"].rolling(WINDOW).mean().iloc[-1]
-        std_spread = self.prices["GIFT_SPREAD"].rolling(WINDOW).std().iloc[-1]
-        spread_5 = self.prices["GIFT_SPREAD"].rolling(8).mean().iloc[-1]
+        avg_spread = self.prices["GIFT_SPREAD"].mean(WINDOW)
+        std_spread = self.prices["GIFT_SPREAD"].std(WINDOW)
+        spread_5 = self.prices["GIFT_SPREAD"].mean(8)
 
         orders: Dict[str, list] = {
             GIFT_BASKET: [],
@@ -407,11 +440,9 @@ class Trader:
         }
 
         WINDOW = 40
-        avg_spread = self.prices["COCONUT_SPREAD"].rolling(
-            WINDOW).mean().iloc[-1]
-        std_spread = self.prices["COCONUT_SPREAD"].rolling(
-            WINDOW).std().iloc[-1]
-        spread = self.prices["COCONUT_SPREAD"].rolling(4).mean().iloc[-1]
+        avg_spread = self.prices["COCONUT_SPREAD"].mean(WINDOW)
+        std_spread = self.prices["COCONUT_SPREAD"].std(WINDOW)
+        spread = self.prices["COCONUT_SPREAD"].mean(4)
 
         if np.isnan(avg_spread):
             return orders[COCONUT], orders[COCONUT_COUPON]
@@ -0,0 +1,69 @@
+import os
+import sys
+
+import numpy as np
+import pytest
+
+from backtest import Backtest, load_day, load_module, silenced
+from conftest import ROOT
+from data import prices_files
+from impact import DECAYS, MAX_LAG, ImpactModel, fit_kernel
+
+SHIPPED_TRADERS = [
+    os.path.join("Round 3", "best_r3.py"),
+    os.path.join("Round 4", "r4_only.py"),
+    os.path.join("Round 5", "best_r5.py"),
+]
+
+
+def exact_sums(permanent: float, temporary: float, decay: float, gram: np.ndarray):
+    """
+    Returns the response sums of mid moves that follow the impact model exactly.
+    """
+    kernel = decay ** np.arange(MAX_LAG)
+    volume_moves = permanent * gram[0, 0] + temporary * kernel * gram[0, 1]
+    flow_moves = permanent * gram[0, 1] + temporary * kernel * gram[1, 1]
+    return volume_moves, flow_moves, gram
+
+
+def test_fit_kernel_recovers_both_terms():
+    gram = np.array([[400.0, 150.0], [150.0, 90.0]])
+    decay = float(DECAYS[40])
+    permanent, temporary, fitted_decay = fit_kernel(*exact_sums(0.02, 0.5, decay, gram))
+    assert np.isclose(permanent, 0.02)
+    assert np.isclose(temporary, 0.5)
+    assert fitted_decay == decay
+
+
+def test_fit_kernel_refits_the_other_term_when_one_clips():
+    gram = np.array([[400.0, 150.0], [150.0, 90.0]])
+    decay = float(DECAYS[40])
+    volume_moves, flow_moves, _ = sums = exact_sums(-0.02, 0.5, decay, gram)
+    permanent, temporary, fitted_decay = fit_kernel(*sums)
+    assert permanent == 0.0
+    # The temporary term is refitted alone instead of kept at its joint value
+    kernel = fitted_decay ** np.arange(MAX_LAG)
+    weight = 1.0 / np.arange(1, MAX_LAG + 1)
+    assert np.isclose(temporary, (weight * kernel) @ flow_moves / (gram[1, 1] * (weight * kernel) @ kernel))
+
+
+@pytest.fixture(scope="module")
+def model():
+    return ImpactModel.fit()
+
+
+@pytest.mark.skipif(sys.version_info < (3, 12), reason="the Traders use the multi-line f-strings of Python 3.12")
+@pytest.mark.parametrize("trader_file", SHIPPED_TRADERS)
+def test_impact_never_raises_pnl(model, trader_file):
+    day = load_day(prices_files()[0])
+    with silenced():
+        module = load_module(os.path.join(ROOT, trader_file))
+    results = {}
+    for name, impact in (("no impact", None), ("impact", model)):
+        with silenced():
+            trader = module.Trader()
+        results[name] = Backtest(trader, day, impact=impact).run()
+    assert results["impact"].fills == results["no impact"].fills
+    for product, pnl in results["impact"].final_pnl.items():
+        assert pnl <= results["no impact"].final_pnl[product] + 1e-6
+    assert np.all(np.array(results["impact"].pnl_history) <= np.array(results["no impact"].pnl_history) + 1e-6)
@@ -0,0 +1,23 @@
+import os
+
+import numpy as np
+
+from backtest import load_module
+from conftest import ROOT
+
+manual_r3 = load_module(os.path.join(ROOT, "Round 3", "manual_r3.py"))
+
+
+def test_crowd_percent_sums_to_100():
+    index, size = manual_r3.subsets()
+    matrix = manual_r3.membership(index)
+    shares = np.random.default_rng(0).dirichlet(np.ones(len(index)))
+    assert np.isclose(manual_r3.crowd_percent(shares, matrix, size).sum(), 100.0)
+
+
+def test_equilibrium_crowd_sums_to_100():
+    index, size = manual_r3.subsets()
+    for temperature in (2000.0, 0.0):
+        percent, shares, _ = manual_r3.equilibrium_crowd(index, size, temperature, iterations=200)
+        assert np.isclose(shares.sum(), 1.0)
+        assert np.isclose(percent.sum(), 100.0)
@@ -0,0 +1,97 @@
+import json
+import os
+
+from backtest import Day, Tick, datamodel
+from conftest import ROOT
+from submission_log import iter_sandbox, iter_trades, logged_state, replay, section_offsets, write_log
+
+FIXTURE = os.path.join(ROOT, "tests", "data", "submission.log")
+TICKS = 30
+
+
+def fixture_day() -> Day:
+    """
+    A short synthetic day: a drifting two-level book per product and a
+    market trade every third tick.
+    """
+    ticks = []
+    for i in range(TICKS):
+        tick = Tick(i * 100)
+        for product, mid in (("AMETHYSTS", 10_000), ("STARFRUIT", 5_000 + i // 3)):
+            tick.depths[product] = ({mid - 2: 5, mid - 4: 10}, {mid + 2: -5, mid + 4: -10})
+            tick.mids[product] = float(mid)
+        if i % 3 == 0:
+            tick.trades["STARFRUIT"] = [(5_000 + i // 3 - 1, 2, "Ruby", "Vladimir")]
+        ticks.append(tick)
+    return Day(0, 0, ticks, ["AMETHYSTS", "STARFRUIT"])
+
+
+class Trader:
+    """
+    Crosses the AMETHYSTS spread in turns, quotes STARFRUIT passively and
+    prints strings that look like JSON.
+    """
+
+    def run(self, state):
+        print(f'tick {state.timestamp} {{"not": ["a", "record"]}} \\ "quoted" ünïcode')
+        print(f"traderData {state.traderData!r}")
+        book = state.order_depths["AMETHYSTS"]
+        orders = {"STARFRUIT": [datamodel.Order("STARFRUIT", max(state.order_depths["STARFRUIT"].buy_orders) + 1, 2)]}
+        turn = state.timestamp // 100 % 4
+        if turn == 0:
+            orders["AMETHYSTS"] = [datamodel.Order("AMETHYSTS", min(book.sell_orders), 3)]
+        elif turn == 2:
+            orders["AMETHYSTS"] = [datamodel.Order("AMETHYSTS", max(book.buy_orders), -3)]
+        return orders, 0, str(state.timestamp)
+
+
+class QuietTrader(Trader):
+
+    def run(self, state):
+        return {}, 0, ""
+
+
+def test_fixture_is_written_by_write_log(tmp_path):
+    path = tmp_path / "submission.log"
+    write_log(str(path), Trader(), fixture_day())
+    with open(FIXTURE, encoding="utf-8") as fixture:
+        assert path.read_text(encoding="utf-8") == fixture.read()
+
+
+def test_replay_round_trip():
+    report = replay(FIXTURE, Trader())
+    assert report["ticks"] == TICKS
+    assert report["log_mismatches"] == report["order_mismatches"] == report["errors"] == 0
+    assert report["divergences"] == []
+    assert report["final_position"]["STARFRUIT"] > 0
+
+
+def test_replay_reports_divergences():
+    report = replay(FIXTURE, QuietTrader())
+    assert report["log_mismatches"] == TICKS
+    assert report["order_mismatches"] > 0
+
+
+def test_records_cut_across_slices():
+    offsets = section_offsets(FIXTURE)
+    sandbox = list(iter_sandbox(FIXTURE, offsets))
+    trades = list(iter_trades(FIXTURE, offsets))
+    assert [entry["timestamp"] for entry in sandbox] == [i * 100 for i in range(TICKS)]
+    assert any(trade["buyer"] == "SUBMISSION" for trade in trades)
+    for chunk_size in (1, 7, 64):
+        assert list(iter_sandbox(FIXTURE, offsets, chunk_size)) == sandbox
+        assert list(iter_trades(FIXTURE, offsets, chunk_size)) == trades
+
+
+def test_logged_state():
+    conversion = [1097.5, 1098.5, 1.0, 9.0, -5.0, 2500.0, 70.0]
+    state = [100, "data", {}, {}, [], [], {}, [{}, {"ORCHIDS": conversion}]]
+    trader_data, observation = logged_state({"lambdaLog": json.dumps([state, [], 0, "", ""])})
+    assert trader_data == "data"
+    assert observation.conversionObservations["ORCHIDS"].sunlight == 2500.0
+    assert logged_state({"lambdaLog": "[not the Logger"}) is None
+    assert logged_state({"lambdaLog": "plain prints"}) is None
+
+
+if __name__ == "__main__":
+    write_log(FIXTURE, Trader(), fixture_day())
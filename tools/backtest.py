@@ -0,0 +1,458 @@
+"""
+Local replay of the data bottles through a Trader.
+
+A Day is decoded once into plain per-tick structures, so any number of Traders
+can be replayed against it without re-reading the csv files. Matching follows
+the platform rules as far as the bottles allow:
+
+    - all orders of a product are rejected if they could breach its position limit
+    - orders first trade against the book snapshot of the same tick, at the book price
+    - the rest trades against that tick's market trades priced at or through it, at the order price
+    - own trades and the tape are reported in state.own_trades and
+      state.market_trades on the next tick
+
+With an impact model (see impact.py), the Trader's fills cost more: the
+price moves its earlier fills caused are charged in cash (see impact.py for
+the permanent and temporary parts). The impact never shows in the books,
+tape, own trades and mids the Trader sees and is marked at, nor changes
+which orders fill, so the replay is the one without impact but for the cash
+and a strategy cannot profit from the moves it caused itself.
+
+Conversions are not simulated (the bottles do not carry the ORCHIDS conversion
+quotes next to a book).
+"""
+import contextlib
+import importlib.util
+import math
+import os
+import sys
+import time
+import warnings
+from typing import Dict, List
+
+import numpy as np
+import pandas as pd
+
+from data import ROOT, load_observations, load_prices, load_trades, parse_name, trades_files
+
+# Datamodel used to build the states; the latest one is a superset of the others
+DATAMODEL_DIR = os.path.join(ROOT, "Round 5")
+
+SUBMISSION = "SUBMISSION"
+
+# Trades of the trailing median a tape book is centred on, and the books and
+# conversion quotes built around the observed ORCHIDS price
+TAPE_WINDOW = 21
+ORCHIDS_HALF_SPREAD = 1
+ORCHIDS_VOLUME = 20
+CONVERSION_HALF_SPREAD = 0.5
+
+POSITION_LIMIT = {
+    "AMETHYSTS": 20,
+    "STARFRUIT": 20,
+    "ORCHIDS": 100,
+    "CHOCOLATE": 250,
+    "STRAWBERRIES": 350,
+    "ROSES": 60,
+    "GIFT_BASKET": 60,
+    "COCONUT": 300,
+    "COCONUT_COUPON": 600,
+}
+
+
+def load_module(path: str, name: str = None):
+    """
+    Imports a Trader file under its own module name, with the datamodel of
+    its own folder, so that files from different rounds can coexist.
+    """
+    path = os.path.abspath(path)
+    folder = os.path.dirname(path)
+    if name is None:
+        round_name = os.path.basename(folder).lower().replace(" ", "")
+        name = f"{round_name}_{os.path.splitext(os.path.basename(path))[0]}"
+
+    saved_datamodel = sys.modules.pop("datamodel", None)
+    sys.path.insert(0, folder)
+    try:
+        spec = importlib.util.spec_from_file_location(name, path)
+        module = importlib.util.module_from_spec(spec)
+        sys.modules[name] = module
+        spec.loader.exec_module(module)
+    finally:
+        sys.path.remove(folder)
+        sys.modules.pop("datamodel", None)
+        if saved_datamodel is not None:
+            sys.modules["datamodel"] = saved_datamodel
+    return module
+
+
+datamodel = load_module(os.path.join(DATAMODEL_DIR, "datamodel.py"), "bottle_datamodel")
+
+
+class Tick:
+    """
+    Everything the market shows at one timestamp, independent of the Trader.
+    """
+
+    def __init__(self, timestamp: int) -> None:
+        self.timestamp = timestamp
+        # product -> (buy_orders, sell_orders) as in OrderDepth
+        self.depths: Dict[str, tuple] = {}
+        # product -> mid price
+        self.mids: Dict[str, float] = {}
+        # symbol -> [(price, quantity, buyer, seller)]
+        self.trades: Dict[str, List[tuple]] = {}
+        self.observation = None
+
+
+class Day:
+    """
+    A decoded day of one data bottle.
+    """
+
+    def __init__(self, round: int, day: int, ticks: List[Tick], products: List[str]) -> None:
+        self.round = round
+        self.day = day
+        self.ticks = ticks
+        self.products = products
+
+    def __repr__(self) -> str:
+        return f"Day(round={self.round}, day={self.day}, ticks={len(self.ticks)})"
+
+
+def default_observation():
+    """
+    Neutral ORCHIDS conversion observation for days without observations.
+    """
+    return datamodel.Observation({}, {"ORCHIDS": datamodel.ConversionObservation(None, None, 0, 0, 0, 2500, 70)})
+
+
+def find_trades_file(round: int, day: int):
+    """
+    Returns the tape of a day, preferring the one with trader names.
+    """
+    candidates = [path for path in trades_files() if parse_name(path)["round"] == round and parse_name(path)["day"] == day]
+    candidates.sort(key=lambda path: not parse_name(path)["named"])
+    return candidates[0] if candidates else None
+
+
+def decode_day(prices, trades=None, round: int = 0, day: int = 0) -> Day:
+    """
+    Decodes price and trade DataFrames (as returned by data.load_*) into ticks.
+    """
+    timestamps = np.unique(prices["timestamp"].to_numpy())
+    ticks = {int(timestamp): Tick(int(timestamp)) for timestamp in timestamps}
+
+    columns = ["timestamp", "product", "mid_price"]
+    for side in ("bid", "ask"):
+        for level in (1, 2, 3):
+            columns += [f"{side}_price_{level}", f"{side}_volume_{level}"]
+    for row in prices[columns].itertuples(index=False):
+        tick = ticks[int(row.timestamp)]
+        buy_orders, sell_orders = {}, {}
+        for level in (1, 2, 3):
+            price = getattr(row, f"bid_price_{level}")
+            if not math.isnan(price):
+                buy_orders[int(price)] = int(getattr(row, f"bid_volume_{level}"))
+            price = getattr(row, f"ask_price_{level}")
+            if not math.isnan(price):
+                sell_orders[int(price)] = -int(getattr(row, f"ask_volume_{level}"))
+        tick.depths[row.product] = (buy_orders, sell_orders)
+        tick.mids[row.product] = float(row.mid_price)
+
+    if trades is not None:
+        for row in trades.itertuples(index=False):
+            tick = ticks.get(int(row.timestamp))
+            if tick is not None:
+                tick.trades.setdefault(row.symbol, []).append(
+                    (int(row.price), int(row.quantity), row.buyer, row.seller))
+
+    products = sorted(prices["product"].unique())
+    return Day(round, day, [ticks[int(timestamp)] for timestamp in timestamps], products)
+
+
+def load_day(prices_path: str, with_trades: bool = True) -> Day:
+    info = parse_name(prices_path)
+    trades = None
+    if with_trades:
+        trades_path = find_trades_file(info["round"], info["day"])
+        if trades_path is not None:
+            trades = load_trades(trades_path)
+    return decode_day(load_prices(prices_path), trades, info["round"], info["day"])
+
+
+def tape_books(trades: pd.DataFrame, timestamps: np.ndarray, window: int = TAPE_WINDOW) -> pd.DataFrame:
+    """
+    Returns one level books of every symbol of a tape at the given timestamps,
+    in the prices bottle columns, for days without order book snapshots.
+
+    Prints below the trailing median price of the last `window` trades are
+    taken as hits of the bid and prints above it as lifts of the ask. The
+    book of a tick holds the last print of each side with its quantity
+    (half the median distance of the prints away from it before the first one).
+    """
+    books = []
+    for symbol, tape in trades.groupby("symbol"):
+        price = tape["price"].to_numpy(dtype=float)
+        fair = tape["price"].rolling(window, min_periods=1).median().to_numpy()
+        half = max(float(np.median(np.abs(price - fair)[price != fair])) if (price != fair).any() else 1.0, 1.0)
+        times = tape["timestamp"].to_numpy()
+        sides = {}
+        for side, prints, default in (("bid", price < fair, np.floor(fair[0] - half)), ("ask", price > fair, np.ceil(fair[0] + half))):
+            last = np.searchsorted(times[prints], timestamps, side="right") - 1
+            sides[side] = (np.where(last >= 0, price[prints][np.maximum(last, 0)], default),
+                           np.where(last >= 0, tape["quantity"].to_numpy()[prints][np.maximum(last, 0)], 1))
+        ask, ask_volume = sides["ask"]
+        bid, bid_volume = sides["bid"]
+        bid = np.minimum(bid, ask - 1)
+        books.append(pd.DataFrame({"timestamp": timestamps, "product": symbol,
+                                   "bid_price_1": bid, "bid_volume_1": bid_volume,
+                                   "ask_price_1": ask, "ask_volume_1": ask_volume, "mid_price": (bid + ask) / 2}))
+    return pd.concat(books, ignore_index=True)
+
+
+def conversion_observations(observations: pd.DataFrame) -> Dict[int, object]:
+    """
+    Returns timestamp -> Observation of the rows of load_observations, with
+    conversion quotes CONVERSION_HALF_SPREAD around the ORCHIDS price.
+    """
+    return {int(row.timestamp): datamodel.Observation({}, {"ORCHIDS": datamodel.ConversionObservation(
+        row.ORCHIDS - CONVERSION_HALF_SPREAD, row.ORCHIDS + CONVERSION_HALF_SPREAD, row.TRANSPORT_FEES,
+        row.EXPORT_TARIFF, row.IMPORT_TARIFF, row.SUNLIGHT, row.HUMIDITY)})
+        for row in observations.itertuples(index=False)}
+
+
+def load_tape_day(trades_path: str, observations_path: str = None, step: int = 100) -> Day:
+    """
+    Returns a Day of the tape_books of a trades file, for the rounds whose
+    bottles only ship tapes. With a round 2 observations file, ORCHIDS get
+    a book around their observed price and the observations are passed to
+    the Trader, with conversion quotes around the same price.
+    """
+    info = parse_name(trades_path)
+    trades = load_trades(trades_path)
+    observations = load_observations(observations_path) if observations_path else None
+    last = trades["timestamp"].max() if observations is None else max(trades["timestamp"].max(), observations["timestamp"].max())
+    timestamps = np.arange(0, last + step, step)
+    prices = tape_books(trades, timestamps)
+    if observations is not None:
+        orchids = observations["ORCHIDS"].to_numpy(dtype=float)
+        prices = pd.concat([prices, pd.DataFrame({
+            "timestamp": observations["timestamp"].to_numpy(), "product": "ORCHIDS",
+            "bid_price_1": np.floor(orchids) - ORCHIDS_HALF_SPREAD, "bid_volume_1": ORCHIDS_VOLUME,
+            "ask_price_1": np.ceil(orchids) + ORCHIDS_HALF_SPREAD, "ask_volume_1": ORCHIDS_VOLUME,
+            "mid_price": orchids})], ignore_index=True)
+    for side in ("bid", "ask"):
+        for level in (2, 3):
+            prices[f"{side}_price_{level}"] = np.nan
+            prices[f"{side}_volume_{level}"] = np.nan
+    day = decode_day(prices.sort_values(["timestamp", "product"], kind="stable"), trades, info["round"], info["day"])
+
+    if observations is not None:
+        by_timestamp = conversion_observations(observations)
+        for tick in day.ticks:
+            tick.observation = by_timestamp.get(tick.timestamp)
+    return day
+
+
+class _Null:
+    """
+    Sink for the Traders' prints.
+    """
+
+    def write(self, text):
+        return len(text)
+
+    def flush(self):
+        pass
+
+
+@contextlib.contextmanager
+def silenced():
+    """
+    Swallows the Traders' prints and numpy warnings.
+    """
+    stdout = sys.stdout
+    sys.stdout = _Null()
+    try:
+        with warnings.catch_warnings():
+            warnings.simplefilter("ignore")
+            yield
+    finally:
+        sys.stdout = stdout
+
+
+class Result:
+
+    def __init__(self, products: List[str]) -> None:
+        self.cash = {product: 0.0 for product in products}
+        self.position = {product: 0 for product in products}
+        self.volume = {product: 0 for product in products}
+        self.final_pnl = {}
+        self.pnl_history = []
+        # {product: PnL} after every tick
+        self.product_pnl_history = []
+        # (timestamp, product, price, signed quantity) of every own trade
+        self.fills = []
+        self.latencies = []
+        self.errors = 0
+        self.last_error = None
+        self.rejected = 0
+
+    def pnl(self, mids: Dict[str, float]) -> Dict[str, float]:
+        return {product: self.cash[product] + self.position[product] * mids.get(product, 0.0) for product in self.cash}
+
+
+class Backtest:
+    """
+    Replays a Day through a Trader instance.
+    """
+
+    def __init__(self, trader, day: Day, position_limit: Dict[str, int] = POSITION_LIMIT, quiet: bool = True,
+                 impact=None) -> None:
+        self.trader = trader
+        self.day = day
+        self.position_limit = position_limit
+        self.quiet = quiet
+        self.impact = impact
+
+    def make_state(self, tick: Tick, trader_data: str, own_trades, market_trades, position) -> object:
+        order_depths = {}
+        for product, (buy_orders, sell_orders) in tick.depths.items():
+            depth = datamodel.OrderDepth()
+            depth.buy_orders = dict(buy_orders)
+            depth.sell_orders = dict(sell_orders)
+            order_depths[product] = depth
+        listings = {product: datamodel.Listing(product, product, "SEASHELLS") for product in tick.depths}
+        return datamodel.TradingState(
+            trader_data, tick.timestamp, listings, order_depths, own_trades, market_trades,
+            {product: quantity for product, quantity in position.items() if quantity != 0},
+            tick.observation or default_observation())
+
+    def match(self, tick: Tick, product: str, orders, result: Result) -> List[tuple]:
+        """
+        Fills orders of one product and returns [(price, quantity, aggressive)]
+        signed fills, aggressive for the ones taken from the book.
+        """
+        position = result.position.get(product, 0)
+        limit = self.position_limit.get(product, 0)
+        total_buy = sum(order.quantity for order in orders if order.quantity > 0)
+        total_sell = -sum(order.quantity for order in orders if order.quantity < 0)
+        if position + total_buy > limit or position - total_sell < -limit:
+            result.rejected += 1
+            return []
+
+        buy_orders, sell_orders = tick.depths.get(product, ({}, {}))
+        book_bids = dict(buy_orders)
+        book_asks = {price: -volume for price, volume in sell_orders.items()}
+        tape = [[price, quantity] for price, quantity, _, _ in tick.trades.get(product, [])]
+
+        fills = []
+        for order in orders:
+            remaining = abs(order.quantity)
+            side = 1 if order.quantity > 0 else -1
+            levels = sorted(book_asks) if side > 0 else sorted(book_bids, reverse=True)
+            book = book_asks if side > 0 else book_bids
+            for price in levels:
+                if remaining == 0 or (side > 0 and price > order.price) or (side < 0 and price < order.price):
+                    break
+                quantity = min(remaining, book[price])
+                if quantity > 0:
+                    fills.append((price, side * quantity, True))
+                    book[price] -= quantity
+                    remaining -= quantity
+            for trade in tape:
+                if remaining == 0:
+                    break
+                if (side > 0 and trade[0] <= order.price) or (side < 0 and trade[0] >= order.price):
+                    quantity = min(remaining, trade[1])
+                    if quantity > 0:
+                        fills.append((order.price, side * quantity, False))
+                        trade[1] -= quantity
+                        remaining -= quantity
+        return fills
+
+    def settle(self, tick: Tick, orders, result: Result):
+        """
+        Matches the orders of one tick and books the fills in result. Returns
+        (own trades of the tick, product -> quantity taken from the book).
+        """
+        own_trades, taken = {}, {}
+        for product, product_orders in (orders or {}).items():
+            for price, quantity, aggressive in self.match(tick, product, product_orders, result):
+                if aggressive:
+                    taken[product] = taken.get(product, 0) + quantity
+                result.position[product] = result.position.get(product, 0) + quantity
+                result.cash[product] = result.cash.get(product, 0.0) - price * quantity
+                result.volume[product] = result.volume.get(product, 0) + abs(quantity)
+                result.fills.append((tick.timestamp, product, price, quantity))
+                buyer, seller = (SUBMISSION, "") if quantity > 0 else ("", SUBMISSION)
+                own_trades.setdefault(product, []).append(
+                    datamodel.Trade(product, price, abs(quantity), buyer, seller, tick.timestamp))
+        return own_trades, taken
+
+    @staticmethod
+    def market_trades(tick: Tick):
+        return {
+            symbol: [datamodel.Trade(symbol, price, quantity, buyer, seller, tick.timestamp)
+                     for price, quantity, buyer, seller in trades]
+            for symbol, trades in tick.trades.items()
+        }
+
+    def run(self, max_ticks: int = None) -> Result:
+        result = Result(self.day.products)
+        trader_data = ""
+        own_trades = {}
+        market_trades = {}
+        ticks = self.day.ticks if max_ticks is None else self.day.ticks[:max_ticks]
+        mids = {}
+
+        # Signed price impact of our own fills: the permanent part so far, and
+        # the temporary part of every tick (with room past the end)
+        permanent = {product: 0.0 for product in self.day.products}
+        temporary = {product: np.zeros(len(ticks) + self.impact.horizon()) for product in self.day.products} if self.impact else {}
+
+        for t, tick in enumerate(ticks):
+            state = self.make_state(tick, trader_data, own_trades, market_trades, result.position)
+            with silenced() if self.quiet else contextlib.nullcontext():
+                start = time.perf_counter()
+                try:
+                    orders, _, trader_data = self.trader.run(state)
+                except Exception as e:
+                    orders = {}
+                    result.errors += 1
+                    result.last_error = e
+                result.latencies.append(time.perf_counter() - start)
+
+            before = dict(result.position)
+            own_trades, taken = self.settle(tick, orders, result)
+            if self.impact is not None:
+                for product in permanent:
+                    # Everything we trade moves the price for good, only what
+                    # we took from the book leaves a hole in it for a while.
+                    # The fills pay the move of the earlier ones and half of
+                    # their own, as if the price had walked along with them:
+                    # over the day that is permanent * position ** 2 / 2 >= 0
+                    traded = result.position.get(product, 0) - before.get(product, 0)
+                    if traded:
+                        shift, _ = self.impact.impact(product, traded)
+                        result.cash[product] -= (permanent[product] + shift / 2) * traded
+                        permanent[product] += shift
+                    quantity = taken.get(product)
+                    if quantity:
+                        # Taking again in the direction of the earlier takes pays
+                        # the part of the book that has not refilled yet
+                        result.cash[product] -= max(np.sign(quantity) * temporary[product][t], 0.0) * abs(quantity)
+                        _, kernel = self.impact.impact(product, quantity)
+                        if kernel is not None:
+                            temporary[product][t + 1:t + 1 + len(kernel)] += kernel
+
+            # The tape of this tick shows up in state.market_trades on the next one
+            market_trades = self.market_trades(tick)
+            mids.update(tick.mids)
+            pnl = result.pnl(mids)
+            result.product_pnl_history.append(pnl)
+            result.pnl_history.append(sum(pnl.values()))
+
+        result.final_pnl = result.pnl(mids)
+        return result
@@ -0,0 +1,202 @@
+"""
+Per-tick performance regression benchmark of each round's best Trader.
+
+Every benchmark replays a fixed slice of a data bottle through one Trader in
+a fresh process, so that import time and peak RSS are its own, and records
+the distribution of Trader.run latencies. Rounds 3 to 5 replay the round 3
+order books. Rounds 1 and 2 have no order book bottle, so their Traders
+replay books built from the round 1 tape (backtest.load_tape_day), round 2
+with the ORCHIDS observations as well; the round 3 products would leave them
+returning no orders at all. Results are compared with the
+stored baseline and the script exits with status 1 when a statistic
+regresses by more than the tolerance. Timings depend on the machine, so the
+baseline is kept out of git and is only ever written on request; without
+one the script exits with status 2.
+
+Usage:
+    python tools/benchmark.py                   # compare with the baseline
+    python tools/benchmark.py --save-baseline   # store the current results as baseline
+"""
+import argparse
+import json
+import multiprocessing
+import os
+import resource
+import subprocess
+import sys
+
+import numpy as np
+
+from backtest import Backtest, Day, load_day, load_module, load_tape_day, silenced
+from data import ROOT, parse_name
+
+BASELINE = os.path.join(os.path.dirname(os.path.abspath(__file__)), "bench_baseline.json")
+
+ROUND3_DAY0 = os.path.join("Round 3", "round-3-island-data-bottle", "prices_round_3_day_0.csv")
+ROUND1_TAPE_DAY0 = os.path.join("Round 5", "round-5-island-data-bottle", "trades_round_1_day_0_wn.csv")
+ROUND2_OBSERVATIONS_DAY0 = os.path.join("Round 2", "round-2-island-data-bottle", "prices_round_2_day_0.csv")
+
+# name -> (Trader file, data files, first tick, number of ticks). The data is
+# a prices file, or a trades file and optionally observations (see benchmark_day).
+BENCHMARKS = {
+    "r1": (os.path.join("Round 1", "best_r1.py"), (ROUND1_TAPE_DAY0,), 0, 2000),
+    "r2": (os.path.join("Round 2", "best_r2.py"), (ROUND1_TAPE_DAY0, ROUND2_OBSERVATIONS_DAY0), 0, 2000),
+    "r3": (os.path.join("Round 3", "best_r3.py"), (ROUND3_DAY0,), 0, 2000),
+    "r4": (os.path.join("Round 4", "r4_only.py"), (ROUND3_DAY0,), 0, 2000),
+    "r5": (os.path.join("Round 5", "best_r5.py"), (ROUND3_DAY0,), 0, 2000),
+}
+
+# Statistics compared with the baseline, with the relative increase tolerated
+# plus an absolute allowance since small timings are noisy.
+TOLERANCE = 0.25
+ALLOWANCE = {
+    "import_ms": 20,
+    "p50_ms": 0.05,
+    "p90_ms": 0.05,
+    "p99_ms": 0.05,
+    "peak_rss_mb": 5,
+}
+
+# Imports and builds a Trader in a bare interpreter, as the platform does on cold start
+COLD_START = """
+import importlib.util, json, resource, sys, time
+sys.path.insert(0, sys.argv[1])
+start = time.perf_counter()
+spec = importlib.util.spec_from_file_location("trader", sys.argv[2])
+module = importlib.util.module_from_spec(spec)
+spec.loader.exec_module(module)
+module.Trader()
+print(json.dumps([(time.perf_counter() - start) * 1e3, resource.getrusage(resource.RUSAGE_SELF).ru_maxrss]))
+"""
+
+
+def max_rss_mb(kilobytes_or_bytes) -> float:
+    # ru_maxrss is in kilobytes on Linux and bytes on macOS
+    return kilobytes_or_bytes / (1024**2 if sys.platform == "darwin" else 1024)
+
+
+def cold_start(trader_file: str):
+    """
+    Returns (import time in ms, peak RSS in MB) of a Trader in a fresh interpreter.
+    """
+    path = os.path.join(ROOT, trader_file)
+    output = subprocess.run(
+        [sys.executable, "-c", COLD_START, os.path.dirname(path), path],
+        capture_output=True, text=True, check=True).stdout
+    import_ms, rss = json.loads(output.strip().splitlines()[-1])
+    return import_ms, max_rss_mb(rss)
+
+
+def benchmark_day(files) -> Day:
+    """
+    Returns the Day of a prices file, or of the books built from a tape (and observations).
+    """
+    paths = [os.path.join(ROOT, path) for path in files]
+    if parse_name(paths[0])["kind"] == "trades":
+        return load_tape_day(*paths)
+    return load_day(paths[0])
+
+
+def run_benchmark(name: str) -> dict:
+    """
+    Runs one benchmark; meant to be called in a fresh process.
+    """
+    trader_file, files, start, count = BENCHMARKS[name]
+    day = benchmark_day(files)
+    day = Day(day.round, day.day, day.ticks[start:start + count], day.products)
+
+    with silenced():
+        module = load_module(os.path.join(ROOT, trader_file))
+        trader = module.Trader()
+    rss_before = max_rss_mb(resource.getrusage(resource.RUSAGE_SELF).ru_maxrss)
+
+    result = Backtest(trader, day).run()
+    latencies = np.array(result.latencies) * 1e3
+    rss_growth = max_rss_mb(resource.getrusage(resource.RUSAGE_SELF).ru_maxrss) - rss_before
+
+    import_ms, import_rss = cold_start(trader_file)
+    return {
+        "ticks": len(latencies),
+        "import_ms": import_ms,
+        "mean_ms": float(latencies.mean()),
+        "p50_ms": float(np.percentile(latencies, 50)),
+        "p90_ms": float(np.percentile(latencies, 90)),
+        "p99_ms": float(np.percentile(latencies, 99)),
+        "max_ms": float(latencies.max()),
+        # Peak of a bare interpreter holding the Trader, plus what the replay added
+        "peak_rss_mb": import_rss + rss_growth,
+        "errors": result.errors,
+    }
+
+
+def measure(name: str, repeat: int) -> dict:
+    """
+    Returns the best (lowest) of each statistic over `repeat` fresh processes.
+    """
+    context = multiprocessing.get_context("spawn")
+    runs = []
+    for _ in range(repeat):
+        with context.Pool(1) as pool:
+            runs.append(pool.apply(run_benchmark, (name,)))
+    return {key: min(run[key] for run in runs) for key in runs[0]}
+
+
+def regressions(current: dict, baseline: dict, tolerance: float = TOLERANCE) -> list:
+    """
+    Returns a description of every statistic worse than baseline beyond tolerance.
+    """
+    found = []
+    for name, stats in current.items():
+        if name not in baseline:
+            continue
+        for key, allowance in ALLOWANCE.items():
+            allowed = baseline[name][key] * (1 + tolerance) + allowance
+            if stats[key] > allowed:
+                found.append(f"{name} {key}: {stats[key]:.3f} > {allowed:.3f} (baseline {baseline[name][key]:.3f})")
+    return found
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Per-tick latency regression benchmark")
+    parser.add_argument("names", nargs="*", default=list(BENCHMARKS), help="benchmarks to run")
+    parser.add_argument("--save-baseline", action="store_true", help="store the results as baseline")
+    parser.add_argument("--repeat", type=int, default=3, help="runs per benchmark, best one is kept")
+    parser.add_argument("--tolerance", type=float, default=TOLERANCE)
+    parser.add_argument("--baseline", default=BASELINE)
+    args = parser.parse_args()
+
+    current = {}
+    for name in args.names:
+        current[name] = measure(name, args.repeat)
+        stats = current[name]
+        print(f"{name}: import {stats['import_ms']:.1f}ms, run p50 {stats['p50_ms']:.3f}ms p90 {stats['p90_ms']:.3f}ms "
+              f"p99 {stats['p99_ms']:.3f}ms max {stats['max_ms']:.3f}ms, peak RSS {stats['peak_rss_mb']:.0f}MB, errors {stats['errors']}")
+
+    baseline = {}
+    if os.path.exists(args.baseline):
+        with open(args.baseline) as file:
+            baseline = json.load(file)
+
+    if args.save_baseline:
+        baseline.update(current)
+        with open(args.baseline, "w") as file:
+            json.dump(baseline, file, indent=4, sort_keys=True)
+        print(f"Baseline written to {args.baseline}")
+        return
+    if not baseline:
+        print(f"No baseline at {args.baseline}, run with --save-baseline to store one")
+        sys.exit(2)
+
+    for name in current:
+        if name not in baseline:
+            print(f"{name}: no baseline, run with --save-baseline {name} to store one")
+    found = regressions(current, baseline, args.tolerance)
+    for line in found:
+        print("REGRESSION", line)
+    if found:
+        sys.exit(1)
+    print("No regression")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,235 @@
+"""
+PnL distribution of a Trader over block-bootstrapped days.
+
+The ticks of every historical day are pooled (in order, wrapping around) and
+new days are built by the stationary bootstrap of Politis and Romano: blocks
+of consecutive ticks start at uniform random positions and have geometric
+lengths of mean BLOCK_LENGTH, so the resampled series keeps the short-term
+dynamics the strategies trade on. Every tick keeps its whole cross-section of
+books and tape, so the basket spread stays where the data has it.
+
+By default every block is shifted by whole ticks so that each product's
+mid continues from the end of the previous block. Unanchored blocks
+(--no-anchor) jump to the price level of another day at every join, and the
+positions held across it show mark-to-market jumps no strategy caused,
+inflating the very PnL variance being estimated. Anchoring lets the basket
+spread drift away from its historical mean instead, which --no-anchor avoids
+at that cost.
+
+The days are decoded once in the parent. Workers are forked with them (or
+receive one pickled copy each where fork is unavailable) and only send back
+per-product final PnL and max drawdown, so hundreds of days run on every core.
+
+Usage: python tools/bootstrap.py <trader file> [--samples 200] [--block 1000] [--workers N] [--no-anchor]
+"""
+import argparse
+import multiprocessing
+import os
+import time
+from typing import Dict, List
+
+import numpy as np
+import pandas as pd
+
+from backtest import Backtest, Day, Tick, load_day, load_module, silenced
+from data import parse_name, prices_files
+
+BLOCK_LENGTH = 1000
+SAMPLES = 200
+TIMESTAMP_STEP = 100
+QUANTILES = [0.05, 0.25, 0.5, 0.75, 0.95]
+
+
+class TickPool:
+    """
+    The ticks of several days back to back, with their mids as an array.
+    """
+
+    def __init__(self, days: List[Day]) -> None:
+        self.ticks = [tick for day in days for tick in day.ticks]
+        self.products = sorted(set().union(*(day.products for day in days)))
+        self.round = days[0].round
+        self.day_length = max(len(day.ticks) for day in days)
+        self.mids = np.array([[tick.mids.get(product, np.nan) for product in self.products] for tick in self.ticks])
+        # Carry the last known mid over ticks where a product is missing
+        for column in self.mids.T:
+            missing = np.isnan(column)
+            if missing.any() and not missing.all():
+                last = np.where(~missing, np.arange(len(column)), 0)
+                np.maximum.accumulate(last, out=last)
+                column[:] = column[last]
+
+    def __len__(self) -> int:
+        return len(self.ticks)
+
+
+def block_indices(total: int, length: int, mean_block: float, rng: np.random.Generator):
+    """
+    Returns (index, block) of a stationary bootstrap sample of `length` ticks
+    out of a circular series of `total`: the source tick and the block number
+    of every resampled tick.
+    """
+    count = 2 * int(np.ceil(length / mean_block)) + 8
+    lengths = rng.geometric(1.0 / mean_block, count)
+    while lengths.sum() < length:
+        lengths = np.concatenate([lengths, rng.geometric(1.0 / mean_block, count)])
+    starts = rng.integers(0, total, len(lengths))
+    block = np.repeat(np.arange(len(lengths)), lengths)[:length]
+    first = np.cumsum(lengths) - lengths
+    offset = np.arange(length) - first[block]
+    return (starts[block] + offset) % total, block
+
+
+def anchor_shifts(mids: np.ndarray, index: np.ndarray, block: np.ndarray) -> np.ndarray:
+    """
+    Returns integer price shifts of shape (length, products) making every
+    product's mid continue across block boundaries to within half a tick.
+    """
+    path = mids[index]
+    jump = np.zeros_like(path)
+    joins = np.flatnonzero(np.diff(block)) + 1
+    jump[joins] = np.round(path[joins] - path[joins - 1])
+    return -np.cumsum(np.nan_to_num(jump), axis=0).astype(np.int64)
+
+
+def shifted_tick(tick: Tick, timestamp: int, shifts: Dict[str, int]) -> Tick:
+    new = Tick(timestamp)
+    new.observation = tick.observation
+    for product, (buy_orders, sell_orders) in tick.depths.items():
+        shift = shifts.get(product, 0)
+        new.depths[product] = ({price + shift: volume for price, volume in buy_orders.items()},
+                               {price + shift: volume for price, volume in sell_orders.items()})
+    new.mids = {product: mid + shifts.get(product, 0) for product, mid in tick.mids.items()}
+    new.trades = {symbol: [(price + shifts.get(symbol, 0), quantity, buyer, seller)
+                           for price, quantity, buyer, seller in trades]
+                  for symbol, trades in tick.trades.items()}
+    return new
+
+
+def resample_day(pool: TickPool, rng: np.random.Generator, mean_block: float = BLOCK_LENGTH,
+                 length: int = None, anchor: bool = True, day: int = 0) -> Day:
+    """
+    Returns one bootstrapped Day. Ticks share the books of the pool unless
+    they are anchored; the Backtest copies books before matching against them.
+    """
+    length = length or pool.day_length
+    index, block = block_indices(len(pool), length, mean_block, rng)
+    ticks = []
+    if anchor:
+        shifts = anchor_shifts(pool.mids, index, block)
+        for t, i in enumerate(index):
+            ticks.append(shifted_tick(pool.ticks[i], t * TIMESTAMP_STEP, dict(zip(pool.products, shifts[t].tolist()))))
+    else:
+        for t, i in enumerate(index):
+            source = pool.ticks[i]
+            tick = Tick(t * TIMESTAMP_STEP)
+            tick.depths, tick.mids, tick.trades, tick.observation = source.depths, source.mids, source.trades, source.observation
+            ticks.append(tick)
+    return Day(pool.round, day, ticks, pool.products)
+
+
+def max_drawdown(pnl: np.ndarray) -> np.ndarray:
+    """
+    Returns the largest peak-to-trough fall along the first axis.
+    """
+    peak = np.maximum.accumulate(np.maximum(pnl, 0.0), axis=0)
+    return (peak - pnl).max(axis=0)
+
+
+# Worker state, set once per process by _init_worker
+_POOL = None
+_MODULE = None
+
+
+def _init_worker(pool: TickPool, trader_path: str):
+    global _POOL, _MODULE
+    _POOL = pool
+    with silenced():
+        _MODULE = load_module(trader_path)
+
+
+def _run_sample(task):
+    """
+    Returns (sample, final PnL, max drawdown, errors) with one value per pool
+    product, plus the total, for one resampled day.
+    """
+    sample, seed, mean_block, length, anchor = task
+    rng = np.random.default_rng([seed, sample])
+    day = resample_day(_POOL, rng, mean_block, length, anchor, sample)
+    with silenced():
+        trader = _MODULE.Trader()
+    result = Backtest(trader, day).run()
+    pnl = np.array([[history.get(product, 0.0) for product in _POOL.products] for history in result.product_pnl_history])
+    pnl = np.column_stack([pnl, pnl.sum(axis=1)])
+    return sample, pnl[-1], max_drawdown(pnl), result.errors
+
+
+def bootstrap(trader_path: str, days: List[Day], samples: int = SAMPLES, mean_block: float = BLOCK_LENGTH,
+              length: int = None, anchor: bool = True, seed: int = 0, workers: int = None):
+    """
+    Returns (final PnL, max drawdown, errors): arrays of shape (samples,
+    products + 1) with the total in the last column, and errors per sample.
+    Sample i only depends on (seed, i), whatever the number of workers.
+    """
+    pool = TickPool(days)
+    workers = workers or os.cpu_count() or 1
+    method = "fork" if "fork" in multiprocessing.get_all_start_methods() else "spawn"
+    context = multiprocessing.get_context(method)
+
+    final = np.zeros((samples, len(pool.products) + 1))
+    drawdown = np.zeros_like(final)
+    errors = np.zeros(samples, dtype=int)
+    tasks = [(sample, seed, mean_block, length, anchor) for sample in range(samples)]
+    with context.Pool(workers, initializer=_init_worker, initargs=(pool, trader_path)) as processes:
+        for sample, pnl, dd, count in processes.imap_unordered(_run_sample, tasks):
+            final[sample], drawdown[sample], errors[sample] = pnl, dd, count
+    return final, drawdown, errors
+
+
+def summary(final: np.ndarray, drawdown: np.ndarray, products: List[str]) -> pd.DataFrame:
+    """
+    Returns one row per product (and TOTAL) with the mean, spread and
+    quantiles of PnL, the probability of a loss and the max drawdown.
+    """
+    table = pd.DataFrame(index=products + ["TOTAL"])
+    table["mean"] = final.mean(axis=0)
+    table["std"] = final.std(axis=0)
+    for q, values in zip(QUANTILES, np.quantile(final, QUANTILES, axis=0)):
+        table[f"q{round(q * 100):02d}"] = values
+    table["p_loss"] = (final < 0).mean(axis=0)
+    table["dd_mean"] = drawdown.mean(axis=0)
+    table["dd_q95"] = np.quantile(drawdown, 0.95, axis=0)
+    # Products the Trader never touches are all zero
+    return table[(final != 0).any(axis=0) | (table.index == "TOTAL")]
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[1])
+    parser.add_argument("trader", help="Trader file")
+    parser.add_argument("--samples", type=int, default=SAMPLES, help="number of resampled days")
+    parser.add_argument("--block", type=float, default=BLOCK_LENGTH, help="mean block length in ticks")
+    parser.add_argument("--ticks", type=int, default=None, help="ticks per resampled day, as the data by default")
+    parser.add_argument("--round", type=int, default=None, help="round of the days pooled, the latest by default")
+    parser.add_argument("--anchor", action=argparse.BooleanOptionalAction, default=True,
+                        help="shift blocks to keep every mid continuous (default)")
+    parser.add_argument("--seed", type=int, default=0)
+    parser.add_argument("--workers", type=int, default=None, help="worker processes, one per core by default")
+    args = parser.parse_args()
+
+    files = prices_files()
+    round = args.round if args.round is not None else max(parse_name(path)["round"] for path in files)
+    days = [load_day(path) for path in files if parse_name(path)["round"] == round]
+    print(f"Pooling {', '.join(map(str, days))}")
+
+    start = time.perf_counter()
+    final, drawdown, errors = bootstrap(args.trader, days, args.samples, args.block, args.ticks,
+                                        args.anchor, args.seed, args.workers)
+    elapsed = time.perf_counter() - start
+    print(f"{args.samples} days in {elapsed:.1f}s ({args.samples / elapsed:.2f} days/s), "
+          f"{int(errors.sum())} Trader errors")
+    with pd.option_context("display.width", 250, "display.max_columns", None):
+        print(summary(final, drawdown, sorted(set().union(*(day.products for day in days)))).round(2))
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,188 @@
+"""
+Content-hashed on-disk cache for indicator arrays.
+
+Results are keyed on a hash of the function name and source, its input
+arrays (bytes, dtype and shape) and its parameters, so editing an indicator
+invalidates its results. They are stored as .npy files and returned
+memory-mapped. When the directory grows over its byte budget the least
+recently used files are deleted; a cache hit refreshes the file's mtime.
+The directory is created on first write, when temporary files left behind
+by crashed writers are swept as well.
+
+    cache = IndicatorCache()
+
+    @cache.cached
+    def ema(x, alpha): ...
+
+    ema(prices, alpha=0.06625)   # computed and stored
+    ema(prices, alpha=0.06625)   # memory-mapped from disk
+"""
+import functools
+import hashlib
+import inspect
+import os
+import tempfile
+import time
+
+import numpy as np
+
+from data import ROOT
+
+DEFAULT_DIRECTORY = os.environ.get(
+    "INDICATOR_CACHE_DIR", os.path.join(ROOT, ".cache", "indicators"))
+DEFAULT_BUDGET = int(os.environ.get("INDICATOR_CACHE_BYTES", 2 * 1024**3))
+
+# Temporary files older than this (seconds) belong to a writer that crashed
+STALE_TEMPORARY = 3600
+
+
+def source_hash(func) -> str:
+    """
+    Returns a short hash of func's source, or of its bytecode when the source
+    is unavailable.
+    """
+    try:
+        source = inspect.getsource(func).encode()
+    except (OSError, TypeError):
+        source = func.__code__.co_code
+    return hashlib.blake2b(source, digest_size=8).hexdigest()
+
+
+def hash_key(name: str, arrays, params) -> str:
+    """
+    Returns the hex digest identifying a call.
+    """
+    digest = hashlib.blake2b(digest_size=20)
+    digest.update(name.encode())
+    for array in arrays:
+        array = np.ascontiguousarray(array)
+        digest.update(f"{array.dtype.str}{array.shape}".encode())
+        digest.update(memoryview(array).cast("B"))
+    digest.update(repr(sorted(params.items())).encode())
+    return digest.hexdigest()
+
+
+class IndicatorCache:
+
+    def __init__(self, directory: str = DEFAULT_DIRECTORY, budget: int = DEFAULT_BUDGET) -> None:
+        self.directory = directory
+        self.budget = budget
+        self.hits = 0
+        self.misses = 0
+        self.opened = False
+
+    def open(self):
+        """
+        Creates the directory and sweeps stale temporary files, once.
+        """
+        if self.opened:
+            return
+        os.makedirs(self.directory, exist_ok=True)
+        cutoff = time.time() - STALE_TEMPORARY
+        with os.scandir(self.directory) as it:
+            for entry in it:
+                try:
+                    if entry.name.endswith(".tmp") and entry.stat().st_mtime < cutoff:
+                        os.remove(entry.path)
+                except FileNotFoundError:
+                    pass
+        self.opened = True
+
+    def path(self, key: str) -> str:
+        return os.path.join(self.directory, key + ".npy")
+
+    def get(self, key: str):
+        """
+        Returns the memory-mapped array stored under key, or None.
+        """
+        path = self.path(key)
+        try:
+            array = np.load(path, mmap_mode="r")
+            os.utime(path)
+        except (FileNotFoundError, ValueError):
+            # Missing, half written or evicted by another process meanwhile
+            return None
+        return array
+
+    def put(self, key: str, array: np.ndarray):
+        """
+        Stores array under key and returns it memory-mapped, or in memory if
+        another process evicted it meanwhile.
+        """
+        array = np.asarray(array)
+        self.open()
+        # Write to a temporary file first so that readers never see half an array
+        handle, temporary = tempfile.mkstemp(dir=self.directory, suffix=".tmp")
+        with os.fdopen(handle, "wb") as file:
+            np.save(file, array)
+        os.replace(temporary, self.path(key))
+        self.evict(keep=key)
+        try:
+            return np.load(self.path(key), mmap_mode="r")
+        except FileNotFoundError:
+            return array
+
+    def get_or_compute(self, name: str, func, arrays, params):
+        key = hash_key(name, arrays, params)
+        array = self.get(key)
+        if array is not None:
+            self.hits += 1
+            return array
+        self.misses += 1
+        return self.put(key, func(*arrays, **params))
+
+    def cached(self, func):
+        """
+        Decorator caching func(*arrays, **params). Positional arguments must be
+        arrays and the result a single array.
+        """
+        name = f"{func.__module__}.{func.__qualname__}.{source_hash(func)}"
+
+        @functools.wraps(func)
+        def wrapper(*arrays, **params):
+            return self.get_or_compute(name, func, arrays, params)
+        return wrapper
+
+    def entries(self):
+        """
+        Returns (mtime, size, path) of every cached array, oldest first.
+        """
+        entries = []
+        if not os.path.isdir(self.directory):
+            return entries
+        with os.scandir(self.directory) as it:
+            for entry in it:
+                if entry.name.endswith(".npy"):
+                    try:
+                        stat = entry.stat()
+                    except FileNotFoundError:
+                        continue
+                    entries.append((stat.st_mtime, stat.st_size, entry.path))
+        return sorted(entries)
+
+    def size(self) -> int:
+        return sum(size for _, size, _ in self.entries())
+
+    def evict(self, keep: str = None):
+        """
+        Deletes least recently used arrays until the cache fits its budget.
+        """
+        entries = self.entries()
+        total = sum(size for _, size, _ in entries)
+        for _, size, path in entries:
+            if total <= self.budget:
+                break
+            if keep is not None and path == self.path(keep):
+                continue
+            try:
+                os.remove(path)
+            except FileNotFoundError:
+                pass
+            total -= size
+
+    def clear(self):
+        for _, _, path in self.entries():
+            try:
+                os.remove(path)
+            except FileNotFoundError:
+                pass
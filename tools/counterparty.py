@@ -0,0 +1,237 @@
+"""
+Counterparty analytics over the named trade tapes (Round 5 bottle).
+
+Every trade is split into a buy leg for the buyer and a sell leg for the seller,
+giving a (trader, symbol, time) index. Each leg is then marked against the last
+traded price of the symbol some horizons later, which tells which traders are
+informed (their flow predicts the price) and which are noise.
+
+The ranking feeds INFORMED_TRADERS in Round 5/best_r5.py, where
+InformedTraderSignal turns state.market_trades into a per-tick signal.
+informed_signal() is its batch form over the tapes, and main() checks the
+streaming class (a copy of the one in best_r5.py) against it.
+
+Usage: python tools/counterparty.py [top]
+"""
+import sys
+from typing import List
+
+import numpy as np
+import pandas as pd
+
+from data import load_trades, trades_files
+
+# Horizons in timestamps, one tick being 100
+HORIZONS = [100, 500, 1_000, 5_000, 20_000]
+
+
+def load_tapes(named: bool = True) -> pd.DataFrame:
+    """
+    Returns all trade tapes concatenated, ordered by round, day and timestamp.
+    """
+    tapes = [load_trades(path) for path in trades_files(named)]
+    trades = pd.concat(tapes, ignore_index=True)
+    return trades.sort_values(["round", "day", "symbol", "timestamp"], kind="stable").reset_index(drop=True)
+
+
+def build_index(trades: pd.DataFrame, horizons: List[int] = HORIZONS) -> pd.DataFrame:
+    """
+    Returns one row per trade leg indexed by (trader, symbol, round, day, timestamp).
+
+    Columns: signed quantity, price and, for each horizon h, the forward edge
+    signed_quantity * (price at t + h - price) as seen by the trader.
+    """
+    trades = trades.reset_index(drop=True)
+    price = trades["price"].to_numpy(dtype=float)
+    timestamps = trades["timestamp"].to_numpy()
+
+    # Forward price: last trade of the same symbol at or before t + h
+    forward = {h: np.empty(len(trades)) for h in horizons}
+    for _, rows in trades.groupby(["round", "day", "symbol"], sort=False).indices.items():
+        ts = timestamps[rows]
+        px = price[rows]
+        for h in horizons:
+            forward[h][rows] = px[np.searchsorted(ts, ts + h, side="right") - 1]
+
+    legs = []
+    for trader_column, sign in (("buyer", 1), ("seller", -1)):
+        leg = pd.DataFrame({
+            "trader": trades[trader_column].to_numpy(),
+            "symbol": trades["symbol"].to_numpy(),
+            "round": trades["round"].to_numpy(),
+            "day": trades["day"].to_numpy(),
+            "timestamp": timestamps,
+            "quantity": sign * trades["quantity"].to_numpy(),
+            "price": price,
+        })
+        for h in horizons:
+            leg[f"edge_{h}"] = leg["quantity"] * (forward[h] - price)
+        legs.append(leg)
+
+    index = pd.concat(legs, ignore_index=True)
+    index = index[index["trader"] != ""]
+    return index.set_index(["trader", "symbol", "round", "day", "timestamp"]).sort_index()
+
+
+def rank_traders(index: pd.DataFrame, horizons: List[int] = HORIZONS, min_trades: int = 20) -> pd.DataFrame:
+    """
+    Returns per (trader, symbol) statistics for every horizon, sorted by how
+    significant the edge is at the longest horizon.
+
+        edge_h: total forward pnl of the trader's flow
+        per_unit_h: edge per unit traded
+        hit_h: share of legs with positive edge
+        t_h: t-statistic of the per-leg edge
+    """
+    edges = index[[f"edge_{h}" for h in horizons]]
+    grouped = edges.groupby(level=["trader", "symbol"])
+    stats = pd.DataFrame({
+        "trades": grouped.size(),
+        "volume": index["quantity"].abs().groupby(level=["trader", "symbol"]).sum(),
+    })
+    total, mean, std = grouped.sum(), grouped.mean(), grouped.std()
+    hits = (edges > 0).groupby(level=["trader", "symbol"]).mean()
+    for h in horizons:
+        column = f"edge_{h}"
+        stats[column] = total[column]
+        stats[f"per_unit_{h}"] = total[column] / stats["volume"]
+        stats[f"hit_{h}"] = hits[column]
+        stats[f"t_{h}"] = mean[column] / (std[column] / np.sqrt(stats["trades"]))
+
+    stats = stats[stats["trades"] >= min_trades]
+    return stats.sort_values(f"t_{horizons[-1]}", ascending=False)
+
+
+def informed_weights(ranking: pd.DataFrame, horizon: int = 1_000, min_t: float = 5.0):
+    """
+    Returns symbol -> {trader: per unit edge at horizon} of the traders whose
+    t-statistic at the longest horizon is at least min_t in absolute value,
+    the form of INFORMED_TRADERS.
+    """
+    t = ranking[f"t_{HORIZONS[-1]}"]
+    weights = {}
+    for (trader, symbol), edge in ranking.loc[t.abs() >= min_t, f"per_unit_{horizon}"].items():
+        weights.setdefault(symbol, {})[trader] = round(float(edge), 1)
+    return weights
+
+
+def informed_signal(trades: pd.DataFrame, weights, decay: float = 0.9, step: int = 100) -> pd.DataFrame:
+    """
+    Returns the signal of every weighted symbol at every tick of every day,
+    indexed by (round, day, timestamp): the flow of the trades of the
+    previous tick plus decay times the previous signal.
+    """
+    frames = []
+    for (round, day), tape in trades.groupby(["round", "day"], sort=True):
+        ticks = int(tape["timestamp"].max()) // step + 2
+        signal = {}
+        for symbol, symbol_weights in weights.items():
+            rows = tape[tape["symbol"] == symbol]
+            weight = (rows["buyer"].map(symbol_weights).fillna(0) - rows["seller"].map(symbol_weights).fillna(0)).to_numpy()
+            flow = np.zeros(ticks)
+            # A trade at t is first seen in the state of t + step
+            np.add.at(flow, rows["timestamp"].to_numpy() // step + 1, weight * rows["quantity"].to_numpy())
+            values = np.empty(ticks)
+            level = 0.0
+            for i, f in enumerate(flow):
+                level = decay * level + f
+                values[i] = level
+            signal[symbol] = values
+        index = pd.MultiIndex.from_product([[round], [day], np.arange(ticks) * step], names=["round", "day", "timestamp"])
+        frames.append(pd.DataFrame(signal, index=index))
+    return pd.concat(frames)
+
+
+class InformedTraderSignal:
+    """
+    Streaming "follow the informed trader" signal, same as the one in best_r5.py.
+
+    weights maps symbol -> {trader: weight}. Every new market trade adds
+    weight * quantity (positive when the trader buys) to the symbol's signal,
+    which decays geometrically every tick.
+    """
+
+    def __init__(self, weights, decay: float = 0.9) -> None:
+        self.weights = weights
+        self.decay = decay
+        self.signal = {symbol: 0.0 for symbol in weights}
+
+    def update(self, state):
+        for symbol in self.signal:
+            flow = 0.0
+            weights = self.weights[symbol]
+            for trade in state.market_trades.get(symbol, []):
+                if trade.timestamp != state.timestamp - 100:
+                    # Trade was already analyzed
+                    continue
+                flow += weights.get(trade.buyer, 0) * trade.quantity
+                flow -= weights.get(trade.seller, 0) * trade.quantity
+            self.signal[symbol] = self.decay * self.signal[symbol] + flow
+
+    def get(self, symbol) -> float:
+        return self.signal.get(symbol, 0.0)
+
+
+class _Trade:
+    """
+    Stand-in for datamodel.Trade built from a tape row.
+    """
+
+    def __init__(self, row) -> None:
+        self.symbol = row.symbol
+        self.price = row.price
+        self.quantity = row.quantity
+        self.buyer = row.buyer
+        self.seller = row.seller
+        self.timestamp = row.timestamp
+
+
+class _State:
+    """
+    Stand-in for datamodel.TradingState with only what InformedTraderSignal reads.
+    """
+
+    def __init__(self, timestamp: int, market_trades) -> None:
+        self.timestamp = timestamp
+        self.market_trades = market_trades
+
+
+def streaming_error(trades: pd.DataFrame, weights, batch: pd.DataFrame, step: int = 100) -> float:
+    """
+    Returns the largest difference between InformedTraderSignal fed tick by
+    tick from the tapes and the batch signal.
+    """
+    error = 0.0
+    for (round, day), tape in trades.groupby(["round", "day"], sort=True):
+        by_tick = {}
+        for row in tape.itertuples():
+            by_tick.setdefault(row.timestamp, {}).setdefault(row.symbol, []).append(_Trade(row))
+        expected = batch.loc[(round, day)]
+        streaming = InformedTraderSignal(weights)
+        for timestamp, values in zip(expected.index, expected.to_numpy()):
+            streaming.update(_State(timestamp, by_tick.get(timestamp - step, {})))
+            got = np.array([streaming.get(symbol) for symbol in expected.columns])
+            error = max(error, float(np.max(np.abs(got - values))))
+    return error
+
+
+def main():
+    top = int(sys.argv[1]) if len(sys.argv) > 1 else 15
+    trades = load_tapes()
+    index = build_index(trades)
+    ranking = rank_traders(index)
+    columns = ["trades", "volume"] + [f"per_unit_{h}" for h in HORIZONS] + [f"t_{HORIZONS[-1]}"]
+    with pd.option_context("display.width", 200, "display.max_columns", None):
+        print("Most informed:")
+        print(ranking[columns].head(top).round(3))
+        print("Most uninformed:")
+        print(ranking[columns].tail(top).round(3))
+
+    weights = informed_weights(ranking)
+    print("INFORMED_TRADERS =", weights)
+    batch = informed_signal(trades, weights)
+    print(f"Signal over {len(batch)} ticks, streaming max error {streaming_error(trades, weights, batch):.2e}")
+
+
+if __name__ == "__main__":
+    main()
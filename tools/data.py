@@ -0,0 +1,129 @@
+"""
+Loaders for the island data bottles shipped in each round folder.
+
+The bottles are not consistent: some files start with an Excel "sep=;" line,
+some use ';' and others ',' as delimiter, and round 2 "prices" files actually
+hold the ORCHIDS observations. Everything here normalises that away.
+"""
+import csv
+import glob
+import os
+import re
+from typing import Dict, List
+
+import pandas as pd
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+PRICES_GLOB = os.path.join(
+    ROOT, "Round *", "round-*-island-data-bottle", "prices_round_*_day_*.csv")
+TRADES_GLOB = os.path.join(
+    ROOT, "Round *", "round-*-island-data-bottle", "trades_round_*_day_*.csv")
+
+FILE_RE = re.compile(
+    r"(?P<kind>prices|trades)_round_(?P<round>\d+)_day_(?P<day>-?\d+)(?:_(?P<names>nn|wn))?\.csv$")
+
+
+def parse_name(path: str) -> Dict:
+    """
+    Returns kind, round, day and whether names are present for a bottle file.
+    """
+    match = FILE_RE.search(os.path.basename(path))
+    if match is None:
+        raise ValueError(f"Not a data bottle file: {path}")
+    return {
+        "kind": match["kind"],
+        "round": int(match["round"]),
+        "day": int(match["day"]),
+        "named": match["names"] == "wn",
+    }
+
+
+def read_bottle_csv(path: str) -> pd.DataFrame:
+    """
+    Reads a bottle csv whatever its delimiter or "sep=" preamble.
+    """
+    with open(path, newline="") as file:
+        head = file.readline()
+        skip = 0
+        if head.startswith("sep="):
+            delimiter = head.strip()[4:] or ";"
+            skip = 1
+        else:
+            delimiter = csv.Sniffer().sniff(head, delimiters=";,").delimiter
+    return pd.read_csv(path, sep=delimiter, skiprows=skip)
+
+
+def _files(pattern: str) -> List[str]:
+    files = [path for path in glob.glob(pattern) if "__MACOSX" not in path]
+    return sorted(files, key=lambda path: (parse_name(path)["round"], parse_name(path)["day"]))
+
+
+def observation_files() -> List[str]:
+    """
+    Returns the ORCHIDS observation files (round 2 "prices" bottles).
+    """
+    return [path for path in _files(PRICES_GLOB) if parse_name(path)["round"] == 2]
+
+
+def prices_files() -> List[str]:
+    """
+    Returns every order book snapshot file.
+    """
+    return [path for path in _files(PRICES_GLOB) if parse_name(path)["round"] != 2]
+
+
+def trades_files(named: bool = None) -> List[str]:
+    """
+    Returns trade tapes, optionally only the ones with (or without) trader names.
+    """
+    files = _files(TRADES_GLOB)
+    if named is None:
+        return files
+    return [path for path in files if parse_name(path)["named"] == named]
+
+
+def load_observations(path: str) -> pd.DataFrame:
+    """
+    Returns the ORCHIDS observation rows of one day, sorted by timestamp.
+    """
+    df = read_bottle_csv(path)
+    # Some bottles carry stray rows with a price but no timestamp
+    df = df.dropna(subset=["timestamp", "SUNLIGHT", "HUMIDITY"])
+    df["timestamp"] = df["timestamp"].astype(int)
+    df["DAY"] = parse_name(path)["day"]
+    return df.sort_values("timestamp", kind="stable").reset_index(drop=True)
+
+
+def load_prices(path: str) -> pd.DataFrame:
+    """
+    Returns the order book snapshots of one day, keeping only the documented columns.
+    """
+    df = read_bottle_csv(path)
+    columns = ["day", "timestamp", "product"]
+    for side in ("bid", "ask"):
+        for level in (1, 2, 3):
+            columns += [f"{side}_price_{level}", f"{side}_volume_{level}"]
+    columns += ["mid_price"]
+    df = df[columns]
+    return df.sort_values(["timestamp", "product"], kind="stable").reset_index(drop=True)
+
+
+def load_trades(path: str) -> pd.DataFrame:
+    """
+    Returns the market trades of one day with the day and round attached.
+    """
+    df = read_bottle_csv(path)
+    info = parse_name(path)
+    df["day"] = info["day"]
+    df["round"] = info["round"]
+    df["buyer"] = df["buyer"].fillna("")
+    df["seller"] = df["seller"].fillna("")
+    return df.sort_values("timestamp", kind="stable").reset_index(drop=True)
+
+
+def mid_prices(prices: pd.DataFrame) -> pd.DataFrame:
+    """
+    Returns a timestamp x product table of mid prices of one day.
+    """
+    return prices.pivot(index="timestamp", columns="product", values="mid_price").sort_index()
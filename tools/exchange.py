@@ -0,0 +1,319 @@
+"""
+Local stand-in for the exchange: replays a data bottle through Traders running
+in their own interpreter, the way the platform calls them.
+
+Every Trader runs in a worker subprocess, a bare interpreter with only its
+round folder on the path. For every tick the exchange writes the
+TradingState as one line of JSON (TradingState.toJSON, as the platform
+serializes it). The worker rebuilds the datamodel objects, calls Trader.run
+with stdout captured and answers with the orders, conversions, traderData
+and prints. The exchange then
+
+    - drops the answer of a tick that is not back within TIME_LIMIT and
+      restarts the worker, keeping the last traderData, as a timed out
+      lambda would be replaced
+    - does the same when the worker dies, counted as a crash with the end
+      of its stderr; a Trader that cannot be (re)started ends its replay,
+      reported as aborted, without stopping the other replays
+    - cuts the prints to LOG_LIMIT characters, as the platform's lambdaLog
+    - matches the orders with the Backtest rules
+
+and records the round-trip latency of every tick next to the time spent
+inside Trader.run, so that serialization, process and cold start overheads
+show up on their own.
+
+The exchange is an asyncio loop, so several Traders can be replayed at the
+same time (--concurrent), each against its own worker.
+
+Usage: python tools/exchange.py <trader files...> [--prices file] [--ticks N] [--concurrent]
+"""
+import argparse
+import asyncio
+import json
+import os
+import sys
+import time
+from typing import List
+
+import numpy as np
+
+from backtest import Backtest, Day, Result, datamodel, load_day
+from data import prices_files
+
+# Seconds a tick may take before its orders are dropped
+TIME_LIMIT = 0.9
+# Seconds for a worker to import the Trader and build it
+STARTUP_LIMIT = 10.0
+# Characters of prints kept per tick
+LOG_LIMIT = 3750
+# Longest line a worker may answer with
+LINE_LIMIT = 1 << 24
+# Characters of a worker's stderr kept for error messages
+STDERR_LIMIT = 2000
+
+# Worker loop: argv is the Trader's folder and file. One JSON state per
+# stdin line in, one JSON answer per stdout line out.
+WORKER = """
+import contextlib, importlib.util, io, json, sys, time
+start = time.perf_counter()
+sys.path.insert(0, sys.argv[1])
+import datamodel as dm
+out = sys.stdout
+with contextlib.redirect_stdout(io.StringIO()):
+    spec = importlib.util.spec_from_file_location("trader", sys.argv[2])
+    module = importlib.util.module_from_spec(spec)
+    spec.loader.exec_module(module)
+    trader = module.Trader()
+out.write(json.dumps({"startup_ms": (time.perf_counter() - start) * 1e3}) + "\\n")
+out.flush()
+
+
+def depth(book):
+    order_depth = dm.OrderDepth()
+    order_depth.buy_orders = {int(price): volume for price, volume in book["buy_orders"].items()}
+    order_depth.sell_orders = {int(price): volume for price, volume in book["sell_orders"].items()}
+    return order_depth
+
+
+def trades(by_symbol):
+    return {symbol: [dm.Trade(t["symbol"], t["price"], t["quantity"], t["buyer"], t["seller"], t["timestamp"])
+                     for t in symbol_trades] for symbol, symbol_trades in by_symbol.items()}
+
+
+def observation(data):
+    conversion = getattr(dm, "ConversionObservation", None)
+    observations = {product: conversion(**values) if conversion else values
+                    for product, values in data.get("conversionObservations", {}).items()}
+    return dm.Observation(data.get("plainValueObservations", {}), observations)
+
+
+for line in sys.stdin:
+    data = json.loads(line)
+    state = dm.TradingState(
+        data["traderData"], data["timestamp"],
+        {symbol: dm.Listing(**listing) for symbol, listing in data["listings"].items()},
+        {symbol: depth(book) for symbol, book in data["order_depths"].items()},
+        trades(data["own_trades"]), trades(data["market_trades"]),
+        data["position"], observation(data["observations"]))
+    log = io.StringIO()
+    orders, conversions, trader_data, error = {}, 0, data["traderData"], None
+    start = time.perf_counter()
+    try:
+        with contextlib.redirect_stdout(log):
+            orders, conversions, trader_data = trader.run(state)
+    except Exception as e:
+        error = repr(e)
+    run_ms = (time.perf_counter() - start) * 1e3
+    out.write(json.dumps({
+        "orders": {symbol: [[int(order.price), int(order.quantity)] for order in symbol_orders]
+                   for symbol, symbol_orders in (orders or {}).items()},
+        "conversions": int(conversions or 0),
+        "traderData": trader_data if isinstance(trader_data, str) else "",
+        "log": log.getvalue(),
+        "error": error,
+        "run_ms": run_ms,
+    }) + "\\n")
+    out.flush()
+"""
+
+
+class WorkerError(RuntimeError):
+    """
+    A worker that did not start or died, with the end of its stderr.
+    """
+
+
+class TraderProcess:
+    """
+    A worker subprocess running one Trader file.
+    """
+
+    def __init__(self, path: str) -> None:
+        self.path = os.path.abspath(path)
+        self.process = None
+        self.stderr = ""
+        self.stderr_task = None
+        self.startup_ms = []
+
+    async def drain_stderr(self):
+        # Keeps the pipe flowing so that a chatty Trader never blocks on it
+        while True:
+            chunk = await self.process.stderr.read(4096)
+            if not chunk:
+                return
+            self.stderr = (self.stderr + chunk.decode(errors="replace"))[-STDERR_LIMIT:]
+
+    async def error(self, message: str) -> WorkerError:
+        """
+        Kills the worker and returns a WorkerError with its exit code and stderr.
+        """
+        await self.close()
+        try:
+            await asyncio.wait_for(self.stderr_task, 1.0)
+        except asyncio.TimeoutError:
+            pass
+        stderr = self.stderr.strip()
+        return WorkerError(f"{os.path.basename(self.path)} {message} (exit code {self.process.returncode})"
+                           + (f":\n{stderr}" if stderr else ""))
+
+    async def start(self):
+        """
+        Starts the worker, or raises WorkerError when the Trader cannot be
+        imported and built within STARTUP_LIMIT seconds.
+        """
+        self.stderr = ""
+        self.process = await asyncio.create_subprocess_exec(
+            sys.executable, "-c", WORKER, os.path.dirname(self.path), self.path,
+            stdin=asyncio.subprocess.PIPE, stdout=asyncio.subprocess.PIPE,
+            stderr=asyncio.subprocess.PIPE, limit=LINE_LIMIT)
+        self.stderr_task = asyncio.ensure_future(self.drain_stderr())
+        try:
+            line = await asyncio.wait_for(self.process.stdout.readline(), STARTUP_LIMIT)
+        except asyncio.TimeoutError:
+            raise await self.error(f"did not start within {STARTUP_LIMIT:g}s")
+        if not line:
+            raise await self.error("did not start")
+        self.startup_ms.append(json.loads(line)["startup_ms"])
+
+    async def call(self, payload: str, timeout: float) -> dict:
+        """
+        Sends one serialized state and returns the answer. Raises
+        asyncio.TimeoutError when it is not back within timeout seconds and
+        WorkerError when the worker died.
+        """
+        try:
+            self.process.stdin.write(payload.encode() + b"\n")
+            await self.process.stdin.drain()
+        except (BrokenPipeError, ConnectionResetError):
+            raise await self.error("exited")
+        line = await asyncio.wait_for(self.process.stdout.readline(), timeout)
+        if not line:
+            raise await self.error("exited")
+        return json.loads(line)
+
+    async def close(self):
+        if self.process is not None and self.process.returncode is None:
+            self.process.kill()
+            await self.process.wait()
+
+    async def restart(self):
+        await self.close()
+        await self.start()
+
+
+def percentile(values, q: float) -> float:
+    return float(np.percentile(values, q)) if len(values) else np.nan
+
+
+async def replay(path: str, day: Day, max_ticks: int = None, time_limit: float = TIME_LIMIT,
+                 log_limit: int = LOG_LIMIT) -> dict:
+    """
+    Replays a day through the Trader file in a worker and returns its report.
+    """
+    backtest = Backtest(None, day)
+    result = Result(day.products)
+    worker = TraderProcess(path)
+
+    report = {"trader": os.path.basename(path), "timeouts": 0, "crashes": 0, "errors": 0, "truncated_logs": 0,
+              "max_log": 0, "max_trader_data": 0, "last_error": None, "aborted": None}
+    latencies, run_times, state_sizes = [], [], []
+    trader_data, own_trades, market_trades, mids = "", {}, {}, {}
+    try:
+        await worker.start()
+        for tick in day.ticks[:max_ticks]:
+            state = backtest.make_state(tick, trader_data, own_trades, market_trades, result.position)
+            payload = state.toJSON()
+            state_sizes.append(len(payload))
+            start = time.perf_counter()
+            try:
+                answer = await worker.call(payload, time_limit)
+            except asyncio.TimeoutError:
+                answer = None
+                report["timeouts"] += 1
+            except WorkerError as e:
+                answer = None
+                report["crashes"] += 1
+                report["last_error"] = str(e)
+            latencies.append(time.perf_counter() - start)
+
+            orders = {}
+            if answer is None:
+                # The tick is lost and the next one goes to a fresh worker with the last traderData
+                await worker.restart()
+            else:
+                run_times.append(answer["run_ms"])
+                if answer["error"] is not None:
+                    report["errors"] += 1
+                    report["last_error"] = answer["error"]
+                log = answer["log"]
+                report["max_log"] = max(report["max_log"], len(log))
+                if len(log) > log_limit:
+                    report["truncated_logs"] += 1
+                trader_data = answer["traderData"]
+                report["max_trader_data"] = max(report["max_trader_data"], len(trader_data))
+                orders = {symbol: [datamodel.Order(symbol, price, quantity) for price, quantity in symbol_orders]
+                          for symbol, symbol_orders in answer["orders"].items()}
+
+            own_trades, _ = backtest.settle(tick, orders, result)
+            market_trades = backtest.market_trades(tick)
+            mids.update(tick.mids)
+    except WorkerError as e:
+        # The Trader cannot be started (again), so the rest of the day is lost
+        report["aborted"] = str(e)
+    finally:
+        await worker.close()
+
+    latencies = np.array(latencies) * 1e3
+    report.update({
+        "ticks": len(latencies),
+        "startup_ms": worker.startup_ms[0] if worker.startup_ms else np.nan,
+        "restarts": max(len(worker.startup_ms) - 1, 0),
+        "state_kb": np.mean(state_sizes) / 1024 if state_sizes else np.nan,
+        "p50_ms": percentile(latencies, 50),
+        "p90_ms": percentile(latencies, 90),
+        "p99_ms": percentile(latencies, 99),
+        "max_ms": percentile(latencies, 100),
+        "run_p50_ms": percentile(run_times, 50),
+        "run_p99_ms": percentile(run_times, 99),
+        "pnl": sum(result.pnl(mids).values()),
+    })
+    return report
+
+
+async def replay_all(paths: List[str], day: Day, max_ticks: int = None, concurrent: bool = False,
+                     time_limit: float = TIME_LIMIT, log_limit: int = LOG_LIMIT) -> List[dict]:
+    if concurrent:
+        return list(await asyncio.gather(*(replay(path, day, max_ticks, time_limit, log_limit) for path in paths)))
+    return [await replay(path, day, max_ticks, time_limit, log_limit) for path in paths]
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[1])
+    parser.add_argument("traders", nargs="+", help="Trader files")
+    parser.add_argument("--prices", default=None, help="prices file replayed, the first bottle by default")
+    parser.add_argument("--ticks", type=int, default=None, help="ticks replayed")
+    parser.add_argument("--time-limit", type=float, default=TIME_LIMIT, help="seconds per tick")
+    parser.add_argument("--log-limit", type=int, default=LOG_LIMIT, help="characters of prints per tick")
+    parser.add_argument("--concurrent", action="store_true", help="replay every Trader at the same time")
+    args = parser.parse_args()
+
+    day = load_day(args.prices or prices_files()[0])
+    print(f"Replaying {day}")
+    reports = asyncio.run(replay_all(args.traders, day, args.ticks, args.concurrent, args.time_limit, args.log_limit))
+    for report in reports:
+        print(f"{report['trader']}: {report['ticks']} ticks, startup {report['startup_ms']:.0f}ms, "
+              f"state {report['state_kb']:.1f}kB, round trip p50 {report['p50_ms']:.2f}ms p90 {report['p90_ms']:.2f}ms "
+              f"p99 {report['p99_ms']:.2f}ms max {report['max_ms']:.2f}ms, run p50 {report['run_p50_ms']:.2f}ms "
+              f"p99 {report['run_p99_ms']:.2f}ms")
+        print(f"    timeouts {report['timeouts']}, crashes {report['crashes']}, restarts {report['restarts']}, "
+              f"errors {report['errors']}, "
+              f"logs over {args.log_limit} chars {report['truncated_logs']} (longest {report['max_log']}), "
+              f"longest traderData {report['max_trader_data']}, PnL {report['pnl']:.1f}")
+        if report["last_error"]:
+            print(f"    last error: {report['last_error']}")
+        if report["aborted"]:
+            print(f"    aborted: {report['aborted']}")
+
+
+if __name__ == "__main__":
+    main()
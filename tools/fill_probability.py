@@ -0,0 +1,227 @@
+"""
+Empirical fill probabilities of passive quotes.
+
+For every tick t, product, distance d from mid and horizon k, a resting buy at
+mid - d (sell at mid + d) is considered filled if within k ticks either
+
+    - a market trade prints at or through its price (tape of ticks t .. t+k-1), or
+    - the book crosses it (best ask <= price, books of ticks t+1 .. t+k).
+
+Next to it the tables keep the mean market volume traded at or through the
+price over the same ticks, the volume through the quote. It is what a quote
+at the front of its level could have been filled for, an upper bound of the
+fill size rather than an estimate of it. Tables are indexed [side, distance,
+horizon - 1] with side 0 = bid, 1 = ask, and saved as .npz for the simulator.
+to_literal() packs them into a short base64 string, with the distance step
+and volume scale in its header, that a Trader file can embed and read with
+FillTable.from_literal for O(1) lookups.
+
+Usage: python tools/fill_probability.py [output.npz]
+"""
+import base64
+import struct
+import sys
+import zlib
+from typing import Dict
+
+import numpy as np
+
+from data import load_prices, load_trades, parse_name, prices_files
+from backtest import find_trades_file
+
+DISTANCES = np.arange(0, 8.5, 0.5)
+HORIZONS = np.arange(1, 21)
+
+# Volumes through the quote are packed in uint16 steps of 1 / VOLUME_SCALE
+VOLUME_SCALE = 8
+
+# Literal header: distance step, volume scale, number of distances and horizons
+LITERAL_HEADER = struct.Struct("<ddHH")
+
+
+def _forward_extreme(values: np.ndarray, horizons, start: int, reduce) -> np.ndarray:
+    """
+    Returns out[k - 1, t] = reduce(values[t + start .. t + start + k - 1]),
+    NaN past the end of the day.
+    """
+    n = len(values)
+    out = np.full((len(horizons), n), np.nan)
+    running = np.full(n, np.nan)
+    for k in range(1, max(horizons) + 1):
+        shifted = np.full(n, np.nan)
+        offset = start + k - 1
+        if offset < n:
+            shifted[:n - offset] = values[offset:]
+        running = shifted if k == 1 else reduce(running, shifted)
+        if k in horizons:
+            out[list(horizons).index(k)] = running
+    return out
+
+
+def day_counts(book, trades, distances=DISTANCES, horizons=HORIZONS) -> Dict[str, tuple]:
+    """
+    Returns product -> (fills, volume, samples) arrays of shape
+    (2, len(distances), len(horizons)) for one day.
+    """
+    counts = {}
+    for product, rows in book.groupby("product"):
+        rows = rows.sort_values("timestamp")
+        timestamps = rows["timestamp"].to_numpy()
+        n = len(timestamps)
+        mid = rows["mid_price"].to_numpy(dtype=float)
+        best_bid = rows["bid_price_1"].to_numpy(dtype=float)
+        best_ask = rows["ask_price_1"].to_numpy(dtype=float)
+
+        tape = trades[trades["symbol"] == product]
+        tick_of_trade = np.searchsorted(timestamps, tape["timestamp"].to_numpy())
+        keep = tick_of_trade < n
+        tick_of_trade = tick_of_trade[keep]
+        price = tape["price"].to_numpy(dtype=float)[keep]
+        quantity = tape["quantity"].to_numpy(dtype=float)[keep]
+
+        # Lowest / highest print of every tick, inf when nothing traded
+        low = np.full(n, np.inf)
+        high = np.full(n, -np.inf)
+        np.minimum.at(low, tick_of_trade, price)
+        np.maximum.at(high, tick_of_trade, price)
+
+        # Lowest price reached against a bid, highest against an ask
+        tape_low = _forward_extreme(low, horizons, 0, np.fmin)
+        tape_high = _forward_extreme(high, horizons, 0, np.fmax)
+        book_low = _forward_extreme(np.nan_to_num(best_ask, nan=np.inf), horizons, 1, np.fmin)
+        book_high = _forward_extreme(np.nan_to_num(best_bid, nan=-np.inf), horizons, 1, np.fmax)
+        reach_low = np.fmin(tape_low, book_low)
+        reach_high = np.fmax(tape_high, book_high)
+        valid = ~np.isnan(book_low)
+
+        fills = np.zeros((2, len(distances), len(horizons)))
+        volume = np.zeros_like(fills)
+        samples = np.zeros_like(fills)
+        for i, distance in enumerate(distances):
+            bid = mid - distance
+            ask = mid + distance
+            fills[0, i] = ((reach_low <= bid) & valid).sum(axis=1)
+            fills[1, i] = ((reach_high >= ask) & valid).sum(axis=1)
+            samples[:, i] = valid.sum(axis=1)
+
+            # Volume printed at or through the quote, accumulated over the horizon
+            bid_volume = np.zeros(n)
+            ask_volume = np.zeros(n)
+            for k in range(1, max(horizons) + 1):
+                origin = tick_of_trade - (k - 1)
+                ok = origin >= 0
+                np.add.at(bid_volume, origin[ok], np.where(price[ok] <= bid[origin[ok]], quantity[ok], 0))
+                np.add.at(ask_volume, origin[ok], np.where(price[ok] >= ask[origin[ok]], quantity[ok], 0))
+                if k in horizons:
+                    h = list(horizons).index(k)
+                    volume[0, i, h] = (bid_volume * valid[h]).sum()
+                    volume[1, i, h] = (ask_volume * valid[h]).sum()
+        counts[product] = (fills, volume, samples)
+    return counts
+
+
+class FillTable:
+    """
+    Fill probability and volume through the quote of one product.
+    """
+
+    def __init__(self, probability: np.ndarray, volume: np.ndarray, distances=DISTANCES, horizons=HORIZONS) -> None:
+        self.probability = probability
+        self.volume = volume
+        self.distances = np.asarray(distances, dtype=float)
+        self.horizons = np.asarray(horizons)
+        self.step = float(self.distances[1] - self.distances[0])
+
+    def index(self, side: int, distance: float, horizon: int):
+        i = min(max(int(round(distance / self.step)), 0), len(self.distances) - 1)
+        j = min(max(horizon, 1), len(self.horizons)) - 1
+        return side, i, j
+
+    def lookup(self, side: int, distance: float, horizon: int):
+        """
+        Returns (probability, volume through the quote) for a quote on side
+        (0 bid, 1 ask).
+        """
+        index = self.index(side, distance, horizon)
+        return float(self.probability[index]), float(self.volume[index])
+
+    def to_literal(self, volume_scale: int = VOLUME_SCALE) -> str:
+        """
+        Packs the table in a base64 string: probabilities in 1/255 steps as
+        uint8 and volumes in 1/volume_scale steps as uint16, zlib compressed
+        after a header with the distance step and volume scale. Raises
+        ValueError if a volume does not fit.
+        """
+        volume = np.round(self.volume * volume_scale)
+        limit = np.iinfo(np.uint16).max
+        if volume.min() < 0 or volume.max() > limit:
+            raise ValueError(f"volumes must be within [0, {limit / volume_scale}] at scale {volume_scale}, "
+                             f"got [{self.volume.min()}, {self.volume.max()}]")
+        header = LITERAL_HEADER.pack(self.step, volume_scale, len(self.distances), len(self.horizons))
+        packed = (np.round(self.probability * 255).astype(np.uint8).tobytes()
+                  + volume.astype("<u2").tobytes())
+        return base64.b64encode(zlib.compress(header + packed, 9)).decode()
+
+    @classmethod
+    def from_literal(cls, literal: str) -> "FillTable":
+        raw = zlib.decompress(base64.b64decode(literal))
+        step, volume_scale, distances, horizons = LITERAL_HEADER.unpack_from(raw)
+        shape = (2, distances, horizons)
+        count = 2 * distances * horizons
+        offset = LITERAL_HEADER.size
+        probability = np.frombuffer(raw, dtype=np.uint8, count=count, offset=offset).reshape(shape) / 255
+        volume = np.frombuffer(raw, dtype="<u2", count=count, offset=offset + count).reshape(shape) / volume_scale
+        return cls(probability, volume, np.arange(distances) * step, np.arange(1, horizons + 1))
+
+
+def build_tables(paths=None) -> Dict[str, FillTable]:
+    """
+    Returns the fill table of every product over the given prices files.
+    """
+    totals = {}
+    for path in paths or prices_files():
+        info = parse_name(path)
+        trades_path = find_trades_file(info["round"], info["day"])
+        if trades_path is None:
+            continue
+        for product, counts in day_counts(load_prices(path), load_trades(trades_path)).items():
+            if product in totals:
+                totals[product] = tuple(a + b for a, b in zip(totals[product], counts))
+            else:
+                totals[product] = counts
+
+    tables = {}
+    for product, (fills, volume, samples) in totals.items():
+        with np.errstate(invalid="ignore", divide="ignore"):
+            tables[product] = FillTable(np.nan_to_num(fills / samples), np.nan_to_num(volume / samples))
+    return tables
+
+
+def save(tables: Dict[str, FillTable], path: str):
+    arrays = {}
+    for product, table in tables.items():
+        arrays[f"{product}_probability"] = table.probability
+        arrays[f"{product}_volume"] = table.volume
+    np.savez_compressed(path, distances=DISTANCES, horizons=HORIZONS, **arrays)
+
+
+def load(path: str) -> Dict[str, FillTable]:
+    data = np.load(path)
+    products = {key.rsplit("_", 1)[0] for key in data.files if key.endswith("_probability")}
+    return {product: FillTable(data[f"{product}_probability"], data[f"{product}_volume"], data["distances"], data["horizons"])
+            for product in products}
+
+
+def main():
+    output = sys.argv[1] if len(sys.argv) > 1 else "fill_tables.npz"
+    tables = build_tables()
+    save(tables, output)
+    for product, table in sorted(tables.items()):
+        print(f"{product}: P(fill) bid side, rows distance {DISTANCES[:7].tolist()}, columns horizon 1, 5, 10, 20")
+        print(np.round(table.probability[0][:7][:, [0, 4, 9, 19]], 3))
+        print(f"  literal ({len(table.to_literal())} chars): {table.to_literal()[:60]}...")
+    print(f"Saved {output}")
+
+
+if __name__ == "__main__":
+    main()
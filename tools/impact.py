@@ -0,0 +1,236 @@
+"""
+Market impact of aggressive orders, estimated from the tapes.
+
+Every tape trade at a tick prints at that tick's best bid or ask, so it is
+signed by the side it hit, giving the net signed volume v of every tick and
+its flow sign(v) * |v| ** EXPONENT. The mid moves are fitted jointly as
+
+    mid[t + k] - mid[t] = permanent * v[t] + temporary * decay ** (k - 1) * flow[t]
+
+for k = 1 .. MAX_LAG, by least squares weighted by 1 / k since the noise of
+the moves grows like a random walk, with both terms non-negative and the
+decay from a grid. The temporary part is on the square-root flow so that
+our 60 lot orders are not priced as sixty of the 1 to 5 lot trades of the
+tape. The permanent part is linear: a concave permanent impact could be
+pumped, by buying in small pieces and selling in one block, and only a
+linear one leaves nothing to gain from round trips. Volume and flow are
+strongly correlated on the tapes, so the fit often puts a product's impact
+in one of the two terms only.
+
+In the Backtest the impact is charged in cash and is never shown to the
+Trader nor used to mark its position: shifting the books and mids it trades
+on and is marked at would let a strategy profit from the move it caused
+itself, and changing which orders fill would let a losing one gain by
+trading less. Its PnL with impact is therefore never above the one without.
+Trading q units at tick t adds q * permanent to the permanent impact of the
+product. Fills pay the permanent impact so far plus half of their own, as if
+the price had walked along with them, which over a day costs
+permanent * position ** 2 / 2 whatever the path. Taking q units from the
+book adds
+
+    sign(q) * |q| ** EXPONENT * temporary * decay ** (k - 1)
+
+to the temporary impact at ticks t + k: the part of the taken side that has
+not refilled yet. Taking again in the same direction pays it on every unit,
+while trading back the other way neither pays nor gains from it. The
+temporary impact is kept as per-product arrays over the day, updated with
+one slice addition per fill.
+
+The main prints the fit and, given a Trader file, its PnL per product with
+and without impact; it exits with status 1 if impact raised the PnL of a
+product on a day.
+
+Usage: python tools/impact.py [trader file]
+"""
+import sys
+from typing import Dict, List
+
+import numpy as np
+import pandas as pd
+from numpy.lib.stride_tricks import sliding_window_view
+
+from backtest import Backtest, find_trades_file, load_day, load_module, silenced
+from data import load_prices, load_trades, parse_name, prices_files
+
+EXPONENT = 0.5
+MAX_LAG = 100
+
+# Decays tried by the fit. A temporary part that lasts longer than a quarter
+# of the fitted lags cannot be told from the permanent one, so the half-lives
+# stop there
+MAX_HALF_LIFE = MAX_LAG / 4
+DECAYS = np.geomspace(0.05, 0.5 ** (1 / MAX_HALF_LIFE), 80)
+
+# Weight below which the temporary impact is dropped
+TRUNCATE = 1e-3
+
+
+def signed_volume(book: pd.DataFrame, tape: pd.DataFrame) -> np.ndarray:
+    """
+    Returns the net volume of every tick of one product's book: tape trades
+    at the ask minus those at the bid.
+    """
+    timestamps = book["timestamp"].to_numpy()
+    index = np.searchsorted(timestamps, tape["timestamp"].to_numpy())
+    valid = (index < len(timestamps)) & (timestamps[np.minimum(index, len(timestamps) - 1)] == tape["timestamp"].to_numpy())
+    index = index[valid]
+    price = tape["price"].to_numpy()[valid]
+    quantity = tape["quantity"].to_numpy()[valid]
+    sign = (price >= book["ask_price_1"].to_numpy()[index]).astype(int) - (price <= book["bid_price_1"].to_numpy()[index])
+    volume = np.zeros(len(timestamps))
+    np.add.at(volume, index, sign * quantity)
+    return volume
+
+
+def signed_flow(volume: np.ndarray, exponent: float = EXPONENT) -> np.ndarray:
+    return np.sign(volume) * np.abs(volume) ** exponent
+
+
+def response_sums(mid: np.ndarray, volume: np.ndarray, max_lag: int = MAX_LAG):
+    """
+    Returns (volume @ moves, flow @ moves, gram) for one day, where moves[t, k - 1]
+    is mid[t + k] - mid[t] and gram the 2 x 2 products of volume and flow,
+    so that days are pooled by adding them.
+    """
+    windows = sliding_window_view(mid, max_lag + 1)
+    moves = np.nan_to_num(windows[:, 1:] - windows[:, :1])
+    volume = np.nan_to_num(volume[:len(windows)])
+    flow = signed_flow(volume)
+    regressors = np.stack([volume, flow])
+    return volume @ moves, flow @ moves, regressors @ regressors.T
+
+
+def fit_kernel(volume_moves: np.ndarray, flow_moves: np.ndarray, gram: np.ndarray):
+    """
+    Returns (permanent, temporary, decay) minimizing
+
+        sum_k w_k sum_t (mid[t + k] - mid[t] - permanent * volume[t]
+                         - temporary * decay ** (k - 1) * flow[t]) ** 2
+
+    with w_k = 1 / k, over permanent, temporary >= 0 and the decays of DECAYS.
+    """
+    k = np.arange(len(volume_moves))
+    weight = 1.0 / (k + 1)
+    basis = DECAYS[:, None] ** k[None, :]
+    # Weighted normal equations of (permanent, temporary) for every decay at once
+    a = gram[0, 0] * weight.sum()
+    b = gram[0, 1] * (basis @ weight)
+    c = gram[1, 1] * ((basis ** 2) @ weight)
+    y1 = weight @ volume_moves
+    y2 = basis @ (weight * flow_moves)
+
+    # The optimum of the non-negative quadrant is either the unconstrained one
+    # or on an edge, where the other term is refitted alone
+    det = a * c - b ** 2
+    with np.errstate(invalid="ignore", divide="ignore"):
+        joint = (np.where(det > 0, (c * y1 - b * y2) / det, -1.0), np.where(det > 0, (a * y2 - b * y1) / det, -1.0))
+        candidates = [
+            joint,
+            (np.full(len(DECAYS), max(y1 / a, 0.0) if a > 0 else 0.0), np.zeros(len(DECAYS))),
+            (np.zeros(len(DECAYS)), np.where(c > 0, np.maximum(y2 / c, 0.0), 0.0)),
+        ]
+    best = (-np.inf, 0.0, 0.0, 0.0)
+    for permanent, temporary in candidates:
+        feasible = (permanent >= 0) & (temporary >= 0)
+        # Decrease of the objective from (0, 0)
+        gain = 2 * (permanent * y1 + temporary * y2) - permanent ** 2 * a - 2 * permanent * temporary * b - temporary ** 2 * c
+        gain = np.where(feasible, gain, -np.inf)
+        i = int(np.argmax(gain))
+        if gain[i] > best[0]:
+            # Without a temporary part the decay means nothing
+            best = (gain[i], float(permanent[i]), float(temporary[i]), float(DECAYS[i]) if temporary[i] > 0 else 0.0)
+    return best[1:]
+
+
+class ImpactModel:
+    """
+    Per-product (permanent, temporary, decay) impact: permanent per unit of
+    volume, temporary per unit of flow.
+    """
+
+    def __init__(self, params: Dict[str, tuple]) -> None:
+        self.params = params
+        self.kernels = {}
+        for product, (permanent, temporary, decay) in params.items():
+            horizon = 1 if temporary <= 0 or decay <= 0 else int(np.ceil(np.log(TRUNCATE) / np.log(decay))) + 1
+            self.kernels[product] = temporary * decay ** np.arange(horizon)
+
+    @classmethod
+    def fit(cls, paths: List[str] = None, max_lag: int = MAX_LAG) -> "ImpactModel":
+        """
+        Fits every product of the given prices files (every bottle by default).
+        """
+        sums = {}
+        for path in paths or prices_files():
+            info = parse_name(path)
+            trades_path = find_trades_file(info["round"], info["day"])
+            if trades_path is None:
+                continue
+            prices, trades = load_prices(path), load_trades(trades_path)
+            for product, book in prices.groupby("product"):
+                book = book.sort_values("timestamp")
+                mid = book["mid_price"].to_numpy(dtype=float)
+                volume = signed_volume(book, trades[trades["symbol"] == product])
+                day = response_sums(mid, volume, max_lag)
+                sums[product] = day if product not in sums else tuple(x + y for x, y in zip(sums[product], day))
+
+        return cls({product: fit_kernel(*product_sums)
+                    for product, product_sums in sums.items() if product_sums[2][1, 1] > 0})
+
+    def horizon(self) -> int:
+        return max((len(kernel) for kernel in self.kernels.values()), default=1)
+
+    def impact(self, product: str, quantity: int):
+        """
+        Returns (permanent shift, temporary shifts of the following ticks) of
+        an aggressive fill of signed quantity.
+        """
+        if product not in self.params or quantity == 0:
+            return 0.0, None
+        flow = np.sign(quantity) * abs(quantity) ** EXPONENT
+        return quantity * self.params[product][0], flow * self.kernels[product]
+
+    def __repr__(self) -> str:
+        return f"ImpactModel({self.params})"
+
+
+def main():
+    model = ImpactModel.fit()
+    print("IMPACT = {")
+    for product, (permanent, temporary, decay) in sorted(model.params.items()):
+        line = f'    "{product}": ({permanent:.4f}, {temporary:.4f}, {decay:.4f}),'
+        if temporary > 0:
+            line += f"  # half-life {np.log(0.5) / np.log(decay):.1f} ticks"
+            if decay == DECAYS[-1]:
+                line += " (the longest tried)"
+        print(line)
+    print("}")
+
+    if len(sys.argv) > 1:
+        with silenced():
+            module = load_module(sys.argv[1])
+        rows, gains = {}, []
+        for path in prices_files():
+            day = load_day(path)
+            pnls = {}
+            for name, impact in (("no impact", None), ("impact", model)):
+                with silenced():
+                    trader = module.Trader()
+                pnls[name] = Backtest(trader, day, impact=impact).run().final_pnl
+                for product, pnl in pnls[name].items():
+                    rows.setdefault(name, {}).setdefault(product, 0.0)
+                    rows[name][product] += pnl
+            for product, pnl in pnls["impact"].items():
+                if pnl > pnls["no impact"][product] + 1e-6:
+                    gains.append(f"{product} round {day.round} day {day.day}: {pnl:.2f} > {pnls['no impact'][product]:.2f}")
+        table = pd.DataFrame(rows)
+        table.loc["TOTAL"] = table.sum()
+        print(table.round(2))
+        for line in gains:
+            print("IMPACT RAISED PNL", line)
+        if gains:
+            sys.exit(1)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,32 @@
+"""
+Vectorized versions of the indicators used by the Traders, memoized through
+the on-disk IndicatorCache so that reruns of a sweep reuse them. The cache
+directory is only created when the first result is stored.
+"""
+import numpy as np
+import pandas as pd
+
+from cache import IndicatorCache
+
+cache = IndicatorCache()
+
+
+@cache.cached
+def basket_spread(*legs, weights):
+    """
+    Weighted sum of the legs' prices, e.g. gift - (4 choco + 6 straw + roses).
+    """
+    spread = np.zeros(len(legs[0]))
+    for leg, weight in zip(legs, weights):
+        spread += weight * np.asarray(leg, dtype=float)
+    return spread
+
+
+@cache.cached
+def rolling_zscore(x, long, short):
+    """
+    (mean(x, short) - mean(x, long)) / std(x, long), as in gift_strategy.
+    """
+    series = pd.Series(x)
+    rolling = series.rolling(long)
+    return ((series.rolling(short).mean() - rolling.mean()) / rolling.std()).to_numpy()
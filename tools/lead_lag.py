@@ -0,0 +1,120 @@
+"""
+Lead-lag cross-correlations of mid price returns between every pair of products.
+
+corr[i, j, lag] is the correlation of the return of product i at tick t with
+the return of product j at tick t + lag, for lags -N .. N pooled over every
+day. A peak at a positive lag means i leads j by that many ticks.
+
+Every day is zero padded to a power of two above n + N, so lags never wrap
+around or cross into another day, and all pairs of all days come out of one
+batched FFT: O(P * n log n) for the transforms and O(P^2 * n log n) for the
+cross spectra, instead of O(P^2 * n * N) with np.correlate.
+
+The lag matrix printed at the end (best lag and its correlation of the pairs
+above noise level) is meant to be copied as constants into the strategies.
+
+Usage: python tools/lead_lag.py [max lag]
+"""
+import sys
+from typing import List
+
+import numpy as np
+import pandas as pd
+
+from data import load_prices, mid_prices, prices_files
+
+MAX_LAG = 50
+
+# |corr| below Z_NOISE / sqrt(samples) is reported as no relation
+Z_NOISE = 4
+
+
+def returns(days: List[pd.DataFrame], products: List[str]) -> List[np.ndarray]:
+    """
+    Returns per day an array (products, ticks - 1) of demeaned mid price
+    differences, zero for products missing from the day.
+    """
+    series = []
+    for mids in days:
+        day = np.zeros((len(products), len(mids) - 1))
+        for i, product in enumerate(products):
+            if product in mids:
+                x = np.diff(mids[product].to_numpy(dtype=float))
+                x = np.nan_to_num(x)
+                day[i] = x - x.mean()
+        series.append(day)
+    return series
+
+
+def cross_correlations(series: List[np.ndarray], max_lag: int = MAX_LAG):
+    """
+    Returns (corr, samples) where corr has shape (P, P, 2 * max_lag + 1) with
+    lags -max_lag .. max_lag on the last axis.
+    """
+    n = max(day.shape[1] for day in series)
+    size = 1 << int(np.ceil(np.log2(n + max_lag + 1)))
+    padded = np.zeros((len(series), series[0].shape[0], size))
+    for d, day in enumerate(series):
+        padded[d, :, :day.shape[1]] = day
+
+    spectrum = np.fft.rfft(padded, axis=-1)
+    # c[i, j, k] = sum over days and t of x_i[t] * x_j[t + k]
+    cross = np.fft.irfft(np.einsum("dif,djf->ijf", np.conj(spectrum), spectrum), n=size, axis=-1)
+    lags = np.arange(-max_lag, max_lag + 1)
+    cross = cross[:, :, lags % size]
+
+    energy = (padded ** 2).sum(axis=(0, 2))
+    with np.errstate(invalid="ignore", divide="ignore"):
+        corr = cross / np.sqrt(np.outer(energy, energy))[:, :, None]
+    return np.nan_to_num(corr), sum(day.shape[1] for day in series)
+
+
+def lag_matrix(corr: np.ndarray, products: List[str], samples: int) -> pd.DataFrame:
+    """
+    Returns one row per ordered pair (leader, follower): the positive lag with
+    the largest |corr|, that correlation, the same-tick correlation and
+    whether the peak is above noise level.
+    """
+    max_lag = corr.shape[-1] // 2
+    noise = Z_NOISE / np.sqrt(samples)
+    rows = []
+    for i, leader in enumerate(products):
+        for j, follower in enumerate(products):
+            if i == j:
+                continue
+            positive = corr[i, j, max_lag + 1:]
+            lag = int(np.argmax(np.abs(positive))) + 1
+            rows.append({
+                "leader": leader,
+                "follower": follower,
+                "lag": lag,
+                "corr": positive[lag - 1],
+                "corr_lag_0": corr[i, j, max_lag],
+                "significant": abs(positive[lag - 1]) >= noise,
+            })
+    return pd.DataFrame(rows, columns=["leader", "follower", "lag", "corr", "corr_lag_0", "significant"])
+
+
+def main():
+    max_lag = int(sys.argv[1]) if len(sys.argv) > 1 else MAX_LAG
+
+    days = [mid_prices(load_prices(path)) for path in prices_files()]
+    products = sorted(set().union(*(mids.columns for mids in days)))
+    corr, samples = cross_correlations(returns(days, products), max_lag)
+    matrix = lag_matrix(corr, products, samples)
+
+    print(f"{len(days)} days, {samples} returns per product, noise level {Z_NOISE / np.sqrt(samples):.4f}")
+    with pd.option_context("display.width", 200):
+        print("Same-tick correlation:")
+        print(pd.DataFrame(corr[:, :, max_lag], index=products, columns=products).round(3))
+        print("Lead-lag:")
+        print(matrix.round(4).to_string(index=False))
+
+    print("LEAD_LAG = {")
+    for row in matrix[matrix["significant"]].itertuples(index=False):
+        print(f'    ("{row.leader}", "{row.follower}"): ({row.lag}, {row.corr:.4f}),')
+    print("}")
+
+
+if __name__ == "__main__":
+    main()
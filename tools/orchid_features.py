@@ -0,0 +1,165 @@
+"""
+Sunlight, humidity and tariff features for ORCHIDS.
+
+Production is driven by sunlight (2500 units per hour on average, a day being
+12 hours on the island) and by humidity staying inside its ideal band, while
+tariffs and transport fees move the conversion prices (see Round 2/notes.md).
+
+orchid_features() is the batch form over a whole day of observations.
+OrchidFeatures is the O(1) streaming form; the same class lives in
+Round 5/best_r5.py where it is fed from state.observations.conversionObservations.
+
+Usage: python tools/orchid_features.py
+"""
+from typing import Dict
+
+import numpy as np
+import pandas as pd
+
+from data import load_observations, observation_files
+
+SUNLIGHT_PER_HOUR = 2500
+HOURS_PER_DAY = 12
+DAY_LENGTH = 1_000_000
+HOURS_PER_TIMESTAMP = HOURS_PER_DAY / DAY_LENGTH
+# Ideal humidity range for orchid production, in percent
+HUMIDITY_BAND = (60, 80)
+
+FEATURES = [
+    "elapsed_hours",
+    "sunlight_hours",
+    "sunlight_deficit",
+    "humidity_excess",
+    "hours_outside_band",
+    "transport_fees_delta",
+    "export_tariff_delta",
+    "import_tariff_delta",
+]
+
+
+def orchid_features(observations: pd.DataFrame) -> pd.DataFrame:
+    """
+    Returns the features of every tick of a single day of observations.
+
+        sunlight_hours: cumulative sunlight expressed in hours at the 2500/hour norm
+        sunlight_deficit: elapsed hours minus sunlight_hours (> 0 means below norm)
+        humidity_excess: signed distance outside the humidity band, 0 inside
+        hours_outside_band: cumulative time spent outside the band
+        *_delta: change of the fees since the previous tick
+    """
+    timestamps = observations["timestamp"].to_numpy(dtype=float)
+    sunlight = observations["SUNLIGHT"].to_numpy(dtype=float)
+    humidity = observations["HUMIDITY"].to_numpy(dtype=float)
+
+    dt_hours = np.diff(timestamps, prepend=timestamps[:1]) * HOURS_PER_TIMESTAMP
+    elapsed_hours = (timestamps - timestamps[:1]) * HOURS_PER_TIMESTAMP
+    sunlight_hours = np.cumsum(sunlight * dt_hours) / SUNLIGHT_PER_HOUR
+    humidity_excess = humidity - np.clip(humidity, *HUMIDITY_BAND)
+    hours_outside_band = np.cumsum((humidity_excess != 0) * dt_hours)
+
+    features = pd.DataFrame({
+        "timestamp": observations["timestamp"].to_numpy(),
+        "elapsed_hours": elapsed_hours,
+        "sunlight_hours": sunlight_hours,
+        "sunlight_deficit": elapsed_hours - sunlight_hours,
+        "humidity_excess": humidity_excess,
+        "hours_outside_band": hours_outside_band,
+    })
+    for column, name in [("TRANSPORT_FEES", "transport_fees"), ("EXPORT_TARIFF", "export_tariff"), ("IMPORT_TARIFF", "import_tariff")]:
+        values = observations[column].to_numpy(dtype=float)
+        features[name + "_delta"] = np.diff(values, prepend=values[:1])
+    return features
+
+
+class OrchidFeatures:
+    """
+    Streaming version of orchid_features(), O(1) per update.
+    A timestamp going backwards starts a new day.
+    """
+
+    def __init__(self) -> None:
+        self.reset()
+
+    def reset(self):
+        self.first_timestamp = None
+        self.last_timestamp = None
+        self.last_fees = None
+        self.sunlight_sum = 0.0
+
+        self.elapsed_hours = 0.0
+        self.sunlight_hours = 0.0
+        self.sunlight_deficit = 0.0
+        self.humidity_excess = 0.0
+        self.hours_outside_band = 0.0
+        self.transport_fees_delta = 0.0
+        self.export_tariff_delta = 0.0
+        self.import_tariff_delta = 0.0
+
+    def update(self, timestamp, conversion):
+        """
+        Updates the features with the ConversionObservation of ORCHIDS at timestamp.
+        """
+        if self.last_timestamp is not None and timestamp < self.last_timestamp:
+            self.reset()
+        if self.first_timestamp is None:
+            self.first_timestamp = timestamp
+            self.last_timestamp = timestamp
+
+        dt_hours = (timestamp - self.last_timestamp) * HOURS_PER_TIMESTAMP
+        self.last_timestamp = timestamp
+        self.elapsed_hours = (timestamp - self.first_timestamp) * HOURS_PER_TIMESTAMP
+
+        self.sunlight_sum += conversion.sunlight * dt_hours
+        self.sunlight_hours = self.sunlight_sum / SUNLIGHT_PER_HOUR
+        self.sunlight_deficit = self.elapsed_hours - self.sunlight_hours
+
+        low, high = HUMIDITY_BAND
+        self.humidity_excess = conversion.humidity - min(max(conversion.humidity, low), high)
+        if self.humidity_excess != 0:
+            self.hours_outside_band += dt_hours
+
+        fees = (conversion.transportFees, conversion.exportTariff, conversion.importTariff)
+        if self.last_fees is not None:
+            self.transport_fees_delta = fees[0] - self.last_fees[0]
+            self.export_tariff_delta = fees[1] - self.last_fees[1]
+            self.import_tariff_delta = fees[2] - self.last_fees[2]
+        self.last_fees = fees
+
+    def features(self) -> Dict[str, float]:
+        return {name: getattr(self, name) for name in FEATURES}
+
+
+class _Observation:
+    """
+    Stand-in for datamodel.ConversionObservation built from a csv row.
+    """
+
+    def __init__(self, row) -> None:
+        self.transportFees = row.TRANSPORT_FEES
+        self.exportTariff = row.EXPORT_TARIFF
+        self.importTariff = row.IMPORT_TARIFF
+        self.sunlight = row.SUNLIGHT
+        self.humidity = row.HUMIDITY
+
+
+def main():
+    streaming = OrchidFeatures()
+    for path in observation_files():
+        observations = load_observations(path)
+        batch = orchid_features(observations)
+
+        error = 0.0
+        for row, expected in zip(observations.itertuples(), batch[FEATURES].to_numpy()):
+            streaming.update(row.timestamp, _Observation(row))
+            got = np.array([streaming.features()[name] for name in FEATURES])
+            error = max(error, float(np.max(np.abs(got - expected))))
+
+        last = batch.iloc[-1]
+        print(f"Day {observations['DAY'].iloc[0]}: sunlight {last['sunlight_hours']:.2f}h / {last['elapsed_hours']:.2f}h, "
+              f"outside humidity band {last['hours_outside_band']:.2f}h, "
+              f"tariff changes {int((batch['import_tariff_delta'] != 0).sum())} import / {int((batch['export_tariff_delta'] != 0).sum())} export, "
+              f"streaming max error {error:.2e}")
+
+
+if __name__ == "__main__":
+    main()
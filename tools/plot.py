@@ -0,0 +1,306 @@
+"""
+Downsampled plots of whole days of mids, spreads, z-scores, fills and positions.
+
+The mids of the chosen days are read once and kept in the IndicatorCache as
+one structured array (a time column and a column per product), memory-mapped
+on later runs. Spreads and z-scores come from the cached indicators. Every
+line is reduced to a few points per pixel before it reaches matplotlib:
+
+    minmax   first, lowest, highest and last point of every pixel bucket, so
+             spikes survive at any zoom level
+    lttb     Largest-Triangle-Three-Buckets, a smoother shape for overviews
+
+A zoom only slices the columns by binary search on time and downsamples the
+slice, so redrawing any window of a million ticks takes milliseconds. The
+figure re-downsamples itself whenever its x range changes.
+
+matplotlib is only needed to draw; everything else works without it.
+
+Usage: python tools/plot.py <prices files...> [--trader file] [--start T] [--end T] [--out file.png]
+with T in timestamps, (day - first day) * 1000000 + timestamp for several days.
+"""
+import argparse
+import os
+import time
+from typing import Dict, List
+
+import numpy as np
+import pandas as pd
+
+try:
+    import matplotlib.pyplot as plt
+except ImportError:
+    plt = None
+
+from backtest import Backtest, load_day, load_module, silenced
+from cache import hash_key, source_hash
+from data import load_prices, mid_prices, parse_name
+from indicators import basket_spread, cache, rolling_zscore
+from spread_research import CURRENT, SPREADS, rolling_sums
+
+DAY_LENGTH = 1_000_000
+
+# Pixel buckets across the width of a figure
+WIDTH = 1600
+
+
+def load_columns(paths: List[str]) -> np.ndarray:
+    """
+    Returns a structured array of a "time" column and the mid price of every
+    product over the given days, through the cache.
+    """
+    params = {"files": [(os.path.abspath(path), os.stat(path).st_mtime_ns, os.stat(path).st_size) for path in paths]}
+    key = hash_key(f"plot.load_columns.{source_hash(load_columns)}", [], params)
+    columns = cache.get(key)
+    if columns is not None:
+        return columns
+
+    first = min(parse_name(path)["day"] for path in paths)
+    days = []
+    for path in paths:
+        mids = mid_prices(load_prices(path))
+        mids.index = mids.index + (parse_name(path)["day"] - first) * DAY_LENGTH
+        days.append(mids)
+    mids = pd.concat(days).sort_index()
+
+    columns = np.empty(len(mids), dtype=[("time", np.int64)] + [(product, np.float64) for product in mids.columns])
+    columns["time"] = mids.index.to_numpy()
+    for product in mids.columns:
+        columns[product] = mids[product].to_numpy(dtype=float)
+    return cache.put(key, columns)
+
+
+def minmax(y: np.ndarray, buckets: int = WIDTH) -> np.ndarray:
+    """
+    Returns the sorted indices of the first, lowest, highest and last point
+    of each of `buckets` equal slices of y.
+    """
+    n = len(y)
+    if n <= 4 * buckets:
+        return np.arange(n)
+    size = -(-n // buckets)
+    padded = np.full(size * buckets, np.nan)
+    padded[:n] = y
+    padded = padded.reshape(buckets, size)
+    finite = np.isfinite(padded)
+    start = np.arange(buckets) * size
+    low = np.where(finite, padded, np.inf).argmin(axis=1)
+    high = np.where(finite, padded, -np.inf).argmax(axis=1)
+    index = np.concatenate([start, start + low, start + high, start + size - 1])
+    return np.unique(np.minimum(index, n - 1))
+
+
+def lttb(x: np.ndarray, y: np.ndarray, points: int = WIDTH) -> np.ndarray:
+    """
+    Returns the indices of `points` points chosen by Largest-Triangle-Three-Buckets:
+    the first and last point, and in every bucket between them the one making
+    the largest triangle with the previous choice and the mean of the next bucket.
+    """
+    n = len(y)
+    if points >= n or points < 3:
+        return np.arange(n)
+    x = np.asarray(x, dtype=float)
+    y = np.nan_to_num(np.asarray(y, dtype=float))
+    edges = np.linspace(1, n - 1, points - 1).astype(np.int64)
+    # Mean of every bucket, the last point standing for the bucket after the last one
+    counts = np.diff(edges)
+    mean_x = np.append(np.add.reduceat(x[:-1], edges[:-1])[:len(counts)] / counts, x[-1])
+    mean_y = np.append(np.add.reduceat(y[:-1], edges[:-1])[:len(counts)] / counts, y[-1])
+
+    selected = np.empty(points, dtype=np.int64)
+    selected[0], selected[-1] = 0, n - 1
+    a = 0
+    for i in range(points - 2):
+        lo, hi = edges[i], edges[i + 1]
+        area = np.abs((x[a] - mean_x[i + 1]) * (y[lo:hi] - y[a]) - (x[a] - x[lo:hi]) * (mean_y[i + 1] - y[a]))
+        a = lo + int(np.argmax(area))
+        selected[i + 1] = a
+    return selected
+
+
+def rolling_band(x: np.ndarray, window: int):
+    """
+    Returns the rolling mean and (sample) std of x over window, NaN until full.
+    """
+    offset = np.nanmean(x)
+    total, square = rolling_sums(x - offset, [window])
+    mean = total[0] / window
+    std = np.sqrt(np.maximum((square[0] - total[0] * mean) / (window - 1), 0))
+    return mean + offset, std
+
+
+def positions(time_column: np.ndarray, fills: List[tuple], products: List[str]) -> Dict[str, np.ndarray]:
+    """
+    Returns the position in every product after every tick.
+    """
+    result = {}
+    for product in products:
+        product_fills = [(t, quantity) for t, symbol, _, quantity in fills if symbol == product]
+        if not product_fills:
+            continue
+        times, quantities = np.array(product_fills).T
+        change = np.zeros(len(time_column))
+        np.add.at(change, np.searchsorted(time_column, times), quantities)
+        result[product] = np.cumsum(change)
+    return result
+
+
+class DayView:
+    """
+    The panels of a figure, as full resolution series downsampled on demand:
+    one panel per product (mid and our fills), one per spread (with its
+    short mean and the band the strategy enters on when that mean leaves it),
+    one per spread z-score and one of positions.
+    """
+
+    def __init__(self, columns: np.ndarray, products: List[str] = None, fills: List[tuple] = None,
+                 method: str = "minmax", width: int = WIDTH) -> None:
+        names = [name for name in columns.dtype.names if name != "time"]
+        self.time = np.ascontiguousarray(columns["time"])
+        self.products = products or names
+        self.fills = fills or []
+        self.method = method
+        self.width = width
+        # panel -> {line: y}, and the horizontal levels drawn on a panel
+        self.panels: Dict[str, Dict[str, np.ndarray]] = {}
+        self.levels: Dict[str, List[float]] = {}
+
+        for product in self.products:
+            self.panels[product] = {"mid": np.ascontiguousarray(columns[product])}
+        for name, weights in SPREADS.items():
+            if not all(product in names for product in weights):
+                continue
+            long, short, threshold = CURRENT[name]
+            legs = [np.ascontiguousarray(columns[product]) for product in weights]
+            spread = np.asarray(basket_spread(*legs, weights=list(weights.values())))
+            mean, std = rolling_band(spread, long)
+            # The strategy enters when the short mean, not the spread itself, leaves the band
+            short_mean, _ = rolling_band(spread, short)
+            self.panels[name] = {"spread": spread, f"mean {short}": short_mean,
+                                 "upper": mean + threshold * std, "lower": mean - threshold * std}
+            self.panels[f"{name} z"] = {"z": np.asarray(rolling_zscore(spread, long=long, short=short))}
+            self.levels[f"{name} z"] = [-threshold, 0.0, threshold]
+        held = positions(self.time, self.fills, self.products)
+        if held:
+            self.panels["position"] = held
+
+    def bounds(self, start: float = None, end: float = None):
+        """
+        Returns the slice of ticks covering [start, end], one tick wider on both sides.
+        """
+        lo = 0 if start is None else max(int(np.searchsorted(self.time, start)) - 1, 0)
+        hi = len(self.time) if end is None else min(int(np.searchsorted(self.time, end, side="right")) + 1, len(self.time))
+        return lo, hi
+
+    def window(self, start: float = None, end: float = None) -> Dict[str, Dict[str, tuple]]:
+        """
+        Returns panel -> line -> (x, y) downsampled to the window.
+        """
+        lo, hi = self.bounds(start, end)
+        x = self.time[lo:hi]
+        result = {}
+        for panel, lines in self.panels.items():
+            result[panel] = {}
+            for line, y in lines.items():
+                y = y[lo:hi]
+                index = lttb(x, y, self.width) if self.method == "lttb" else minmax(y, self.width)
+                result[panel][line] = (x[index], y[index])
+        return result
+
+    def fill_points(self, product: str):
+        """
+        Returns (buy times, buy prices, sell times, sell prices) of our fills.
+        """
+        buys = [(t, price) for t, symbol, price, quantity in self.fills if symbol == product and quantity > 0]
+        sells = [(t, price) for t, symbol, price, quantity in self.fills if symbol == product and quantity < 0]
+        buys, sells = np.array(buys).reshape(-1, 2), np.array(sells).reshape(-1, 2)
+        return buys[:, 0], buys[:, 1], sells[:, 0], sells[:, 1]
+
+    def draw(self, start: float = None, end: float = None):
+        """
+        Returns a matplotlib figure of the window that re-downsamples on zoom.
+        """
+        if plt is None:
+            raise ImportError("matplotlib is needed to draw, install it with pip install matplotlib")
+        panels = list(self.panels)
+        figure, axes = plt.subplots(len(panels), 1, sharex=True, figsize=(16, 2.2 * len(panels)), squeeze=False)
+        axes = axes[:, 0]
+        artists = {}
+        for ax, (panel, lines) in zip(axes, self.window(start, end).items()):
+            for line, (x, y) in lines.items():
+                artists[panel, line] = ax.plot(x, y, linewidth=0.8, label=line)[0]
+            for level in self.levels.get(panel, []):
+                ax.axhline(level, color="grey", linewidth=0.6, linestyle="--")
+            if panel in self.products:
+                buy_x, buy_y, sell_x, sell_y = self.fill_points(panel)
+                ax.scatter(buy_x, buy_y, marker="^", color="green", s=12, zorder=3, label="buy")
+                ax.scatter(sell_x, sell_y, marker="v", color="red", s=12, zorder=3, label="sell")
+            ax.set_ylabel(panel)
+            ax.legend(loc="upper left", fontsize="small")
+        if start is not None or end is not None:
+            axes[0].set_xlim(start if start is not None else self.time[0], end if end is not None else self.time[-1])
+
+        def on_zoom(ax):
+            for panel, lines in self.window(*ax.get_xlim()).items():
+                for line, (x, y) in lines.items():
+                    artists[panel, line].set_data(x, y)
+            figure.canvas.draw_idle()
+
+        # Shared x axes all change together, one callback redraws every panel
+        axes[0].callbacks.connect("xlim_changed", on_zoom)
+        figure.tight_layout()
+        return figure
+
+
+def trader_fills(trader_path: str, paths: List[str]) -> List[tuple]:
+    """
+    Returns the fills of a Trader replayed over the days, on the time axis of load_columns.
+    """
+    with silenced():
+        module = load_module(trader_path)
+    first = min(parse_name(path)["day"] for path in paths)
+    fills = []
+    for path in paths:
+        offset = (parse_name(path)["day"] - first) * DAY_LENGTH
+        with silenced():
+            trader = module.Trader()
+        result = Backtest(trader, load_day(path)).run()
+        fills += [(timestamp + offset, product, price, quantity) for timestamp, product, price, quantity in result.fills]
+    return fills
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[1])
+    parser.add_argument("prices", nargs="+", help="prices files")
+    parser.add_argument("--trader", help="Trader file whose fills and positions are shown")
+    parser.add_argument("--products", nargs="*", help="products shown, all by default")
+    parser.add_argument("--start", type=float, default=None)
+    parser.add_argument("--end", type=float, default=None)
+    parser.add_argument("--method", choices=["minmax", "lttb"], default="minmax")
+    parser.add_argument("--width", type=int, default=WIDTH, help="pixel buckets")
+    parser.add_argument("--out", help="image file written instead of showing the figure")
+    args = parser.parse_args()
+
+    columns = load_columns(args.prices)
+    fills = trader_fills(args.trader, args.prices) if args.trader else []
+    view = DayView(columns, args.products, fills, args.method, args.width)
+
+    start = time.perf_counter()
+    window = view.window(args.start, args.end)
+    elapsed = time.perf_counter() - start
+    points = sum(len(x) for lines in window.values() for x, _ in lines.values())
+    print(f"{len(view.time)} ticks, {len(view.panels)} panels downsampled to {points} points in {elapsed * 1e3:.1f}ms")
+
+    if plt is None:
+        print("matplotlib is not installed, nothing drawn")
+        return
+    figure = view.draw(args.start, args.end)
+    if args.out:
+        figure.savefig(args.out, dpi=100)
+        print(f"Written to {args.out}")
+    else:
+        plt.show()
+
+
+if __name__ == "__main__":
+    main()
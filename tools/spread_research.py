@@ -0,0 +1,196 @@
+"""
+Whole-day research on the GIFT_BASKET and COCONUT spreads.
+
+The strategies trade z = (mean(spread, short) - mean(spread, long)) / std(spread, long)
+against a threshold (88/8/1.9 for gifts, 40/4/2 for coconuts). Instead of
+replaying the Trader, this computes z for a whole grid of (long, short)
+windows at once from cumulative sums and reports, per pair:
+
+    entries: number of times |z| crosses the threshold
+    hit_rate: share of entries where the spread moved our way after `horizon` ticks
+    reversion_p10/p50/p90: ticks until z crosses back through 0
+    unreverted: share of entries where z never came back within the day
+
+Usage: python tools/spread_research.py [threshold] [horizon]
+"""
+import sys
+import warnings
+from typing import Dict, List
+
+import numpy as np
+import pandas as pd
+
+from data import load_prices, mid_prices, prices_files
+from indicators import cache
+
+# spread name -> {product: weight}, same coefficients as COEF in the Traders
+SPREADS = {
+    "GIFT_SPREAD": {"GIFT_BASKET": 1, "CHOCOLATE": -4, "STRAWBERRIES": -6, "ROSES": -1},
+    "COCONUT_SPREAD": {"COCONUT": 1, "COCONUT_COUPON": -2},
+}
+
+# Current configuration of the Traders: (long window, short window, threshold)
+CURRENT = {
+    "GIFT_SPREAD": (88, 8, 1.9),
+    "COCONUT_SPREAD": (40, 4, 2),
+}
+
+LONG_WINDOWS = sorted(set(range(20, 301, 10)) | {long for long, _, _ in CURRENT.values()})
+SHORT_WINDOWS = list(range(1, 21))
+
+
+def spread_series(mids: pd.DataFrame, weights: Dict[str, int]) -> np.ndarray:
+    """
+    Returns the spread of one day, or None if a leg is missing from the data.
+    """
+    if any(product not in mids for product in weights):
+        return None
+    spread = np.zeros(len(mids))
+    for product, weight in weights.items():
+        spread += weight * mids[product].to_numpy(dtype=float)
+    return spread
+
+
+def rolling_sums(x: np.ndarray, windows: List[int]):
+    """
+    Returns (sum, sum of squares) over every window as arrays of shape
+    (len(windows), len(x)), NaN until the window is full.
+    """
+    n = len(x)
+    windows = np.asarray(windows)
+    s1 = np.concatenate([[0.0], np.cumsum(x)])
+    s2 = np.concatenate([[0.0], np.cumsum(x * x)])
+    end = np.arange(1, n + 1)
+    start = end[None, :] - windows[:, None]
+    valid = start >= 0
+    start = np.maximum(start, 0)
+    sums = np.where(valid, s1[end][None, :] - s1[start], np.nan)
+    squares = np.where(valid, s2[end][None, :] - s2[start], np.nan)
+    return sums, squares
+
+
+def zscore_grid(x: np.ndarray, long_windows: List[int], short_windows: List[int]) -> np.ndarray:
+    """
+    Returns z of shape (len(long_windows), len(short_windows), len(x)),
+    matching pandas rolling mean and (sample) std.
+    """
+    # Shifting by the mean keeps the cumulative sums well conditioned
+    x = x - np.mean(x)
+    long = np.asarray(long_windows, dtype=float)[:, None]
+    long_sum, long_square = rolling_sums(x, long_windows)
+    mean = long_sum / long
+    var = (long_square - long_sum * mean) / (long - 1)
+    std = np.sqrt(np.maximum(var, 0))
+
+    short_sum, _ = rolling_sums(x, short_windows)
+    short_mean = short_sum / np.asarray(short_windows, dtype=float)[:, None]
+
+    with np.errstate(divide="ignore", invalid="ignore"):
+        return (short_mean[None, :, :] - mean[:, None, :]) / std[:, None, :]
+
+
+cached_zscore_grid = cache.cached(zscore_grid)
+
+
+def _next_index(mask: np.ndarray) -> np.ndarray:
+    """
+    Returns for every position the first index at or after it where mask holds
+    (len if never), along the last axis.
+    """
+    n = mask.shape[-1]
+    index = np.where(mask, np.arange(n), n)
+    return np.minimum.accumulate(index[..., ::-1], axis=-1)[..., ::-1]
+
+
+def evaluate(x: np.ndarray, z: np.ndarray, threshold: float, horizon: int):
+    """
+    Returns entries, hits, reversion times (NaN where not an entry, inf when
+    never reverted) for every (long, short) pair of one day.
+    """
+    n = len(x)
+    above = np.nan_to_num(z, nan=0.0) > threshold
+    below = np.nan_to_num(z, nan=0.0) < -threshold
+    entry_short = above & ~np.concatenate([np.zeros_like(above[..., :1]), above[..., :-1]], axis=-1)
+    entry_long = below & ~np.concatenate([np.zeros_like(below[..., :1]), below[..., :-1]], axis=-1)
+    entries = entry_short | entry_long
+
+    # Short the spread when z is high, long when z is low
+    direction = np.where(entry_short, -1.0, np.where(entry_long, 1.0, 0.0))
+    future = np.full(n, np.nan)
+    future[:n - horizon] = x[horizon:] - x[:n - horizon]
+    hits = entries & (direction * future > 0)
+
+    index = np.arange(n)
+    next_nonpositive = _next_index(z <= 0)
+    next_nonnegative = _next_index(z >= 0)
+    crossing = np.where(entry_short, next_nonpositive, next_nonnegative)
+    reversion = np.where(entries, crossing - index, np.nan)
+    reversion[entries & (crossing >= n)] = np.inf
+    return entries, hits, reversion
+
+
+def research(spread_days: List[np.ndarray], threshold: float, horizon: int,
+             long_windows: List[int] = LONG_WINDOWS, short_windows: List[int] = SHORT_WINDOWS) -> pd.DataFrame:
+    """
+    Returns the statistics of every (long, short) pair over all days.
+    """
+    entries = hits = 0
+    reversions = []
+    for x in spread_days:
+        z = cached_zscore_grid(
+            x, long_windows=long_windows, short_windows=short_windows)
+        day_entries, day_hits, reversion = evaluate(x, z, threshold, horizon)
+        entries = entries + day_entries.sum(axis=-1)
+        hits = hits + day_hits.sum(axis=-1)
+        reversions.append(reversion.astype(np.float32))
+    reversion = np.concatenate(reversions, axis=-1)
+
+    finite = np.where(np.isinf(reversion), np.nan, reversion)
+    with np.errstate(invalid="ignore", divide="ignore"), warnings.catch_warnings():
+        # Pairs without any entry have all-NaN reversion times
+        warnings.simplefilter("ignore", RuntimeWarning)
+        p10, p50, p90 = np.nanpercentile(finite, [10, 50, 90], axis=-1)
+        unreverted = np.isinf(reversion).sum(axis=-1) / entries
+
+    long, short = np.meshgrid(long_windows, short_windows, indexing="ij")
+    with np.errstate(invalid="ignore", divide="ignore"):
+        hit_rate = hits / entries
+    return pd.DataFrame({
+        "long": long.ravel(),
+        "short": short.ravel(),
+        "entries": entries.ravel(),
+        "hit_rate": hit_rate.ravel(),
+        "reversion_p10": p10.ravel(),
+        "reversion_p50": p50.ravel(),
+        "reversion_p90": p90.ravel(),
+        "unreverted": unreverted.ravel(),
+    })
+
+
+def main():
+    threshold = float(sys.argv[1]) if len(sys.argv) > 1 else None
+    horizon = int(sys.argv[2]) if len(sys.argv) > 2 else 50
+
+    days = [mid_prices(load_prices(path)) for path in prices_files()]
+    for name, weights in SPREADS.items():
+        spread_days = [spread_series(mids, weights) for mids in days]
+        spread_days = [x for x in spread_days if x is not None]
+        if not spread_days:
+            print(f"{name}: no data bottle has all of {list(weights)}")
+            continue
+
+        long, short, current_threshold = CURRENT[name]
+        stats = research(spread_days, threshold or current_threshold, horizon)
+        current = stats[(stats["long"] == long) & (stats["short"] == short)]
+        best = stats[stats["entries"] >= 30].sort_values("hit_rate", ascending=False)
+
+        print(f"{name} over {len(spread_days)} days, threshold {threshold or current_threshold}, horizon {horizon}")
+        with pd.option_context("display.width", 200):
+            print("Current:")
+            print(current.round(3).to_string(index=False))
+            print("Best:")
+            print(best.head(15).round(3).to_string(index=False))
+
+
+if __name__ == "__main__":
+    main()
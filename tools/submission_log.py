@@ -0,0 +1,469 @@
+"""
+Streaming parser and deterministic replay of the logs returned after an upload.
+
+A submission log has three sections, one after the other:
+
+    Sandbox logs:    one JSON object per tick with the Trader's prints (lambdaLog)
+    Activities log:  the order book rows, in the prices bottle format
+    Trade History:   a JSON array of every trade, ours having SUBMISSION as buyer
+                     or seller, written with a trailing comma after the last field
+
+The sections are located with one memory-mapped search for their headers and
+then read in lockstep through independent file handles, so memory stays
+constant whatever the size of the log. The JSON sections are read in
+CHUNK_SIZE slices, from which json.JSONDecoder.raw_decode takes one record at
+a time; a record cut by the end of a slice is decoded again with the next one.
+
+replay() rebuilds the TradingState of every tick (book, market trades, own
+trades, positions), runs a local Trader on it and reports where it diverges
+from the submission: different prints, own trades the local orders cannot
+explain, and local orders crossing the book that did not trade.
+
+The log does not carry the observations nor the traderData the submission
+received. When the Trader printed its state with the visualizer's Logger
+(lambdaLog being the JSON array [state, orders, conversions, traderData,
+logs]), both are read from it and the local traderData is checked against
+it. Otherwise the observations can be taken from a bottle's observations
+file and the local Trader's own traderData is passed on.
+
+write_log() writes the log of a Backtest in the same format, for fixtures.
+
+Usage: python tools/submission_log.py <log file> <trader file> [max divergences] [--observations file]
+"""
+import argparse
+import codecs
+import contextlib
+import io
+import json
+import mmap
+import re
+from typing import Dict, Iterator, List, Optional
+
+from backtest import (POSITION_LIMIT, SUBMISSION, Backtest, Day, Tick, conversion_observations, datamodel,
+                      load_module, silenced)
+from data import load_observations
+
+# Bytes read at a time from the JSON sections
+CHUNK_SIZE = 1 << 20
+
+SECTIONS = {
+    b"Sandbox logs:": "sandbox",
+    b"Activities log:": "activities",
+    b"Trade History:": "trades",
+}
+
+
+def section_offsets(path: str) -> Dict[str, tuple]:
+    """
+    Returns section name -> (first byte, end byte) of its body.
+    """
+    with open(path, "rb") as file:
+        if file.seek(0, 2) == 0:
+            return {}
+        with mmap.mmap(file.fileno(), 0, access=mmap.ACCESS_READ) as data:
+            headers = []
+            for header, name in SECTIONS.items():
+                # A header starts a line; newlines inside the JSON strings are escaped
+                if data[:len(header)] == header:
+                    position = 0
+                else:
+                    position = data.find(b"\n" + header)
+                    if position < 0:
+                        continue
+                    position += 1
+                body = data.find(b"\n", position)
+                headers.append((position, len(data) if body < 0 else body + 1, name))
+            headers.sort()
+            return {name: (body, headers[i + 1][0] if i + 1 < len(headers) else len(data))
+                    for i, (_, body, name) in enumerate(headers)}
+
+
+def _lines(path: str, span: tuple) -> Iterator[str]:
+    start, end = span
+    with open(path, "rb") as file:
+        file.seek(start)
+        while file.tell() < end:
+            line = file.readline()
+            if not line:
+                break
+            yield line.decode()
+
+
+def _chunks(path: str, span: tuple, size: int) -> Iterator[str]:
+    start, end = span
+    decoder = codecs.getincrementaldecoder("utf-8")()
+    with open(path, "rb") as file:
+        file.seek(start)
+        remaining = end - start
+        while remaining > 0:
+            data = file.read(min(size, remaining))
+            if not data:
+                break
+            remaining -= len(data)
+            yield decoder.decode(data)
+    yield decoder.decode(b"", final=True)
+
+
+# Whitespace and the array punctuation between records
+_SEPARATORS = re.compile(r"[\s,\[\]]*")
+_TRAILING_COMMA = re.compile(r",(\s*[}\]])")
+
+
+def _json_objects(chunks: Iterator[str], trailing_commas: bool = False) -> Iterator[dict]:
+    """
+    Yields the top level objects of a stream of JSON text (bare or in an
+    array), holding one slice and at most one partial record in memory.
+    """
+    decoder = json.JSONDecoder()
+    text, position, more = "", 0, True
+    while True:
+        position = _SEPARATORS.match(text, position).end()
+        if position < len(text):
+            try:
+                record, position = decoder.raw_decode(text, position)
+            except json.JSONDecodeError:
+                # Cut by the end of the slice, unless there is nothing left to read
+                if not more:
+                    raise
+            else:
+                yield record
+                continue
+        elif not more:
+            return
+        chunk = next(chunks, None)
+        if chunk is None:
+            more = False
+            continue
+        text = text[position:] + chunk
+        position = 0
+        if trailing_commas:
+            text = _TRAILING_COMMA.sub(r"\1", text)
+
+
+def iter_sandbox(path: str, offsets, chunk_size: int = CHUNK_SIZE) -> Iterator[dict]:
+    if "sandbox" in offsets:
+        yield from _json_objects(_chunks(path, offsets["sandbox"], chunk_size))
+
+
+def iter_trades(path: str, offsets, chunk_size: int = CHUNK_SIZE) -> Iterator[dict]:
+    if "trades" in offsets:
+        yield from _json_objects(_chunks(path, offsets["trades"], chunk_size), trailing_commas=True)
+
+
+def iter_activities(path: str, offsets) -> Iterator[tuple]:
+    """
+    Yields (timestamp, [row dicts]) grouped by timestamp.
+    """
+    if "activities" not in offsets:
+        return
+    header = None
+    timestamp, rows = None, []
+    for line in _lines(path, offsets["activities"]):
+        line = line.strip()
+        if not line:
+            continue
+        values = line.split(";")
+        if header is None:
+            header = values
+            continue
+        row = dict(zip(header, values))
+        if int(row["timestamp"]) != timestamp:
+            if rows:
+                yield timestamp, rows
+            timestamp, rows = int(row["timestamp"]), []
+        rows.append(row)
+    if rows:
+        yield timestamp, rows
+
+
+def _number(value: str):
+    return float(value) if value != "" else None
+
+
+def make_tick(timestamp: int, rows: List[dict]) -> Tick:
+    tick = Tick(timestamp)
+    for row in rows:
+        buy_orders, sell_orders = {}, {}
+        for level in (1, 2, 3):
+            price = _number(row.get(f"bid_price_{level}", ""))
+            if price is not None:
+                buy_orders[int(price)] = int(_number(row[f"bid_volume_{level}"]))
+            price = _number(row.get(f"ask_price_{level}", ""))
+            if price is not None:
+                sell_orders[int(price)] = -int(_number(row[f"ask_volume_{level}"]))
+        tick.depths[row["product"]] = (buy_orders, sell_orders)
+        mid = _number(row.get("mid_price", ""))
+        if mid is not None:
+            tick.mids[row["product"]] = mid
+    return tick
+
+
+class _Peekable:
+
+    def __init__(self, iterator) -> None:
+        self.iterator = iterator
+        self.head = next(iterator, None)
+
+    def pop(self):
+        head = self.head
+        self.head = next(self.iterator, None)
+        return head
+
+
+def replay_ticks(path: str, chunk_size: int = CHUNK_SIZE) -> Iterator[tuple]:
+    """
+    Yields (tick, sandbox entry, own trades executed at that tick) in order,
+    the tick carrying the market trades executed at that timestamp.
+    """
+    offsets = section_offsets(path)
+    sandbox = _Peekable(iter_sandbox(path, offsets, chunk_size))
+    trades = _Peekable(iter_trades(path, offsets, chunk_size))
+
+    for timestamp, rows in iter_activities(path, offsets):
+        tick = make_tick(timestamp, rows)
+
+        entry = None
+        while sandbox.head is not None and sandbox.head.get("timestamp", -1) <= timestamp:
+            entry = sandbox.pop()
+            if entry.get("timestamp") != timestamp:
+                entry = None
+
+        own = []
+        while trades.head is not None and trades.head["timestamp"] <= timestamp:
+            trade = trades.pop()
+            if trade["timestamp"] != timestamp:
+                continue
+            price, quantity = int(trade["price"]), int(trade["quantity"])
+            if SUBMISSION in (trade.get("buyer"), trade.get("seller")):
+                own.append(trade)
+            else:
+                tick.trades.setdefault(trade["symbol"], []).append(
+                    (price, quantity, trade.get("buyer") or "", trade.get("seller") or ""))
+        yield tick, entry, own
+
+
+def _first_difference(logged: str, local: str) -> str:
+    logged_lines = logged.rstrip("\n").split("\n")
+    local_lines = local.rstrip("\n").split("\n")
+    for i, (a, b) in enumerate(zip(logged_lines, local_lines)):
+        if a != b:
+            return f"line {i + 1}: submitted {a!r}, local {b!r}"
+    return f"submitted {len(logged_lines)} lines, local {len(local_lines)} lines"
+
+
+def check_orders(tick: Tick, orders, own: List[dict], position: Dict[str, int]) -> List[str]:
+    """
+    Returns the inconsistencies between local orders and the submission's own trades.
+    """
+    problems = []
+    for trade in own:
+        symbol, price, quantity = trade["symbol"], int(trade["price"]), int(trade["quantity"])
+        if trade.get("buyer") == SUBMISSION:
+            available = sum(order.quantity for order in orders.get(symbol, []) if order.quantity > 0 and order.price >= price)
+            side = "bought"
+        else:
+            available = -sum(order.quantity for order in orders.get(symbol, []) if order.quantity < 0 and order.price <= price)
+            side = "sold"
+        if available < quantity:
+            problems.append(f"submission {side} {quantity}x {symbol} at {price}, local orders only allow {available}")
+
+    traded = {(trade["symbol"], trade.get("buyer") == SUBMISSION) for trade in own}
+    for symbol, symbol_orders in orders.items():
+        # Orders that could breach the limit are all rejected by the exchange
+        limit = POSITION_LIMIT.get(symbol, 0)
+        total_buy = sum(order.quantity for order in symbol_orders if order.quantity > 0)
+        total_sell = -sum(order.quantity for order in symbol_orders if order.quantity < 0)
+        if position.get(symbol, 0) + total_buy > limit or position.get(symbol, 0) - total_sell < -limit:
+            continue
+        buy_orders, sell_orders = tick.depths.get(symbol, ({}, {}))
+        for order in symbol_orders:
+            if order.quantity > 0 and sell_orders and order.price >= min(sell_orders) and (symbol, True) not in traded:
+                problems.append(f"local buy {order.quantity}x {symbol} at {order.price} crosses ask {min(sell_orders)} but submission did not buy")
+            if order.quantity < 0 and buy_orders and order.price <= max(buy_orders) and (symbol, False) not in traded:
+                problems.append(f"local sell {-order.quantity}x {symbol} at {order.price} crosses bid {max(buy_orders)} but submission did not sell")
+    return problems
+
+
+def logged_state(entry: dict) -> Optional[tuple]:
+    """
+    Returns (traderData, Observation) of the state printed by the Logger in
+    a sandbox entry, or None when the prints are not in its format.
+    """
+    log = entry.get("lambdaLog", "")
+    if not log.startswith("["):
+        return None
+    try:
+        state = json.loads(log)[0]
+        trader_data, (plain, conversions) = state[1], state[7]
+        observation = datamodel.Observation(plain, {
+            product: datamodel.ConversionObservation(*values) for product, values in conversions.items()})
+    except (ValueError, TypeError, IndexError, AttributeError):
+        return None
+    if not isinstance(trader_data, str):
+        return None
+    return trader_data, observation
+
+
+def replay(path: str, trader, max_divergences: int = 50, observations_path: str = None,
+           chunk_size: int = CHUNK_SIZE) -> dict:
+    """
+    Replays a submission log through trader and returns a report.
+    """
+    observations = conversion_observations(load_observations(observations_path)) if observations_path else None
+    backtest = Backtest(trader, Day(0, 0, [], []))
+    position: Dict[str, int] = {}
+    own_trades, market_trades = {}, {}
+    trader_data = ""
+    report = {"ticks": 0, "log_mismatches": 0, "order_mismatches": 0, "trader_data_mismatches": 0, "errors": 0,
+              "divergences": []}
+
+    def diverge(timestamp, kind, detail):
+        if len(report["divergences"]) < max_divergences:
+            report["divergences"].append((timestamp, kind, detail))
+
+    for tick, entry, own in replay_ticks(path, chunk_size):
+        logged = logged_state(entry) if entry is not None else None
+        if logged is not None:
+            logged_data, tick.observation = logged
+            # The Logger cuts long strings, ending them with "..."
+            truncated = logged_data.endswith("...")
+            if not (trader_data.startswith(logged_data[:-3]) if truncated else trader_data == logged_data):
+                report["trader_data_mismatches"] += 1
+                diverge(tick.timestamp, "data", f"submitted traderData {logged_data[:80]!r}, local {trader_data[:80]!r}")
+            if not truncated:
+                trader_data = logged_data
+        elif observations is not None:
+            tick.observation = observations.get(tick.timestamp)
+        state = backtest.make_state(tick, trader_data, own_trades, market_trades, position)
+
+        output = io.StringIO()
+        with silenced(), contextlib.redirect_stdout(output):
+            try:
+                orders, _, trader_data = trader.run(state)
+            except Exception as e:
+                orders = {}
+                report["errors"] += 1
+                diverge(tick.timestamp, "error", repr(e))
+        orders = orders or {}
+        report["ticks"] += 1
+
+        if entry is not None:
+            logged, local = entry.get("lambdaLog", ""), output.getvalue()
+            # The platform truncates long logs
+            if logged.rstrip() != local[:len(logged)].rstrip():
+                report["log_mismatches"] += 1
+                diverge(tick.timestamp, "log", _first_difference(logged, local))
+
+        problems = check_orders(tick, orders, own, position)
+        if problems:
+            report["order_mismatches"] += 1
+            for problem in problems:
+                diverge(tick.timestamp, "orders", problem)
+
+        # What the submission saw on the next tick
+        own_trades = {}
+        for trade in own:
+            quantity = int(trade["quantity"])
+            sign = 1 if trade.get("buyer") == SUBMISSION else -1
+            position[trade["symbol"]] = position.get(trade["symbol"], 0) + sign * quantity
+            own_trades.setdefault(trade["symbol"], []).append(datamodel.Trade(
+                trade["symbol"], int(trade["price"]), quantity, trade.get("buyer") or "", trade.get("seller") or "", tick.timestamp))
+        market_trades = {
+            symbol: [datamodel.Trade(symbol, price, quantity, buyer, seller, tick.timestamp)
+                     for price, quantity, buyer, seller in trades]
+            for symbol, trades in tick.trades.items()
+        }
+
+    report["final_position"] = position
+    return report
+
+
+ACTIVITY_COLUMNS = ["day", "timestamp", "product"] + [
+    f"{side}_{field}_{level}" for side in ("bid", "ask") for level in (1, 2, 3) for field in ("price", "volume")
+] + ["mid_price", "profit_and_loss"]
+
+
+def _trade_record(timestamp: int, buyer: str, seller: str, symbol: str, price, quantity: int) -> str:
+    fields = {"timestamp": timestamp, "buyer": buyer, "seller": seller, "symbol": symbol,
+              "currency": "SEASHELLS", "price": price, "quantity": quantity}
+    # As the platform writes them, with a comma after the last field
+    return "  {\n" + "".join(f"    {json.dumps(key)}: {json.dumps(value)},\n" for key, value in fields.items()) + "  }"
+
+
+def write_log(path: str, trader, day: Day, max_ticks: int = None):
+    """
+    Writes the submission log of a Backtest of trader over day.
+    """
+    day = Day(day.round, day.day, day.ticks[:max_ticks], day.products)
+    prints = []
+    run = trader.run
+
+    def printing_run(state):
+        output = io.StringIO()
+        try:
+            with contextlib.redirect_stdout(output):
+                return run(state)
+        finally:
+            prints.append(output.getvalue())
+
+    trader.run = printing_run
+    try:
+        result = Backtest(trader, day).run()
+    finally:
+        del trader.run
+
+    fills: Dict[int, List[tuple]] = {}
+    for timestamp, product, price, quantity in result.fills:
+        fills.setdefault(timestamp, []).append((product, price, quantity))
+
+    with open(path, "w", encoding="utf-8") as file:
+        file.write("Sandbox logs:\n")
+        for tick, log in zip(day.ticks, prints):
+            file.write(json.dumps({"sandboxLog": "", "lambdaLog": log, "timestamp": tick.timestamp}, indent=2,
+                                  ensure_ascii=False) + "\n")
+
+        file.write("\n\n\nActivities log:\n" + ";".join(ACTIVITY_COLUMNS) + "\n")
+        for tick, pnl in zip(day.ticks, result.product_pnl_history):
+            for product in sorted(tick.depths):
+                buy_orders, sell_orders = tick.depths[product]
+                row = [day.day, tick.timestamp, product]
+                for levels, sign in ((sorted(buy_orders.items(), reverse=True), 1), (sorted(sell_orders.items()), -1)):
+                    for level in range(3):
+                        row += [levels[level][0], sign * levels[level][1]] if level < len(levels) else ["", ""]
+                row += [tick.mids.get(product, ""), pnl.get(product, 0.0)]
+                file.write(";".join(str(value) for value in row) + "\n")
+
+        records = []
+        for tick in day.ticks:
+            for symbol, trades in tick.trades.items():
+                for price, quantity, buyer, seller in trades:
+                    records.append(_trade_record(tick.timestamp, buyer, seller, symbol, price, quantity))
+            for product, price, quantity in fills.get(tick.timestamp, []):
+                buyer, seller = (SUBMISSION, "") if quantity > 0 else ("", SUBMISSION)
+                records.append(_trade_record(tick.timestamp, buyer, seller, product, price, abs(quantity)))
+        file.write("\n\n\n\nTrade History:\n[\n" + ",\n".join(records) + "\n]\n")
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[1])
+    parser.add_argument("log", help="submission log")
+    parser.add_argument("trader", help="Trader file replayed")
+    parser.add_argument("max_divergences", type=int, nargs="?", default=50, help="divergences printed")
+    parser.add_argument("--observations", default=None,
+                        help="observations file of the day, when the log does not carry them")
+    args = parser.parse_args()
+
+    with silenced():
+        trader = load_module(args.trader).Trader()
+    report = replay(args.log, trader, args.max_divergences, args.observations)
+
+    print(f"Replayed {report['ticks']} ticks: {report['log_mismatches']} ticks with different prints, "
+          f"{report['order_mismatches']} ticks with inconsistent orders, "
+          f"{report['trader_data_mismatches']} ticks with a different traderData, {report['errors']} errors")
+    print(f"Final position {report['final_position']}")
+    for timestamp, kind, detail in report["divergences"]:
+        print(f"{timestamp:>8} {kind:<7} {detail}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,470 @@
+"""
+Synthetic order book days calibrated to the data bottles.
+
+MarketModel() estimates, per product, from the prices and trades bottles:
+
+    mid dynamics   a random walk of the mid in half ticks. Whether the mid is
+                   whole or ends in .5 (an even or odd top spread) is a two
+                   state Markov chain, and every mid change is drawn from the
+                   empirical changes of the same transition. The bid/ask
+                   bounce is kept by the signs: every nonzero change reverses
+                   the previous one with the empirical probability for the
+                   parities of both changes and whether they are on
+                   consecutive ticks.
+    book shape     empirical distributions of the top spread given that
+                   parity, whether levels 2 and 3 are present, their
+                   distance to the level above and the volume of every level
+    trades         arrival rate per tick, quantity and price offset from mid
+
+and for every spread of spread_research.SPREADS whose legs are all in the
+data, an AR(1) fit of the spread (the basket cointegration residual): the
+first leg is then generated as the weighted sum of the others plus that
+residual instead of walking on its own.
+
+generate_day() draws a whole day with array operations only, and returns the
+prices and trades tables in the bottle columns. They can be replayed with
+backtest.decode_day or written as prices_round_R_day_D.csv /
+trades_round_R_day_D.csv files.
+
+Scope: on one core it generates about 0.7 million timestamps, 2.9 million
+product book rows, per second (round 3, four products). It reproduces the
+statistics summary() compares: the mid change spread and lag-1
+autocorrelation, the top spread and the trade rate. It does not reproduce
+intraday seasonality, a drift of the mid, correlation between book volumes
+or trades and the next mid changes, nor the names of the trading bots.
+
+Usage: python tools/synthetic.py [days] [output directory]
+"""
+import os
+import sys
+import time
+from typing import Dict, List
+
+import numpy as np
+import pandas as pd
+
+from backtest import decode_day, find_trades_file
+from data import load_prices, load_trades, mid_prices, parse_name, prices_files
+from spread_research import SPREADS
+
+TICKS_PER_DAY = 10_000
+TIMESTAMP_STEP = 100
+
+# First day number of synthetic files, far from the real ones
+FIRST_DAY = 100
+
+# log2 of the size of the guide table of every Distribution
+GUIDE_BITS = 16
+
+PRICES_COLUMNS = ["day", "timestamp", "product"]
+for _side in ("bid", "ask"):
+    for _level in (1, 2, 3):
+        PRICES_COLUMNS += [f"{_side}_price_{_level}", f"{_side}_volume_{_level}"]
+PRICES_COLUMNS += ["mid_price", "profit_and_loss"]
+TRADES_COLUMNS = ["timestamp", "buyer", "seller", "symbol", "currency", "price", "quantity"]
+
+
+class Distribution:
+    """
+    Empirical distribution of integer values, sampled by inverting its CDF
+    through a guide table. A uniform GUIDE_BITS bit draw picks a bucket of
+    the unit interval; almost every bucket covers a single value, and only
+    draws in the few buckets straddling a step of the CDF get more bits and
+    a binary search.
+    """
+
+    def __init__(self, values) -> None:
+        values = np.asarray(values)
+        values = values[~np.isnan(values)] if values.dtype.kind == "f" else values
+        if len(values) == 0:
+            values = np.zeros(1)
+        self.values, counts = np.unique(np.round(values).astype(np.int64), return_counts=True)
+        self.probabilities = counts / counts.sum()
+        self.cdf = np.cumsum(counts) / counts.sum()
+
+        buckets = np.arange(1 << GUIDE_BITS)
+        first = self.index(buckets, 0)
+        last = self.index(buckets, (1 << GUIDE_BITS) - 1)
+        # Buckets covering two values or more hold a value that cannot be drawn
+        self.missing = self.values[0] - 1
+        self.guide = np.where(first == last, self.values[first], self.missing).astype(np.int32)
+
+    def index(self, buckets: np.ndarray, low) -> np.ndarray:
+        """
+        Returns the index of the value drawn by the uniform 2 * GUIDE_BITS
+        bit integers of the given high and low halves.
+        """
+        u = (buckets.astype(np.float64) * (1 << GUIDE_BITS) + low) / 2.0 ** (2 * GUIDE_BITS)
+        return np.minimum(np.searchsorted(self.cdf, u, side="right"), len(self.values) - 1)
+
+    def mean(self) -> float:
+        return float(self.values @ self.probabilities)
+
+    def sample(self, rng: np.random.Generator, n) -> np.ndarray:
+        """
+        Returns n (an int or a shape) samples.
+        """
+        buckets = rng.integers(0, 1 << GUIDE_BITS, n, dtype=np.uint16)
+        drawn = self.guide[buckets]
+        straddling = np.flatnonzero(drawn == self.missing)
+        if len(straddling):
+            flat = drawn.reshape(-1)
+            low = rng.integers(0, 1 << GUIDE_BITS, len(straddling))
+            flat[straddling] = self.values[self.index(buckets.reshape(-1)[straddling], low)]
+        return drawn
+
+
+class ProductModel:
+
+    def __init__(self, product: str, books: List[pd.DataFrame], tapes: List[pd.DataFrame]) -> None:
+        self.product = product
+
+        # Mid prices are handled doubled to stay integer, their parity is the
+        # parity of the top spread
+        mids = [np.round(2 * book["mid_price"].to_numpy(dtype=float)).astype(np.int64) for book in books]
+        parity = [mid % 2 for mid in mids]
+        before = np.concatenate([q[:-1] for q in parity])
+        flipped = np.concatenate([q[1:] != q[:-1] for q in parity])
+        changes = np.concatenate([np.diff(mid) for mid in mids])
+        self.flip = [float(flipped[before == q].mean()) if (before == q).any() else 0.0 for q in (0, 1)]
+        # changes[q][flip]: changes from parity q that keep (0) or flip (1) it
+        self.changes = [[Distribution(changes[(before == q) & (flipped == f)]) for f in (0, 1)] for q in (0, 1)]
+        self.odd_share = float(np.concatenate(parity).mean())
+        self.start = float(np.mean([mid[0] for mid in mids]))
+
+        # reversal[adjacent, previous odd, current odd]: probability that a
+        # nonzero change has the opposite sign of the previous nonzero one
+        reversed_count, total = np.zeros((2, 2, 2)), np.zeros((2, 2, 2))
+        for mid in mids:
+            change = np.diff(mid)
+            nonzero = np.flatnonzero(change)
+            odd = change[nonzero] & 1
+            index = ((np.diff(nonzero) == 1).astype(int), odd[:-1], odd[1:])
+            np.add.at(reversed_count, index, np.sign(change[nonzero][1:]) != np.sign(change[nonzero][:-1]))
+            np.add.at(total, index, 1)
+        with np.errstate(invalid="ignore"):
+            self.reversal = np.where(total > 0, reversed_count / total, 0.5)
+
+        book = pd.concat(books)
+        spread = (book["ask_price_1"] - book["bid_price_1"]).to_numpy(dtype=float)
+        spread = spread[~np.isnan(spread)]
+        even, odd = spread[spread % 2 == 0], spread[spread % 2 == 1]
+        self.spreads = [Distribution(even if len(even) else odd + 1), Distribution(odd if len(odd) else even + 1)]
+        self.volumes = {}
+        self.present = {}
+        self.gaps = {}
+        for level in (1, 2, 3):
+            volumes = np.concatenate([book[f"bid_volume_{level}"].to_numpy(dtype=float),
+                                      book[f"ask_volume_{level}"].to_numpy(dtype=float)])
+            self.volumes[level] = Distribution(np.abs(volumes))
+            if level > 1:
+                self.present[level] = float(np.mean(np.concatenate([
+                    book[f"bid_price_{level}"].notna().to_numpy(), book[f"ask_price_{level}"].notna().to_numpy()])))
+                self.gaps[level] = Distribution(np.concatenate([
+                    (book[f"bid_price_{level - 1}"] - book[f"bid_price_{level}"]).to_numpy(dtype=float),
+                    (book[f"ask_price_{level}"] - book[f"ask_price_{level - 1}"]).to_numpy(dtype=float)]))
+
+        # Trade prices are kept as twice the offset from the mid to stay integer
+        offsets, quantities, count = [], [], 0
+        for book, tape in zip(books, tapes):
+            tape = tape[tape["symbol"] == self.product]
+            mids = book.set_index("timestamp")["mid_price"]
+            mid = mids.reindex(tape["timestamp"]).to_numpy(dtype=float)
+            offsets.append(2 * (tape["price"].to_numpy(dtype=float) - mid))
+            quantities.append(tape["quantity"].to_numpy(dtype=float))
+            count += len(tape)
+        self.trade_rate = count / sum(len(book) for book in books)
+        self.trade_offset = Distribution(np.concatenate(offsets))
+        self.trade_quantity = Distribution(np.concatenate(quantities))
+
+    def parities(self, n: int, rng: np.random.Generator) -> np.ndarray:
+        """
+        Returns n states of the parity chain, from its run lengths.
+        """
+        first = int(rng.random() < self.odd_share)
+        # Runs alternate parity, a run of parity q lasts Geometric(flip[q]) ticks.
+        # Draw about as many runs as n ticks take, more if they fall short.
+        mean_run = sum(1 / p if p > 0 else n for p in self.flip) / 2
+        runs = 2 * int(n / mean_run * 0.55) + 16
+        while True:
+            lengths = np.empty(runs, dtype=np.int64)
+            for q in (0, 1):
+                part = lengths[(q + first) % 2::2]
+                part[:] = rng.geometric(self.flip[q], len(part)) if self.flip[q] > 0 else n
+            ends = np.cumsum(np.minimum(lengths, n))
+            if ends[-1] >= n:
+                break
+            runs *= 2
+        used = int(np.searchsorted(ends, n)) + 1
+        parity = np.repeat(np.arange(first, first + used) % 2, np.minimum(lengths[:used], n))
+        return parity[:n]
+
+    def walk(self, n: int, rng: np.random.Generator) -> np.ndarray:
+        """
+        Returns n doubled mid prices.
+        """
+        parity = self.parities(n, rng)
+        changes = np.zeros(n, dtype=np.int64)
+        before, flipped = parity[:-1], parity[1:] != parity[:-1]
+        for q in (0, 1):
+            for f in (0, 1):
+                mask = (before == q) & (flipped == f)
+                changes[1:][mask] = self.changes[q][f].sample(rng, int(mask.sum()))
+
+        # Signs follow the reversal probabilities, sizes keep their distribution
+        nonzero = np.flatnonzero(changes)
+        if len(nonzero) > 1:
+            odd = changes[nonzero] & 1
+            reverse = rng.random(len(nonzero) - 1) < self.reversal[(np.diff(nonzero) == 1).astype(int), odd[:-1], odd[1:]]
+            flips = np.concatenate([[rng.random() < 0.5], reverse]).cumsum()
+            changes[nonzero] = np.where(flips & 1, -1, 1) * np.abs(changes[nonzero])
+
+        start = int(np.round(self.start))
+        start += (start - parity[0]) % 2
+        return start + np.cumsum(changes)
+
+    def book(self, mid2: np.ndarray, rng: np.random.Generator) -> Dict[str, np.ndarray]:
+        """
+        Returns the book columns around the given (integer) doubled mid prices.
+        """
+        n = len(mid2)
+        spread = np.where(mid2 & 1, self.spreads[1].sample(rng, n), self.spreads[0].sample(rng, n))
+        bid = (mid2 - spread) / 2
+
+        # Both sides are drawn together, row 0 is the bid side and row 1 the ask side
+        price = np.stack([bid, bid + spread])
+        levels = [(price, self.volumes[1].sample(rng, (2, n)).astype(float))]
+        present = np.ones((2, n), dtype=bool)
+        for level in (2, 3):
+            present &= rng.random((2, n)) < self.present[level]
+            gap = self.gaps[level].sample(rng, (2, n))
+            price = np.stack([price[0] - gap[0], price[1] + gap[1]])
+            levels.append((np.where(present, price, np.nan), np.where(present, self.volumes[level].sample(rng, (2, n)), np.nan)))
+
+        columns = {}
+        for level, (prices, volumes) in enumerate(levels, 1):
+            for row, side in enumerate(("bid", "ask")):
+                columns[f"{side}_price_{level}"] = prices[row]
+                columns[f"{side}_volume_{level}"] = volumes[row]
+        columns["mid_price"] = mid2 / 2
+        return columns
+
+    def trades(self, mid: np.ndarray, rng: np.random.Generator):
+        """
+        Returns (tick index, price, quantity) of the market trades.
+        """
+        counts = rng.poisson(self.trade_rate, len(mid))
+        ticks = np.repeat(np.arange(len(mid)), counts)
+        price = np.round(mid[ticks] + self.trade_offset.sample(rng, len(ticks)) / 2)
+        return ticks, price, self.trade_quantity.sample(rng, len(ticks))
+
+
+def ar1(phi: float, noise: np.ndarray, x0: float = 0.0, block: int = 256) -> np.ndarray:
+    """
+    Returns x with x[t] = phi * x[t - 1] + noise[t], x[-1] = x0. Blocks are
+    solved together with one matrix product, only the carry is sequential.
+    """
+    n = len(noise)
+    blocks = -(-n // block)
+    padded = np.zeros(blocks * block)
+    padded[:n] = noise
+    lag = np.arange(block)
+    # response[i, j] = phi^(i - j) for j <= i
+    response = np.tril(phi ** np.maximum(lag[:, None] - lag[None, :], 0))
+    local = response @ padded.reshape(blocks, block).T
+    powers = phi ** (lag + 1)
+    carry = x0
+    for b in range(blocks):
+        local[:, b] += powers * carry
+        carry = local[-1, b]
+    return local.T.ravel()[:n]
+
+
+class SpreadModel:
+    """
+    AR(1) fit of a weighted spread of mid prices (the cointegration residual).
+    """
+
+    def __init__(self, name: str, weights: Dict[str, int], mids: List[pd.DataFrame]) -> None:
+        self.name = name
+        self.weights = weights
+        series = [sum(weight * day[product].to_numpy(dtype=float) for product, weight in weights.items())
+                  for day in mids]
+        self.mean = float(np.mean(np.concatenate(series)))
+        x = np.concatenate([s[:-1] for s in series]) - self.mean
+        y = np.concatenate([s[1:] for s in series]) - self.mean
+        self.phi = float(x @ y / (x @ x))
+        self.sigma = float(np.std(y - self.phi * x))
+
+    def residual(self, n: int, rng: np.random.Generator) -> np.ndarray:
+        stationary = self.sigma / np.sqrt(max(1 - self.phi ** 2, 1e-12))
+        return self.mean + ar1(self.phi, rng.normal(0, self.sigma, n), rng.normal(0, stationary))
+
+
+class MarketModel:
+    """
+    Models of every product and spread of a set of prices bottles.
+    """
+
+    def __init__(self, paths: List[str] = None) -> None:
+        paths = paths or prices_files()
+        books, tapes = {}, []
+        all_mids = []
+        for path in paths:
+            info = parse_name(path)
+            prices = load_prices(path)
+            trades_path = find_trades_file(info["round"], info["day"])
+            tapes.append(load_trades(trades_path) if trades_path else pd.DataFrame(columns=TRADES_COLUMNS))
+            for product, book in prices.groupby("product"):
+                books.setdefault(product, []).append((len(tapes) - 1, book.reset_index(drop=True)))
+            all_mids.append(mid_prices(prices))
+        self.round = parse_name(paths[0])["round"]
+        self.products = {
+            product: ProductModel(product, [book for _, book in days], [tapes[i] for i, _ in days])
+            for product, days in books.items()
+        }
+        self.spreads = [
+            SpreadModel(name, weights, [mids for mids in all_mids if all(p in mids for p in weights)])
+            for name, weights in SPREADS.items()
+            if any(all(p in mids for p in weights) for mids in all_mids)
+        ]
+
+    def books(self, n: int, rng: np.random.Generator) -> Dict[str, Dict[str, np.ndarray]]:
+        """
+        Returns product -> book columns of n ticks.
+        """
+        # The first leg of a spread is built from the others, it never walks on its own
+        firsts = {next(iter(spread.weights)) for spread in self.spreads}
+        books = {product: model.book(model.walk(n, rng), rng)
+                 for product, model in self.products.items() if product not in firsts}
+        for spread in self.spreads:
+            first, weight = next(iter(spread.weights.items()))
+            others = sum(w * books[p]["mid_price"] for p, w in spread.weights.items() if p != first)
+            mid2 = np.round(2 * (spread.residual(n, rng) - others) / weight).astype(np.int64)
+            # Snap to the parity chain of the product so its spreads keep their distribution
+            mid2 += (mid2 - self.products[first].parities(n, rng)) % 2
+            books[first] = self.products[first].book(mid2, rng)
+        return books
+
+    def generate_day(self, day: int, rng: np.random.Generator, ticks: int = TICKS_PER_DAY):
+        """
+        Returns (prices, trades) DataFrames of one synthetic day.
+        """
+        timestamps = np.arange(ticks) * TIMESTAMP_STEP
+        books = self.books(ticks, rng)
+        products = sorted(self.products)
+
+        # The float columns are written straight into one (columns, ticks,
+        # products) block, the layout pandas keeps them in, so that raveled
+        # they are in timestamp, product order and the DataFrame wraps them
+        # without copying
+        float_columns = PRICES_COLUMNS[3:]
+        block = np.empty((len(float_columns), ticks, len(products)))
+        block[float_columns.index("profit_and_loss")] = 0.0
+        trade_timestamps, trade_symbols, trade_prices, trade_quantities = [], [], [], []
+        for j, product in enumerate(products):
+            for column, values in books[product].items():
+                block[float_columns.index(column), :, j] = values
+
+            index, price, quantity = self.products[product].trades(books[product]["mid_price"], rng)
+            trade_timestamps.append(timestamps[index])
+            trade_symbols.append(np.full(len(index), j))
+            trade_prices.append(price)
+            trade_quantities.append(quantity)
+
+        prices = pd.DataFrame(block.reshape(len(float_columns), -1).T, columns=float_columns, copy=False)
+        prices.insert(0, "day", np.full(len(prices), day))
+        prices.insert(1, "timestamp", np.repeat(timestamps, len(products)))
+        prices.insert(2, "product", pd.Categorical.from_codes(np.tile(np.arange(len(products)), ticks), products))
+
+        trade_timestamps = np.concatenate(trade_timestamps)
+        order = np.argsort(trade_timestamps, kind="stable")
+        count = len(order)
+        trades = pd.DataFrame({
+            "timestamp": trade_timestamps[order],
+            "buyer": pd.Categorical.from_codes(np.zeros(count, dtype=np.int8), [""]),
+            "seller": pd.Categorical.from_codes(np.zeros(count, dtype=np.int8), [""]),
+            "symbol": pd.Categorical.from_codes(np.concatenate(trade_symbols)[order], products),
+            "currency": pd.Categorical.from_codes(np.zeros(count, dtype=np.int8), ["SEASHELLS"]),
+            "price": np.concatenate(trade_prices)[order],
+            "quantity": np.concatenate(trade_quantities)[order],
+        })
+        return prices, trades
+
+    def days(self, count: int, seed: int = 0, ticks: int = TICKS_PER_DAY):
+        """
+        Yields decoded synthetic Days, ready for backtest.Backtest.
+        """
+        rng = np.random.default_rng(seed)
+        for day in range(FIRST_DAY, FIRST_DAY + count):
+            prices, trades = self.generate_day(day, rng, ticks)
+            yield decode_day(prices, trades, self.round, day)
+
+
+def write_day(prices: pd.DataFrame, trades: pd.DataFrame, directory: str, round: int, day: int):
+    os.makedirs(directory, exist_ok=True)
+    prices.to_csv(os.path.join(directory, f"prices_round_{round}_day_{day}.csv"), sep=";", index=False)
+    trades.to_csv(os.path.join(directory, f"trades_round_{round}_day_{day}.csv"), sep=";", index=False)
+
+
+def summary(prices: List[pd.DataFrame], trades: List[pd.DataFrame]) -> pd.DataFrame:
+    """
+    Returns the statistics the models are fitted on, to compare real and synthetic days.
+    """
+    rows = {}
+    for product in sorted(set(prices[0]["product"])):
+        changes, lagged, spreads, count, ticks = [], [], [], 0, 0
+        for book, tape in zip(prices, trades):
+            book = book[book["product"] == product]
+            x = np.diff(book["mid_price"].to_numpy(dtype=float))
+            changes.append(x)
+            lagged.append(x[1:] * x[:-1])
+            spreads.append((book["ask_price_1"] - book["bid_price_1"]).to_numpy(dtype=float))
+            count += int((tape["symbol"] == product).sum())
+            ticks += len(book)
+        x = np.concatenate(changes)
+        rows[product] = {
+            "mid_change_std": x.std(),
+            "lag1_autocorr": np.concatenate(lagged).mean() / (x ** 2).mean(),
+            "spread_mean": np.concatenate(spreads).mean(),
+            "trades_per_tick": count / ticks,
+        }
+    return pd.DataFrame(rows).T
+
+
+def main():
+    count = int(sys.argv[1]) if len(sys.argv) > 1 else 3
+    directory = sys.argv[2] if len(sys.argv) > 2 else None
+
+    model = MarketModel()
+    for spread in model.spreads:
+        print(f"{spread.name}: mean {spread.mean:.2f}, phi {spread.phi:.5f}, sigma {spread.sigma:.3f}")
+
+    rng = np.random.default_rng(0)
+    start = time.perf_counter()
+    generated = [model.generate_day(day, rng) for day in range(FIRST_DAY, FIRST_DAY + count)]
+    elapsed = time.perf_counter() - start
+    ticks = count * TICKS_PER_DAY
+    print(f"Generated {count} days of {TICKS_PER_DAY} ticks of {len(model.products)} products in {elapsed:.2f}s "
+          f"({ticks / elapsed:,.0f} ticks/s, {ticks * len(model.products) / elapsed:,.0f} book rows/s)")
+
+    real = [load_prices(path) for path in prices_files()]
+    real_trades = []
+    for path in prices_files():
+        info = parse_name(path)
+        trades_path = find_trades_file(info["round"], info["day"])
+        real_trades.append(load_trades(trades_path) if trades_path else pd.DataFrame(columns=TRADES_COLUMNS))
+    with pd.option_context("display.width", 200):
+        print("Real:")
+        print(summary(real, real_trades).round(4))
+        print("Synthetic:")
+        print(summary([p for p, _ in generated], [t for _, t in generated]).round(4))
+
+    if directory:
+        for day, (prices, trades) in zip(range(FIRST_DAY, FIRST_DAY + count), generated):
+            write_day(prices, trades, directory, model.round, day)
+        print(f"Written to {directory}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,303 @@
+"""
+Compact store of every book and tape of the data bottles, with random access by timestamp.
+
+Every table (the book of one product on one day, or the tape of one day) is
+a set of int32 columns cut into chunks of CHUNK_ROWS rows. Inside a chunk
+each column is delta encoded (first value, then differences), the columns
+are laid out one after the other, and the chunk is optionally compressed
+with zlib on its own. Successive book snapshots differ by a few ticks, so
+the deltas are mostly tiny and compress far better than the csv.
+
+    books   timestamp, bid/ask price and volume of 3 levels, 2 * mid_price,
+            with 0 for a missing level or mid
+    tapes   timestamp, symbol, buyer and seller (codes into the name table
+            of the store, "" being 0), price and quantity
+
+The file is the chunks back to back followed by a JSON index (tables,
+columns, names and for every chunk its offset, size, rows and first and last
+timestamp) and the 8 byte offset of that index. A timestamp range read
+finds its chunks by binary search on the index, reads only those through a
+memory map and decodes each one with a zlib inflate and a cumsum.
+
+The round 2 ORCHIDS observations are floats and stay in their csv files.
+
+Usage:
+    python tools/tick_store.py build [store file] [--raw] [--chunk 4096]
+    python tools/tick_store.py check [store file]    # compare with the csv loaders and time decoding
+"""
+import argparse
+import json
+import os
+import struct
+import time
+import zlib
+from typing import Dict, List
+
+import numpy as np
+import pandas as pd
+
+from data import ROOT, load_prices, load_trades, parse_name, prices_files, trades_files
+
+DEFAULT_PATH = os.path.join(ROOT, ".cache", "ticks.store")
+CHUNK_ROWS = 4096
+LEVEL = 6
+
+BOOK_COLUMNS = ["timestamp"]
+for _side in ("bid", "ask"):
+    for _level in (1, 2, 3):
+        BOOK_COLUMNS += [f"{_side}_price_{_level}", f"{_side}_volume_{_level}"]
+BOOK_COLUMNS += ["mid_price_x2"]
+
+TAPE_COLUMNS = ["timestamp", "symbol", "buyer", "seller", "price", "quantity"]
+NAME_COLUMNS = ["symbol", "buyer", "seller"]
+
+FOOTER = struct.Struct("<Q")
+
+
+def book_key(round: int, day: int, product: str) -> str:
+    return f"book/{round}/{day}/{product}"
+
+
+def tape_key(round: int, day: int, named: bool) -> str:
+    return f"tape/{round}/{day}/{'wn' if named else 'nn'}"
+
+
+def encode_chunk(columns: np.ndarray, compress: bool) -> bytes:
+    """
+    Returns the bytes of a (columns, rows) int32 block, delta encoded along rows.
+    """
+    deltas = np.diff(columns, axis=1, prepend=0).astype(np.int32)
+    data = deltas.tobytes()
+    return zlib.compress(data, LEVEL) if compress else data
+
+
+def decode_chunk(data, columns: int, rows: int, compressed: bool) -> np.ndarray:
+    """
+    Returns the (columns, rows) int32 block of encode_chunk.
+    """
+    if compressed:
+        data = zlib.decompress(data)
+    deltas = np.frombuffer(data, dtype=np.int32).reshape(columns, rows)
+    return np.cumsum(deltas, axis=1, dtype=np.int32)
+
+
+def as_int32(values, name: str) -> np.ndarray:
+    """
+    Returns values as int32, 0 for NaN, refusing anything that would not round trip.
+    """
+    values = np.nan_to_num(np.asarray(values, dtype=float), nan=0.0)
+    if np.any(values != np.round(values)) or np.any(np.abs(values) >= 2**31):
+        raise ValueError(f"Column {name} does not fit int32")
+    return values.astype(np.int32)
+
+
+class StoreWriter:
+
+    def __init__(self, path: str, chunk_rows: int = CHUNK_ROWS, compress: bool = True) -> None:
+        self.path = path
+        self.chunk_rows = chunk_rows
+        self.compress = compress
+        self.tables = {}
+        self.names = [""]
+        self.codes = {"": 0}
+        os.makedirs(os.path.dirname(os.path.abspath(path)), exist_ok=True)
+        self.file = open(path + ".tmp", "wb")
+
+    def code(self, names) -> np.ndarray:
+        """
+        Returns the codes of names in the name table, adding the new ones.
+        """
+        codes = np.empty(len(names), dtype=np.int32)
+        for i, name in enumerate(names):
+            code = self.codes.get(name)
+            if code is None:
+                code = self.codes[name] = len(self.names)
+                self.names.append(name)
+            codes[i] = code
+        return codes
+
+    def add(self, key: str, columns: List[str], values: np.ndarray):
+        """
+        Writes a table of (columns, rows) int32 values sorted by the first column (timestamp).
+        """
+        chunks = []
+        for start in range(0, values.shape[1], self.chunk_rows):
+            block = np.ascontiguousarray(values[:, start:start + self.chunk_rows])
+            data = encode_chunk(block, self.compress)
+            chunks.append([self.file.tell(), len(data), block.shape[1], int(block[0, 0]), int(block[0, -1])])
+            self.file.write(data)
+        self.tables[key] = {"columns": columns, "rows": int(values.shape[1]), "compressed": self.compress, "chunks": chunks}
+
+    def add_book(self, prices: pd.DataFrame, round: int, day: int):
+        for product, book in prices.groupby("product", sort=True):
+            book = book.sort_values("timestamp", kind="stable")
+            values = np.stack([as_int32(book[column], column) for column in BOOK_COLUMNS[:-1]]
+                              + [as_int32(book["mid_price"] * 2, "mid_price_x2")])
+            self.add(book_key(round, day, product), BOOK_COLUMNS, values)
+
+    def add_tape(self, trades: pd.DataFrame, round: int, day: int, named: bool):
+        values = np.stack([
+            as_int32(trades["timestamp"], "timestamp"),
+            self.code(trades["symbol"].tolist()),
+            self.code(trades["buyer"].tolist()),
+            self.code(trades["seller"].tolist()),
+            as_int32(trades["price"], "price"),
+            as_int32(trades["quantity"], "quantity"),
+        ])
+        self.add(tape_key(round, day, named), TAPE_COLUMNS, values)
+
+    def close(self):
+        index = json.dumps({"tables": self.tables, "names": self.names}).encode()
+        offset = self.file.tell()
+        self.file.write(index)
+        self.file.write(FOOTER.pack(offset))
+        self.file.close()
+        os.replace(self.path + ".tmp", self.path)
+
+
+def build(path: str = DEFAULT_PATH, chunk_rows: int = CHUNK_ROWS, compress: bool = True) -> str:
+    """
+    Writes the store of every prices and trades bottle and returns its path.
+    """
+    writer = StoreWriter(path, chunk_rows, compress)
+    for prices_path in prices_files():
+        info = parse_name(prices_path)
+        writer.add_book(load_prices(prices_path), info["round"], info["day"])
+    for trades_path in trades_files():
+        info = parse_name(trades_path)
+        writer.add_tape(load_trades(trades_path), info["round"], info["day"], info["named"])
+    writer.close()
+    return path
+
+
+class TickStore:
+    """
+    Read side of a store file, memory-mapped.
+    """
+
+    def __init__(self, path: str = DEFAULT_PATH) -> None:
+        self.path = path
+        self.data = np.memmap(path, dtype=np.uint8, mode="r")
+        (offset,) = FOOTER.unpack(self.data[-FOOTER.size:].tobytes())
+        index = json.loads(self.data[offset:-FOOTER.size].tobytes())
+        self.tables = index["tables"]
+        self.names = np.array(index["names"], dtype=object)
+        # Per table: chunk offsets, sizes, rows and first / last timestamps as arrays
+        self.chunks = {key: np.array(table["chunks"], dtype=np.int64).reshape(-1, 5) for key, table in self.tables.items()}
+
+    def keys(self, prefix: str = "") -> List[str]:
+        return [key for key in self.tables if key.startswith(prefix)]
+
+    def read(self, key: str, start: int = None, end: int = None) -> Dict[str, np.ndarray]:
+        """
+        Returns column -> int32 array of the rows of a table with start <= timestamp <= end.
+        """
+        table = self.tables[key]
+        chunks = self.chunks[key]
+        first = 0 if start is None else int(np.searchsorted(chunks[:, 4], start, side="left"))
+        last = len(chunks) if end is None else int(np.searchsorted(chunks[:, 3], end, side="right"))
+        blocks = [decode_chunk(self.data[offset:offset + size], len(table["columns"]), rows, table["compressed"])
+                  for offset, size, rows, _, _ in chunks[first:last]]
+        values = np.concatenate(blocks, axis=1) if blocks else np.empty((len(table["columns"]), 0), dtype=np.int32)
+
+        timestamps = values[0]
+        lo = 0 if start is None else int(np.searchsorted(timestamps, start, side="left"))
+        hi = len(timestamps) if end is None else int(np.searchsorted(timestamps, end, side="right"))
+        return dict(zip(table["columns"], values[:, lo:hi]))
+
+    def book(self, round: int, day: int, product: str, start: int = None, end: int = None) -> Dict[str, np.ndarray]:
+        return self.read(book_key(round, day, product), start, end)
+
+    def tape(self, round: int, day: int, named: bool = False, start: int = None, end: int = None) -> Dict[str, np.ndarray]:
+        return self.read(tape_key(round, day, named), start, end)
+
+    def prices_frame(self, round: int, day: int, start: int = None, end: int = None) -> pd.DataFrame:
+        """
+        Returns the books of a day as data.load_prices does.
+        """
+        frames = []
+        for key in self.keys(f"book/{round}/{day}/"):
+            columns = self.read(key, start, end)
+            frame = pd.DataFrame({"day": day, "timestamp": columns["timestamp"].astype(np.int64),
+                                  "product": key.rsplit("/", 1)[1]})
+            for column in BOOK_COLUMNS[1:-1]:
+                values = columns[column].astype(float)
+                values[values == 0] = np.nan
+                frame[column] = values
+            mid = columns["mid_price_x2"] / 2.0
+            mid[mid == 0] = np.nan
+            frame["mid_price"] = mid
+            frames.append(frame)
+        frame = pd.concat(frames)
+        return frame.sort_values(["timestamp", "product"], kind="stable").reset_index(drop=True)
+
+    def trades_frame(self, round: int, day: int, named: bool = False, start: int = None, end: int = None) -> pd.DataFrame:
+        """
+        Returns a tape with the columns the Backtest and research scripts use.
+        """
+        columns = self.tape(round, day, named, start, end)
+        frame = pd.DataFrame({"timestamp": columns["timestamp"].astype(np.int64)})
+        for column in NAME_COLUMNS:
+            frame[column] = self.names[columns[column]]
+        frame["price"] = columns["price"].astype(float)
+        frame["quantity"] = columns["quantity"].astype(np.int64)
+        frame["day"] = day
+        frame["round"] = round
+        return frame
+
+
+def check(path: str):
+    """
+    Compares every table with the csv loaders and prints decoding speeds.
+    """
+    store = TickStore(path)
+    for prices_path in prices_files():
+        info = parse_name(prices_path)
+        expected = load_prices(prices_path)
+        actual = store.prices_frame(info["round"], info["day"])
+        pd.testing.assert_frame_equal(actual, expected, check_dtype=False)
+    for trades_path in trades_files():
+        info = parse_name(trades_path)
+        expected = load_trades(trades_path)
+        actual = store.trades_frame(info["round"], info["day"], info["named"])
+        columns = ["timestamp", "symbol", "buyer", "seller", "price", "quantity"]
+        pd.testing.assert_frame_equal(actual[columns], expected[columns], check_dtype=False)
+    print("Every table matches the csv files")
+
+    start = time.perf_counter()
+    decoded = sum(column.nbytes for key in store.tables for column in store.read(key).values())
+    elapsed = time.perf_counter() - start
+    print(f"Full decode: {decoded / 2**20:.1f}MB in {elapsed * 1e3:.1f}ms ({decoded / 2**20 / elapsed:.0f}MB/s)")
+
+    keys = store.keys("book/")
+    rng = np.random.default_rng(0)
+    start = time.perf_counter()
+    rows = 0
+    for _ in range(1000):
+        first = int(rng.integers(0, 9_000)) * 100
+        rows += len(store.read(keys[rng.integers(len(keys))], first, first + 100_000)["timestamp"])
+    elapsed = time.perf_counter() - start
+    print(f"Random 1000-tick range reads: {elapsed:.3f}ms each, {rows / 1000:.0f} rows")
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[1])
+    parser.add_argument("command", choices=["build", "check"])
+    parser.add_argument("path", nargs="?", default=DEFAULT_PATH)
+    parser.add_argument("--raw", action="store_true", help="delta encode without zlib")
+    parser.add_argument("--chunk", type=int, default=CHUNK_ROWS, help="rows per chunk")
+    args = parser.parse_args()
+
+    if args.command == "build":
+        start = time.perf_counter()
+        build(args.path, args.chunk, not args.raw)
+        sources = sum(os.path.getsize(path) for path in prices_files() + trades_files())
+        size = os.path.getsize(args.path)
+        print(f"Wrote {args.path}: {size / 2**20:.2f}MB for {sources / 2**20:.2f}MB of csv "
+              f"({sources / size:.1f}x) in {time.perf_counter() - start:.1f}s")
+    else:
+        check(args.path)
+
+
+if __name__ == "__main__":
+    main()
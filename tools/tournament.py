@@ -0,0 +1,85 @@
+"""
+Side-by-side tournament of every Trader version.
+
+All Trader files are imported under their own module name (each with the
+datamodel of its round folder), the data bottles are decoded once and every
+version is replayed against the same days. Prints a per-product PnL
+leaderboard summed over the days, and run() latency statistics.
+
+Usage: python tools/tournament.py [--ticks N] [--days N] [trader files...]
+"""
+import argparse
+import glob
+import os
+
+import numpy as np
+import pandas as pd
+
+from backtest import Backtest, load_day, load_module, silenced
+from data import ROOT, prices_files
+
+
+def trader_files() -> list:
+    """
+    Returns every file of the round folders defining a Trader.
+    """
+    files = []
+    for path in sorted(glob.glob(os.path.join(ROOT, "Round *", "*.py"))):
+        with open(path) as file:
+            if "class Trader" in file.read():
+                files.append(path)
+    return files
+
+
+def tournament(paths, days, max_ticks=None) -> pd.DataFrame:
+    rows = []
+    for path in paths:
+        try:
+            with silenced():
+                module = load_module(path)
+        except Exception as e:
+            print(f"Skipping {path}: {e!r}")
+            continue
+
+        pnl = {}
+        latencies = []
+        errors = 0
+        for day in days:
+            with silenced():
+                trader = module.Trader()
+            result = Backtest(trader, day).run(max_ticks)
+            for product, value in result.final_pnl.items():
+                pnl[product] = pnl.get(product, 0.0) + value
+            latencies += result.latencies
+            errors += result.errors
+
+        latencies = np.array(latencies) * 1e3
+        row = {"trader": module.__name__}
+        row.update(pnl)
+        row["TOTAL"] = sum(pnl.values())
+        row["mean_ms"] = latencies.mean()
+        row["p50_ms"] = np.percentile(latencies, 50)
+        row["p99_ms"] = np.percentile(latencies, 99)
+        row["max_ms"] = latencies.max()
+        row["errors"] = errors
+        rows.append(row)
+
+    return pd.DataFrame(rows).set_index("trader").sort_values("TOTAL", ascending=False)
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[1])
+    parser.add_argument("files", nargs="*", help="Trader files, every version by default")
+    parser.add_argument("--ticks", type=int, default=None, help="ticks replayed per day")
+    parser.add_argument("--days", type=int, default=None, help="number of days replayed")
+    args = parser.parse_args()
+
+    days = [load_day(path) for path in prices_files()[:args.days]]
+    print(f"Replaying {', '.join(map(str, days))}")
+    leaderboard = tournament(args.files or trader_files(), days, args.ticks)
+    with pd.option_context("display.width", 250, "display.max_columns", None):
+        print(leaderboard.round(2))
+
+
+if __name__ == "__main__":
+    main()